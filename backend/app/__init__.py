@@ -1,22 +1,16 @@
 from flask import Flask
-from flask_cors import CORS
-from flask_migrate import Migrate
 from app.config import Config
 from app.extensions import db, bcrypt
-from minio import Minio
 import os
 
-minio_client = Minio(
-    os.getenv("MINIO_ENDPOINT", "minio:9000"),
-    access_key=os.getenv("MINIO_ROOT_USER", "minioadmin"),
-    secret_key=os.getenv("MINIO_ROOT_PASSWORD", "minioadmin"),
-    secure=False
-)
-BUCKET_NAME = "marketing-images"
-
-migrate = Migrate()
+# ⚠️ crawler（core.db）匯入 app.config / app.models 時會先執行這個檔案：
+# 這裡只保留輕量的匯入；CORS、Migrate、儲存空間（MinIO client）等只有 API 服務需要，放到 create_app 內
 
 def create_app():
+    from flask_cors import CORS
+    from flask_migrate import Migrate
+    from app.storage import ensure_buckets
+
     app = Flask(__name__)
     app.config.from_object(Config)
 
@@ -29,18 +23,13 @@ def create_app():
     # 初始化擴展
     db.init_app(app)
     bcrypt.init_app(app)
-    migrate.init_app(app, db)
+    Migrate(app, db)
 
-    @app.before_request
-    def ensure_minio_is_ready():
-        if not hasattr(app, 'minio_checked'):
-            try:
-                if not minio_client.bucket_exists(BUCKET_NAME):
-                    minio_client.make_bucket(BUCKET_NAME)
-                app.minio_checked = True
-                print("Successfully connected to MinIO and verified bucket.")
-            except Exception as e:
-                print(f"MinIO initialization failed: {e}")
+    # 啟動時檢查一次儲存空間（不再於每個請求前檢查）
+    try:
+        ensure_buckets()
+    except Exception as e:
+        print(f"⚠️ 儲存空間初始化失敗，將於第一次使用時重試: {e}")
 
     # 註冊路由
     from app.routes import register_routes
@@ -58,6 +47,43 @@ def create_app():
         db.create_all()
         print("✅ 所有資料表已建立完成")
 
+        # create_all 不會替既有資料表加欄位，新欄位以 IF NOT EXISTS 補上
+        try:
+            db.session.execute(text(
+                "ALTER TABLE marketing_content ADD COLUMN IF NOT EXISTS external_post_ids JSON"
+            ))
+            db.session.execute(text(
+                "ALTER TABLE marketing_content ADD COLUMN IF NOT EXISTS engagement_synced_at TIMESTAMP"
+            ))
+            db.session.execute(text(
+                "ALTER TABLE ingredient ADD COLUMN IF NOT EXISTS seasonal_index JSON"
+            ))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ 資料表欄位更新提示: {e}")
+
+        # price_history 的 (ingredient_id, recorded_at) 唯一索引：先刪除重複資料（保留最早寫入的一筆）
+        try:
+            db.session.execute(text("""
+                DELETE FROM price_history a
+                USING price_history b
+                WHERE a.ingredient_id = b.ingredient_id
+                  AND a.recorded_at = b.recorded_at
+                  AND a.id > b.id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM pg_indexes WHERE indexname = 'uix_price_history_ingredient_recorded'
+                  )
+            """))
+            db.session.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uix_price_history_ingredient_recorded
+                ON price_history (ingredient_id, recorded_at)
+            """))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ 價格資料唯一索引建立提示: {e}")
+
         # --- 1. 初始化節慶資料 ---
         try:
             # 寫入 2026 年節慶資料
@@ -153,7 +179,9 @@ def create_app():
                     -- ⚠️ 這裡改用 CAST 語法，解決 SQLAlchemy 解析報錯
                     VALUES (:name, CAST(:matrix AS JSON)) 
                     ON CONFLICT (name) 
-                    DO UPDATE SET monthly_status_matrix = EXCLUDED.monthly_status_matrix;
+                    DO UPDATE SET monthly_status_matrix = EXCLUDED.monthly_status_matrix
+                    -- 已由實際價格重新計算的矩陣 (price_analytics) 不覆蓋
+                    WHERE ingredient.seasonal_index IS NULL;
                 """), {"name": name, "matrix": matrix})
             
             # 重置 ID 流水號
@@ -281,4 +309,15 @@ def create_app():
             db.session.rollback()
             print(f"⚠️ 初始化檢查過程發生錯誤: {e}")
 
+    # ==========================================
+    # 背景服務（僅 API 服務開啟；crawler 也會呼叫 create_app，不應啟動）
+    # ==========================================
+    if os.getenv("ENABLE_BACKGROUND_JOBS", "false").lower() == "true":
+        from app.publish_scheduler import publish_scheduler
+        from app.publish_outbox import outbox_dispatcher
+        from app.engagement_sync import engagement_syncer
+        publish_scheduler.start(app)
+        outbox_dispatcher.start(app)
+        engagement_syncer.start(app)
+
     return app
\ No newline at end of file
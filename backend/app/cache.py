@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ============================================================
+# 行程內共用的 TTL + LRU 快取（thread-safe）
+# ============================================================
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    具 TTL 與 LRU 淘汰的簡易快取。
+    Flask 的 request thread 與背景 thread 會同時存取，所以所有操作都加鎖。
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -15,5 +15,8 @@ class Config:
     # 關閉 SQLAlchemy 的追蹤修改功能，以節省記憶體並提升效能
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # 單次請求上限（multipart 上傳圖片），超過時 Flask 直接回 413
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_UPLOAD_MB', 20)) * 1024 * 1024
+
     # 預留空間：之後若有 OpenAI 或 Flux 的 API Key 也可以加在這裡
     # OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
\ No newline at end of file
@@ -0,0 +1,178 @@
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.extensions import db
+from app.graph_client import GraphAPIError, graph_client
+from app.platform_credentials import resolve_credentials
+
+# ============================================================
+# 互動數同步：依貼文年齡決定刷新頻率，Graph batch 取數，一次 UPDATE ... FROM (VALUES ...) 寫回
+# ============================================================
+ENGAGEMENT_SYNC_INTERVAL = float(os.getenv("ENGAGEMENT_SYNC_INTERVAL", 300))
+ENGAGEMENT_SYNC_LIMIT = int(os.getenv("ENGAGEMENT_SYNC_LIMIT", 2000))
+
+# (貼文年齡上限, 刷新間隔)：越新的貼文互動變化越快，越常刷新；超過 90 天不再同步
+REFRESH_TIERS = [
+    ("1 day", "15 minutes"),
+    ("7 days", "1 hour"),
+    ("30 days", "6 hours"),
+    ("90 days", "1 day"),
+]
+
+FB_FIELDS = "reactions.summary(total_count).limit(0)"
+IG_FIELDS = "like_count"
+
+
+def _due_condition():
+    tiers = "\n".join(
+        f"WHEN m.created_at > now() - interval '{age}' THEN interval '{every}'" for age, every in REFRESH_TIERS
+    )
+    return f"""
+        m.engagement_synced_at IS NULL
+        OR m.engagement_synced_at < now() - CASE
+            {tiers}
+        END
+    """
+
+
+def claim_due_posts(limit=ENGAGEMENT_SYNC_LIMIT):
+    """
+    認領到期的貼文並先寫入同步時間（FOR UPDATE SKIP LOCKED），多個 worker 不會重複取數；
+    取數失敗的貼文就等下一個刷新週期。回傳 [{"id", "tenant_id", "external_post_ids"}]，最久沒同步的優先。
+    """
+    # 認領放在 CTE（只執行一次）；寫成 m.id IN (子查詢) 時 nested loop 可能逐列重跑子查詢而超過 LIMIT
+    rows = db.session.execute(text(f"""
+        WITH due AS (
+            SELECT m.id FROM marketing_content m
+            WHERE m.external_post_ids IS NOT NULL
+              AND m.created_at > now() - interval '{REFRESH_TIERS[-1][0]}'
+              AND ({_due_condition()})
+            ORDER BY m.engagement_synced_at NULLS FIRST
+            LIMIT :limit
+            FOR UPDATE OF m SKIP LOCKED
+        )
+        UPDATE marketing_content AS m
+        SET engagement_synced_at = :now
+        FROM due, store s
+        WHERE m.id = due.id AND s.id = m.store_id
+        RETURNING m.id, s.tenant_id, m.external_post_ids
+    """), {"now": datetime.utcnow(), "limit": limit}).mappings().all()
+    db.session.commit()
+    return [dict(r) for r in rows]
+
+
+def build_requests(posts, credentials_for):
+    """
+    依 access token 分組建立 batch 子請求（同一個 batch 只能使用一個 token）。
+    回傳 {token: [(content_id, platform, sub_request)]}
+    """
+    groups = defaultdict(list)
+    for post in posts:
+        credentials = credentials_for(post['tenant_id'])
+        ids = post['external_post_ids'] or {}
+        if ids.get('fb') and credentials.get('fb_access_token'):
+            groups[credentials['fb_access_token']].append((post['id'], 'fb', {
+                "method": "GET", "relative_url": f"{ids['fb']}?fields={FB_FIELDS}",
+            }))
+        if ids.get('ig') and credentials.get('ig_access_token'):
+            groups[credentials['ig_access_token']].append((post['id'], 'ig', {
+                "method": "GET", "relative_url": f"{ids['ig']}?fields={IG_FIELDS}",
+            }))
+    return groups
+
+
+def parse_count(platform, body):
+    if platform == 'fb':
+        return ((body.get('reactions') or {}).get('summary') or {}).get('total_count')
+    return body.get('like_count')
+
+
+def fetch_engagement(groups, graph=None):
+    """
+    以 Graph batch（每次最多 50 個子請求）取回互動數，FB 心情數與 IG 按讚數加總。
+    任一平台取數失敗的貼文不列入結果，保留原本的 like。回傳 {content_id: likes}
+    """
+    graph = graph or graph_client
+    totals = defaultdict(int)
+    failed = set()
+    for token, items in groups.items():
+        try:
+            responses = graph.batch([sub for _, _, sub in items], token)
+        except GraphAPIError as e:
+            print(f"⚠️ [Engagement] batch 失敗: {e}", flush=True)
+            failed.update(content_id for content_id, _, _ in items)
+            continue
+        for (content_id, platform, _), res in zip(items, responses):
+            count = None if isinstance(res, GraphAPIError) else parse_count(platform, res)
+            if count is None:
+                failed.add(content_id)
+            else:
+                totals[content_id] += int(count)
+    return {content_id: likes for content_id, likes in totals.items() if content_id not in failed}
+
+
+def write_back(totals):
+    """單一 UPDATE ... FROM (VALUES ...) 寫回所有貼文的 like"""
+    if not totals:
+        return 0
+    params = {}
+    values = []
+    for i, (content_id, likes) in enumerate(totals.items()):
+        params[f"id{i}"] = content_id
+        params[f"likes{i}"] = likes
+        values.append(f"(CAST(:id{i} AS INTEGER), CAST(:likes{i} AS INTEGER))")
+    result = db.session.execute(text(f"""
+        UPDATE marketing_content AS m
+        SET "like" = v.likes
+        FROM (VALUES {", ".join(values)}) AS v(id, likes)
+        WHERE m.id = v.id AND m."like" IS DISTINCT FROM v.likes
+    """), params)
+    db.session.commit()
+    return result.rowcount
+
+
+def sync_engagement(graph=None, limit=ENGAGEMENT_SYNC_LIMIT):
+    """需在 app context 內呼叫，回傳 like 有變動的筆數"""
+    posts = claim_due_posts(limit)
+    if not posts:
+        return 0
+    groups = build_requests(posts, resolve_credentials)
+    updated = write_back(fetch_engagement(groups, graph))
+    n_requests = sum(len(items) for items in groups.values())
+    print(f"❤️ [Engagement] {len(posts)} 則貼文、{n_requests} 個子請求，已更新 {updated} 筆", flush=True)
+    return updated
+
+
+class EngagementSyncer:
+    def __init__(self, interval=ENGAGEMENT_SYNC_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _loop(self, app):
+        print(f"❤️ [Engagement] 互動數同步啟動（每 {self.interval:.0f}s）", flush=True)
+        while not self._stop.is_set():
+            with app.app_context():
+                try:
+                    sync_engagement()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"❌ [Engagement] 同步失敗: {e}", flush=True)
+            self._stop.wait(self.interval)
+
+    def start(self, app):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(app,), name="engagement-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+engagement_syncer = EngagementSyncer()
@@ -0,0 +1,184 @@
+import json
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ============================================================
+# 共用 Graph API 客戶端：連線池 + 逾時 + 抖動重試 + 批次請求
+# ============================================================
+GRAPH_URL = os.getenv("IG_GRAPH_URL", "https://graph.facebook.com/v25.0")
+
+# (connect, read) 秒數；避免 Meta 端點卡住時整條 thread 被綁死
+GRAPH_CONNECT_TIMEOUT = float(os.getenv("GRAPH_CONNECT_TIMEOUT", 3.05))
+GRAPH_READ_TIMEOUT = float(os.getenv("GRAPH_READ_TIMEOUT", 20))
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES", 3))
+GRAPH_BACKOFF_BASE = 0.5
+GRAPH_BACKOFF_MAX = 8.0
+GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", 16))
+
+# Graph 單次 batch 最多 50 個子請求
+GRAPH_BATCH_LIMIT = 50
+
+# 速率限制 / 暫時性錯誤代碼
+# 1/2: 暫時性錯誤, 4: App 呼叫上限, 17: 使用者呼叫上限, 32: 粉專呼叫上限,
+# 341: 應用程式上限, 613: 速率限制, 80001~80014: 商業用途 (BUC) 速率限制
+RETRYABLE_ERROR_CODES = {1, 2, 4, 17, 32, 341, 613} | set(range(80001, 80015))
+
+
+def retry_after_seconds(value):
+    """Retry-After 可能是秒數或 HTTP 日期（RFC 9110）；無法解析時回傳 None，由呼叫端改用抖動退避"""
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class GraphAPIError(Exception):
+    """
+    transient：請求未送達 Meta（連線失敗）或 GET 逾時，重送不會造成重複動作；
+    unknown：POST 讀取逾時，Meta 端可能已生效，結果未知，不可自動重送。
+    """
+
+    def __init__(self, message, status=None, code=None, subcode=None, payload=None, transient=False, unknown=False):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.subcode = subcode
+        self.payload = payload
+        self.transient = transient
+        self.unknown = unknown
+
+    @property
+    def retryable(self):
+        if self.unknown:
+            return False
+        return self.transient or (self.status is not None and self.status >= 500) or self.status == 429 \
+            or self.code in RETRYABLE_ERROR_CODES
+
+    @classmethod
+    def from_payload(cls, status, payload):
+        error = payload.get("error", {}) if isinstance(payload, dict) else {}
+        return cls(
+            error.get("message") or f"Graph API HTTP {status}",
+            status=status,
+            code=error.get("code"),
+            subcode=error.get("error_subcode"),
+            payload=payload,
+        )
+
+
+class GraphClient:
+    """
+    整個行程共用一個 keep-alive Session，省去每次呼叫的 TLS 握手。
+    base_url / session / sleep 可注入，方便指向本地假 Graph API。
+    """
+
+    def __init__(self, base_url=None, session=None, timeout=None, max_retries=GRAPH_MAX_RETRIES, sleep=time.sleep):
+        self.base_url = (base_url or GRAPH_URL).rstrip("/")
+        self.timeout = timeout or (GRAPH_CONNECT_TIMEOUT, GRAPH_READ_TIMEOUT)
+        self.max_retries = max_retries
+        self._sleep = sleep
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=GRAPH_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+
+    def _url(self, path):
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = retry_after_seconds(retry_after) if retry_after else None
+        if delay is not None:
+            return min(delay, GRAPH_BACKOFF_MAX)
+        # full jitter：0 ~ base * 2^attempt
+        return random.uniform(0, min(GRAPH_BACKOFF_BASE * (2 ** attempt), GRAPH_BACKOFF_MAX))
+
+    def request(self, method, path, params=None, data=None):
+        """發出請求並回傳 JSON；錯誤時拋出 GraphAPIError（可重試的錯誤會自動重試）"""
+        url = self._url(path)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                resp = self.session.request(method, url, params=params, data=data, timeout=self.timeout)
+            except requests.exceptions.ConnectionError as e:
+                # 連線建立失敗：請求未送達，POST 也可以安全重試
+                last_error = GraphAPIError(f"連線失敗: {e}", transient=True)
+                retry_after = None
+            except requests.exceptions.Timeout as e:
+                # 讀取逾時：POST 可能已在 Meta 端生效，為避免重複發文只重試 GET
+                if method.upper() != "GET":
+                    raise GraphAPIError(f"請求逾時，結果未知: {e}", unknown=True)
+                last_error = GraphAPIError(f"請求逾時: {e}", transient=True)
+                retry_after = None
+            else:
+                try:
+                    payload = resp.json()
+                except ValueError:
+                    payload = {"error": {"message": resp.text[:200]}}
+                if resp.status_code < 400 and not (isinstance(payload, dict) and "error" in payload):
+                    return payload
+                last_error = GraphAPIError.from_payload(resp.status_code, payload)
+                if not last_error.retryable:
+                    raise last_error
+                retry_after = resp.headers.get("Retry-After")
+
+            if attempt < self.max_retries:
+                wait = self._backoff(attempt, retry_after)
+                print(f"   🔁 [Graph] {method} {path} 失敗（{last_error}），{wait:.1f}s 後重試", flush=True)
+                self._sleep(wait)
+        raise last_error
+
+    def get(self, path, params=None):
+        return self.request("GET", path, params=params)
+
+    def post(self, path, data=None):
+        return self.request("POST", path, data=data)
+
+    def batch(self, sub_requests, access_token):
+        """
+        以 Graph batch API (/?batch=) 合併多個請求，每 50 個一組。
+        sub_requests: [{"method": "GET", "relative_url": "123?fields=likes"}]
+        回傳與輸入等長的清單，元素為 dict（成功）或 GraphAPIError（失敗）。
+        """
+        results = []
+        for i in range(0, len(sub_requests), GRAPH_BATCH_LIMIT):
+            chunk = sub_requests[i:i + GRAPH_BATCH_LIMIT]
+            responses = self.post("", data={
+                "batch": json.dumps(chunk),
+                "include_headers": "false",
+                "access_token": access_token,
+            })
+            for sub in responses:
+                if sub is None:
+                    # 單一子請求逾時時 Graph 會回傳 null
+                    results.append(GraphAPIError("batch 子請求未完成", status=None))
+                    continue
+                try:
+                    body = json.loads(sub.get("body") or "{}")
+                except ValueError:
+                    body = {}
+                code = sub.get("code", 200)
+                if code >= 400 or (isinstance(body, dict) and "error" in body):
+                    results.append(GraphAPIError.from_payload(code, body))
+                else:
+                    results.append(body)
+        return results
+
+
+graph_client = GraphClient()
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import threading
+from functools import wraps
+
+from flask import jsonify, make_response, request
+
+from app.cache import TTLCache
+
+# ============================================================
+# Idempotency-Key：同一個 key 的重送請求直接回傳第一次的結果（同一個 task_id），不重複產生工作
+# ============================================================
+# 與 generation task 的保留時間相近；過期後同一個 key 視為新請求
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 300))
+IDEMPOTENCY_MAXSIZE = int(os.getenv("IDEMPOTENCY_MAXSIZE", 4096))
+# 第一個請求仍在處理中時，重送的請求最多等待的秒數
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 30))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+# 第一次請求仍在處理中的 409 帶此 code：前端只對這種 409 自動重送（其他 409 如平台未連結不可重送）
+IN_FLIGHT_CODE = "idempotency_in_flight"
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "response")
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.response = None  # (body bytes, status, mimetype)
+
+
+class IdempotencyStore:
+    """
+    行程內的 key → 請求結果（與 generation_tasks 相同，每個 gunicorn worker 各自一份）。
+    begin() 以單一鎖完成「查詢 + 佔用」，同時到達的重送請求只會有一個真正執行。
+    """
+
+    def __init__(self, maxsize=IDEMPOTENCY_MAXSIZE, ttl=IDEMPOTENCY_TTL):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def begin(self, scope, fingerprint):
+        """回傳 (entry, is_owner)；is_owner 為 True 時由呼叫端執行請求並呼叫 complete / abandon"""
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is not None:
+                return entry, False
+            entry = _Entry(fingerprint)
+            self._entries.set(scope, entry)
+            return entry, True
+
+    def complete(self, entry, response):
+        entry.response = response
+        entry.done.set()
+
+    def abandon(self, scope, entry):
+        """請求失敗（例外 / 5xx）：釋放 key，讓用戶端可以用同一個 key 重試"""
+        with self._lock:
+            if self._entries.get(scope) is entry:
+                self._entries.pop(scope)
+        entry.done.set()
+
+
+idempotency_store = IdempotencyStore()
+
+
+def request_fingerprint():
+    """方法 + 路徑 + 請求內容的 sha256；上傳檔案以串流計算雜湊後倒回開頭，不整份讀進記憶體"""
+    h = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    if request.files or request.form:
+        form = sorted((k, v) for k in request.form for v in request.form.getlist(k))
+        h.update(json.dumps(form, ensure_ascii=False).encode())
+        for name in sorted(request.files):
+            for f in request.files.getlist(name):
+                h.update(f"\n{name}:{f.filename}:".encode())
+                for chunk in iter(lambda: f.stream.read(_CHUNK_SIZE), b""):
+                    h.update(chunk)
+                f.stream.seek(0)
+    else:
+        body = request.get_json(silent=True)
+        if body is not None:
+            h.update(json.dumps(body, sort_keys=True, ensure_ascii=False).encode())
+        else:
+            h.update(request.get_data())
+    return h.hexdigest()
+
+
+def _scope(key):
+    # 以登入 cookie 區分使用者，避免不同使用者剛好用到相同的 key
+    token = request.cookies.get('access_token') or ""
+    return request.path, hashlib.sha256(token.encode()).hexdigest(), key
+
+
+def _replay(entry):
+    body, status, mimetype = entry.response
+    resp = make_response(body, status)
+    resp.mimetype = mimetype
+    resp.headers[REPLAYED_HEADER] = "true"
+    return resp
+
+
+def idempotent(view):
+    """
+    放在 @app.route 之下。請求未帶 Idempotency-Key 時行為不變；
+    帶 key 時：相同內容的重送回傳第一次的回應，不同內容重用同一個 key 回 422，
+    第一次的請求仍在處理中則等待其結果。4xx 回應也會被記住（重送只會得到相同的錯誤）。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify({"status": "error", "message": "Idempotency-Key 過長"}), 400
+
+        scope = _scope(key)
+        fingerprint = request_fingerprint()
+        entry, is_owner = idempotency_store.begin(scope, fingerprint)
+
+        if not is_owner:
+            if entry.fingerprint != fingerprint:
+                return jsonify({"status": "error", "message": "此 Idempotency-Key 已用於內容不同的請求"}), 422
+            if not entry.done.wait(IDEMPOTENCY_WAIT_SECONDS) or entry.response is None:
+                return jsonify({
+                    "status": "error", "code": IN_FLIGHT_CODE, "message": "相同的請求仍在處理中，請稍後再試",
+                }), 409
+            return _replay(entry)
+
+        try:
+            resp = make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency_store.abandon(scope, entry)
+            raise
+        if resp.status_code >= 500 or resp.is_streamed:
+            idempotency_store.abandon(scope, entry)
+        else:
+            idempotency_store.complete(entry, (resp.get_data(), resp.status_code, resp.mimetype))
+        return resp
+
+    return wrapper
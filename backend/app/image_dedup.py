@@ -0,0 +1,172 @@
+import base64
+import os
+import threading
+
+from PIL import Image as PILImage
+
+from app.extensions import db
+from app.models import SourceImageFingerprint
+from app.storage import variant_store
+
+# ============================================================
+# 來源圖片去重：dHash + 多重索引 (multi-index hashing) 的 Hamming 距離查詢
+# ============================================================
+# 距離 <= DEDUP_MAX_DISTANCE 視為同一張照片（64 bits 中只差幾個 bit）
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", 4))
+VARIANT_PREFIX = "variants"
+
+_HASH_BITS = 64
+_SIGN_BIT = 1 << 63
+
+
+def dhash(pil_image: PILImage.Image, hash_size: int = 8) -> int:
+    """Difference hash：縮成 9x8 灰階，逐列比較相鄰像素亮度，得到 64-bit 指紋"""
+    small = pil_image.convert("L").resize((hash_size + 1, hash_size), PILImage.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_signed64(value: int) -> int:
+    """Postgres BIGINT 為有號整數"""
+    return value - (1 << 64) if value & _SIGN_BIT else value
+
+
+def to_unsigned64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class HammingIndex:
+    """
+    將 64-bit 雜湊切成 max_distance + 1 段，每段各自建立 dict。
+    依鴿籠原理，距離 <= max_distance 的兩個雜湊至少有一段完全相同，
+    因此查詢只需比對少量候選，不必掃描全部資料。
+    """
+
+    def __init__(self, max_distance: int = DEDUP_MAX_DISTANCE):
+        self.max_distance = max_distance
+        n_bands = max_distance + 1
+        widths = [_HASH_BITS // n_bands + (1 if i < _HASH_BITS % n_bands else 0) for i in range(n_bands)]
+        self._bands = []
+        shift = 0
+        for width in widths:
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        self._tables = [dict() for _ in self._bands]
+        self._entries = {}
+
+    def _band_keys(self, value: int):
+        return [(value >> shift) & mask for shift, mask in self._bands]
+
+    def add(self, entry_id, value: int, payload=None):
+        self._entries[entry_id] = (value, payload)
+        for table, key in zip(self._tables, self._band_keys(value)):
+            table.setdefault(key, []).append(entry_id)
+
+    def search(self, value: int, max_distance: int = None):
+        """回傳 [(distance, entry_id, payload)]，依距離由近到遠排序"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        seen = set()
+        matches = []
+        for table, key in zip(self._tables, self._band_keys(value)):
+            for entry_id in table.get(key, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                stored, payload = self._entries[entry_id]
+                distance = hamming(stored, value)
+                if distance <= max_distance:
+                    matches.append((distance, entry_id, payload))
+        matches.sort(key=lambda m: m[0])
+        return matches
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SourceImageIndex:
+    """
+    每個 tenant 一個 HammingIndex，啟動時從 DB 載入，之後只增量讀取新資料列
+    （多個 gunicorn worker 各自寫入時也能看到彼此新增的紀錄）。
+    """
+
+    def __init__(self, max_distance: int = DEDUP_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._indexes = {}
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        rows = db.session.query(
+            SourceImageFingerprint.id,
+            SourceImageFingerprint.tenant_id,
+            SourceImageFingerprint.product_name,
+            SourceImageFingerprint.context_fingerprint,
+            SourceImageFingerprint.dhash,
+            SourceImageFingerprint.variant_keys,
+            SourceImageFingerprint.created_at,
+        ).filter(SourceImageFingerprint.id > self._last_id).order_by(SourceImageFingerprint.id).all()
+
+        for row in rows:
+            index = self._indexes.setdefault(row.tenant_id, HammingIndex(self.max_distance))
+            index.add(row.id, to_unsigned64(row.dhash), {
+                "product_name": row.product_name,
+                "context_fingerprint": row.context_fingerprint,
+                "variant_keys": row.variant_keys,
+                "created_at": row.created_at,
+            })
+            self._last_id = row.id
+
+    def find(self, tenant_id, product_name, context_fp, image_hash: int):
+        """找出同 tenant、同產品、同文案情境下最接近的一筆來源圖片"""
+        with self._lock:
+            self._refresh()
+            index = self._indexes.get(tenant_id)
+            if not index:
+                return None
+            for distance, entry_id, payload in index.search(image_hash):
+                if payload["product_name"] == product_name and payload["context_fingerprint"] == context_fp:
+                    return {"id": entry_id, "distance": distance, **payload}
+        return None
+
+    def record(self, tenant_id, product_name, context_fp, image_hash: int, variant_keys: list):
+        row = SourceImageFingerprint(
+            tenant_id=tenant_id,
+            product_name=product_name,
+            context_fingerprint=context_fp,
+            dhash=to_signed64(image_hash),
+            variant_keys=variant_keys,
+        )
+        db.session.add(row)
+        db.session.commit()
+        return row
+
+
+source_image_index = SourceImageIndex()
+
+
+# ============================================================
+# 生成結果存檔（MinIO，以內容 SHA-256 命名）
+# ============================================================
+def _decode_data_url(image: str) -> bytes:
+    if "base64," in image:
+        image = image.split("base64,", 1)[1]
+    return base64.b64decode(image)
+
+
+def store_variant_images(images: list) -> list:
+    """將 data URL 形式的生成結果存入 MinIO（相同內容不重複上傳），回傳 object keys"""
+    return [variant_store.put_bytes(_decode_data_url(image), prefix=VARIANT_PREFIX)[0] for image in images]
+
+
+def variant_url(key: str) -> str:
+    """前端透過後端代理讀取，與頁面同源，發佈時可直接 fetch 成 Blob"""
+    return f"/api/content/{key}"
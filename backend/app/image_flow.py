@@ -1,4 +1,5 @@
-import os, io, base64, asyncio, time
+import os, io, base64, asyncio, time, threading
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
 from typing import Optional, List
 from PIL import Image as PILImage
@@ -6,18 +7,24 @@ from PIL import Image as PILImage
 from google import genai
 from google.genai import errors 
 from crewai import Agent, Task, Crew, LLM
-from crewai.flow.flow import Flow, listen, start
+from crewai.flow.flow import Flow, listen, start, router, or_
 from crewai.tools import tool
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field, ConfigDict
 from tavily import TavilyClient
 
+from app.cache import TTLCache
+from app.prompt_plan_cache import context_fingerprint, get_prompt_plan, save_prompt_plan
+from app.source_assets import prepare_source_asset
+
 # 載入環境變數
 load_dotenv()
 
 # ============================================================
 # 區塊 0：全域 LLM 配置
 # ============================================================
+VARIANT_COUNT = 3
+
 gemini_llm = LLM(
     model="gemini/gemini-3.1-flash-lite-preview", 
     api_key=os.getenv("GEMINI_API_KEY"),
@@ -45,21 +52,78 @@ class NanoBananaPrompt(BaseModel):
 # ============================================================
 # 區塊 2：視覺搜尋工具
 # ============================================================
+# 相同的氛圍關鍵字（例如 "summer iced tea background"）會一再出現，快取正規化後的查詢結果
+VISUAL_SEARCH_TTL = int(os.getenv("VISUAL_SEARCH_TTL", 6 * 3600))
+VISUAL_SNIPPET_CHARS = 240
+_visual_search_cache = TTLCache(maxsize=512, ttl=VISUAL_SEARCH_TTL)
+
+_tavily_client = None
+_tavily_lock = threading.Lock()
+
+
+def get_tavily_client():
+    """整個行程共用一個 TavilyClient，避免每次查詢都重建"""
+    global _tavily_client
+    if _tavily_client is None:
+        with _tavily_lock:
+            if _tavily_client is None:
+                _tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+    return _tavily_client
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def _trim_search_results(results: dict) -> list:
+    """只保留提示詞工程師需要的欄位（標題 + 截短摘要）"""
+    trimmed = []
+    for r in results.get("results", []):
+        snippet = " ".join((r.get("content") or "").split())[:VISUAL_SNIPPET_CHARS]
+        trimmed.append({"title": r.get("title", ""), "snippet": snippet})
+    return trimmed
+
+
+def search_visual_references(query: str) -> list:
+    key = normalize_query(query)
+    cached = _visual_search_cache.get(key)
+    if cached is not None:
+        print(f"   💾 視覺搜尋快取命中: {key}")
+        return cached
+
+    results = get_tavily_client().search(query=f"{key} lifestyle beverage photography background", max_results=3)
+    trimmed = _trim_search_results(results)
+    _visual_search_cache.set(key, trimmed)
+    return trimmed
+
+
+def format_visual_references(references: list) -> str:
+    return "\n".join(f"- {r['title']}: {r['snippet']}" for r in references)
+
+
 @tool("visual_search_tool")
 def visual_search_tool(query: str) -> str:
     """搜尋視覺背景與氛圍素材。"""
-    client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
-    results = client.search(query=f"{query} lifestyle beverage photography background", max_results=3)
-    return str(results)
+    return format_visual_references(search_visual_references(query))
 
 # ============================================================
 # 區塊 3：TeaMaster AI 整合 Flow
 # ============================================================
 class TeaMasterNanoBananaFlow(Flow):
     # 移除類別層級的 image_semaphore，改為實例屬性
-    def __init__(self):
+    def __init__(self, on_variant=None):
         super().__init__()
         self._semaphore = None
+        # on_variant(index, status, image=None, error=None)：每張圖狀態改變時即時回報
+        self._on_variant = on_variant
+
+    def _emit_variant(self, index, status, image=None, error=None):
+        if self._on_variant is None:
+            return
+        try:
+            self._on_variant(index, status, image=image, error=error)
+        except Exception as e:
+            print(f"   ⚠️ 回報任務 {index+1} 狀態失敗: {e}")
 
     def get_semaphore(self):
         # 確保 Semaphore 在當前的事件迴圈中建立
@@ -68,6 +132,24 @@ class TeaMasterNanoBananaFlow(Flow):
         return self._semaphore
 
     @start()
+    def lookup_prompt_plan(self):
+        """步驟 0: 相同情境已有提示詞方案時，直接跳到生成步驟"""
+        ctx: MarketingContext = self.state["marketing_context"]
+        fingerprint = context_fingerprint(ctx.product_name, ctx.copywriting, ctx.weather, ctx.festival)
+        self.state["context_fingerprint"] = fingerprint
+
+        plan = get_prompt_plan(fingerprint) if self.state.get("use_plan_cache", True) else None
+        if plan:
+            print("💾 [Step 0] 命中提示詞方案快取，略過策略分析與提示詞撰寫")
+            self.state["search_queries"] = plan["search"].queries
+            self.state["final_prompt"] = plan["prompt"].final_prompt
+        return fingerprint
+
+    @router(lookup_prompt_plan)
+    def route_prompt_plan(self):
+        return "cached" if self.state.get("final_prompt") else "plan"
+
+    @listen("plan")
     def analyze_marketing_strategy(self):
         print("🔍 [Step 1] 分析行銷文案背景...")
         ctx: MarketingContext = self.state["marketing_context"]
@@ -92,17 +174,33 @@ class TeaMasterNanoBananaFlow(Flow):
         )
 
         result = Crew(agents=[strategist], tasks=[task]).kickoff()
+        self.state["search_plan"] = result.pydantic
         self.state["search_queries"] = result.pydantic.queries
         return self.state["search_queries"]
 
     @listen(analyze_marketing_strategy)
     def fetch_visual_inspiration(self):
         print(f"🚀 [Step 2] 正在搜尋視覺靈感素材...")
+        # 去除重複關鍵字後並行查詢，整體延遲約等於單次搜尋
+        queries = list(dict.fromkeys(
+            normalize_query(q) for q in self.state.get("search_queries", []) if q and q.strip()
+        ))
+
+        def _search(q):
+            try:
+                return search_visual_references(q)
+            except Exception as e:
+                print(f"   ⚠️ 視覺搜尋失敗 ({q}): {e}")
+                return []
+
         materials = []
-        for q in self.state.get("search_queries", []):
-            res = visual_search_tool.run(query=q)
-            materials.append(res)
-        self.state["visual_references"] = "\n".join(materials)
+        if queries:
+            with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+                materials = list(pool.map(_search, queries))
+
+        self.state["visual_references"] = "\n".join(
+            format_visual_references(refs) for refs in materials if refs
+        )
         return self.state["visual_references"]
 
     @listen(fetch_visual_inspiration)
@@ -141,13 +239,16 @@ class TeaMasterNanoBananaFlow(Flow):
 
         result = Crew(agents=[engineer], tasks=[task]).kickoff()
         self.state["final_prompt"] = result.pydantic.final_prompt
+        save_prompt_plan(self.state["context_fingerprint"], self.state["search_plan"], result.pydantic)
         return self.state["final_prompt"]
 
-    async def _async_generate_single_image(self, client, index, prompt, source_image):
-        """加入延遲取得 Semaphore 的機制"""
+    async def _async_generate_single_image(self, client, index, prompt, source_part):
+        """加入延遲取得 Semaphore 的機制；source_part 為共用的來源圖片參照"""
         sem = self.get_semaphore() 
         async with sem:
+            self._emit_variant(index, "running")
             max_retries = 3
+            last_error = None
             for attempt in range(max_retries):
                 try:
                     print(f"   ⚡ 啟動任務 {index+1} (嘗試 {attempt+1})...")
@@ -155,7 +256,7 @@ class TeaMasterNanoBananaFlow(Flow):
                     
                     response = client.models.generate_content(
                         model="gemini-3.1-flash-image-preview",
-                        contents=[variant_prompt, source_image],
+                        contents=[variant_prompt, source_part],
                     )
 
                     for part in response.parts:
@@ -165,11 +266,15 @@ class TeaMasterNanoBananaFlow(Flow):
                             buf = io.BytesIO()
                             generated_pil.convert("RGB").save(buf, format="PNG")
                             b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+                            image = f"data:image/png;base64,{b64}"
                             print(f"   ✅ 任務 {index+1} 完成")
+                            # 先交付結果，再進行控速等待
+                            self._emit_variant(index, "success", image=image)
                             await asyncio.sleep(12) 
-                            return f"data:image/png;base64,{b64}"
+                            return image
                 
                 except Exception as e:
+                    last_error = str(e)
                     if "429" in str(e):
                         wait_time = 30 * (attempt + 1)
                         print(f"   ⚠️ 任務 {index+1} 觸發 429，等待 {wait_time}s...")
@@ -177,19 +282,24 @@ class TeaMasterNanoBananaFlow(Flow):
                     else:
                         print(f"   ❌ 任務 {index+1} 失敗: {e}")
                         break
+            self._emit_variant(index, "error", error=last_error or "模型未回傳圖片")
             return None
 
-    @listen(design_protected_prompt)
+    @listen(or_("cached", design_protected_prompt))
     def execute_generation(self):
         """步驟 4: 使用新的迴圈處理邏輯"""
         print("📸 [Step 4] 執行 Nano Banana 2 控速合成...")
         ctx: MarketingContext = self.state["marketing_context"]
         client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-        
+
+        # 來源圖片只序列化 / 上傳一次，三個變體共用同一個參照
+        source_asset = prepare_source_asset(client, ctx.source_image)
+        source_part = source_asset.as_part()
+
         async def run_tasks():
             tasks = [
-                self._async_generate_single_image(client, i, self.state["final_prompt"], ctx.source_image)
-                for i in range(3)
+                self._async_generate_single_image(client, i, self.state["final_prompt"], source_part)
+                for i in range(VARIANT_COUNT)
             ]
             return await asyncio.gather(*tasks)
 
@@ -206,8 +316,11 @@ class TeaMasterNanoBananaFlow(Flow):
             import nest_asyncio
             nest_asyncio.apply()
         
-        results = loop.run_until_complete(run_tasks())
-        
+        try:
+            results = loop.run_until_complete(run_tasks())
+        finally:
+            source_asset.release()
+
         self.state["final_images"] = [r for r in results if r is not None]
         print(f"🏁 生成結束，成功取得 {len(self.state['final_images'])} 張圖片")
         return self.state["final_images"]
@@ -215,8 +328,9 @@ class TeaMasterNanoBananaFlow(Flow):
 # ============================================================
 # 進入點
 # ============================================================
-def process_image_generation(product_name, copywriting, weather, festival, pil_image):
-    flow = TeaMasterNanoBananaFlow()
+def process_image_generation(product_name, copywriting, weather, festival, pil_image, use_plan_cache=True, on_variant=None):
+    flow = TeaMasterNanoBananaFlow(on_variant=on_variant)
+    flow.state["use_plan_cache"] = use_plan_cache
     flow.state["marketing_context"] = MarketingContext(
         product_name=product_name,
         copywriting=copywriting,
@@ -56,6 +56,8 @@ class Ingredient(db.Model):
     name = db.Column(db.String(100), nullable=False, unique=True) 
     
     monthly_status_matrix = db.Column(db.JSON, server_default='[]')
+    # 各月份相對當年均價的比值（12 個值，由 price_analytics 依實際價格計算）
+    seasonal_index = db.Column(db.JSON)
 
 # 6. 行銷文案表 (MarketingContent)
 class MarketingContent(db.Model):
@@ -68,6 +70,10 @@ class MarketingContent(db.Model):
     final_text = db.Column(db.Text, nullable=False) 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     like = db.Column(db.Integer, default=0) 
+    # 各平台發佈後的貼文 ID，例如 {"fb": "123_456", "ig": "1789..."}
+    external_post_ids = db.Column(db.JSON)
+    # 最後一次從 Meta 同步互動數的時間（見 engagement_sync）
+    engagement_synced_at = db.Column(db.DateTime)
 
 # 7. 文案圖片表 (ContentImage)
 class ContentImage(db.Model):
@@ -145,4 +151,161 @@ class PriceHistory(db.Model):
     ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredient.id'), nullable=False)
     market_price = db.Column(db.Numeric(10, 2))
     change_rate = db.Column(db.Numeric(5, 2))
-    recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # 每種原物料每個時間點只有一筆；批次寫入以 ON CONFLICT DO NOTHING 略過已存在的資料
+        db.Index('uix_price_history_ingredient_recorded', 'ingredient_id', 'recorded_at', unique=True),
+    )
+
+# 13. 來源圖片感知雜湊表 (SourceImageFingerprint)
+class SourceImageFingerprint(db.Model):
+    __tablename__ = 'source_image_fingerprint'
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenant.id'), nullable=False)
+    product_name = db.Column(db.String(100), nullable=False)
+    context_fingerprint = db.Column(db.String(64), nullable=False)
+    # 64-bit dHash，以有號整數存入 BIGINT
+    dhash = db.Column(db.BigInteger, nullable=False)
+    variant_keys = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_source_fp_tenant_product', 'tenant_id', 'product_name'),
+    )
+
+# 14. 排程發佈表 (ScheduledPost)
+class ScheduledPost(db.Model):
+    __tablename__ = 'scheduled_post'
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenant.id'), nullable=False)
+    store_id = db.Column(db.Integer, db.ForeignKey('store.id'), nullable=False)
+    holiday_id = db.Column(db.Integer, db.ForeignKey('holiday_calendar.id'), nullable=True)
+    product_name = db.Column(db.String(100))
+    caption = db.Column(db.Text, nullable=False)
+    # POST_BUCKET 中的 object key（排程時即已上傳）
+    image_key = db.Column(db.String(255), nullable=False)
+    platform = db.Column(db.String(50), nullable=False)
+    # UTC
+    scheduled_at = db.Column(db.DateTime, nullable=False)
+    # pending -> publishing -> published / failed；pending 時可 cancelled
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    claimed_at = db.Column(db.DateTime)
+    published_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # 只索引待發佈的資料列：排程器每次只碰到到期的少數幾筆，不必掃描整張表
+        db.Index('ix_scheduled_post_due', 'scheduled_at', postgresql_where=text("status = 'pending'")),
+        db.Index('ix_scheduled_post_tenant_status', 'tenant_id', 'status', 'scheduled_at'),
+    )
+
+# 15. 發佈 Outbox (PublishOutbox)
+class PublishOutbox(db.Model):
+    __tablename__ = 'publish_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    content_id = db.Column(db.Integer, db.ForeignKey('marketing_content.id'), nullable=False)
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenant.id'), nullable=False)
+    # 每個平台一筆：fb / ig
+    platform = db.Column(db.String(10), nullable=False)
+    # sha256(content_id:platform)，同一則貼文同一平台只會排入一次
+    idempotency_key = db.Column(db.String(64), nullable=False, unique=True)
+    image_url = db.Column(db.String(255), nullable=False)
+    caption = db.Column(db.Text, nullable=False)
+    # pending -> sending -> sent；重試用盡為 dead；FB 中斷後無法確認是否已發出為 unknown
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    # IG 容器 ID：建立後先記下，重試時沿用避免重複發文
+    provider_ref = db.Column(db.String(100))
+    external_id = db.Column(db.String(100))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_publish_outbox_due', 'next_attempt_at', postgresql_where=text("status = 'pending'")),
+    )
+
+# 16. 爬蟲狀態表 (CrawlState)：每個資料來源最後一次成功的時間、耗時與內容雜湊
+class CrawlState(db.Model):
+    __tablename__ = 'crawl_state'
+    # weather / fruit / beverage / news
+    source = db.Column(db.String(50), primary_key=True)
+    last_attempt_at = db.Column(db.DateTime)
+    last_success_at = db.Column(db.DateTime)
+    last_duration_ms = db.Column(db.Integer)
+    # sha256(本次取回的內容)，與上次相同代表來源資料沒有變化
+    content_hash = db.Column(db.String(64))
+    content_changed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+
+# 17. 爬蟲執行紀錄 (CrawlRun)：每次嘗試一筆（重試也各自一筆）
+class CrawlRun(db.Model):
+    __tablename__ = 'crawl_run'
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False)
+    attempt = db.Column(db.Integer, nullable=False, default=1)
+    # startup / schedule / force
+    trigger = db.Column(db.String(20))
+    # running -> success / failed / timeout；行程中斷留在 running 者於下次啟動標為 interrupted
+    status = db.Column(db.String(20), nullable=False, default='running')
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    duration_ms = db.Column(db.Integer)
+    rows_written = db.Column(db.Integer)
+    error = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('ix_crawl_run_job_started', 'job', 'started_at'),
+    )
+
+# 18. 歷史回補進度 (BackfillCheckpoint)：已完成的資料區間，中斷後從未完成的區間接續
+class BackfillCheckpoint(db.Model):
+    __tablename__ = 'backfill_checkpoint'
+    # 例如 fruit
+    job = db.Column(db.String(50), primary_key=True)
+    window_start = db.Column(db.Date, primary_key=True)
+    window_end = db.Column(db.Date, nullable=False)
+    rows_written = db.Column(db.Integer, nullable=False, default=0)
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# 19. 水果價格觀察清單 (FruitWatchlist)：清單內的品項會以全國量加權均價寫入 PriceHistory
+class FruitWatchlist(db.Model):
+    __tablename__ = 'fruit_watchlist'
+    id = db.Column(db.Integer, primary_key=True)
+    # 農產品交易行情的 CropName，例如「芒果-其他」
+    crop_name = db.Column(db.String(100), nullable=False, unique=True)
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredient.id'))
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# 20. 每日價格序列 (PriceSeries)：每個品項 × 市場 × 年份一列，以陣列存放一整年的每日均價與交易量
+class PriceSeries(db.Model):
+    __tablename__ = 'price_series'
+    crop_code = db.Column(db.String(20), primary_key=True)
+    # 市場名稱；ALL 為各市場以交易量加權的全國均價
+    market = db.Column(db.String(20), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    crop_name = db.Column(db.String(100), nullable=False)
+    # 長度 366，索引為當年第幾天（1/1 = 0），沒有交易的日子為 NULL
+    prices = db.Column(db.ARRAY(db.Float), nullable=False)
+    volumes = db.Column(db.ARRAY(db.Float), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# 21. 每日價格彙總 (PriceRollup)：由 price_analytics 依 PriceHistory 預先計算，API 直接讀取
+class PriceRollup(db.Model):
+    __tablename__ = 'price_rollup'
+    ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredient.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    price = db.Column(db.Float, nullable=False)
+    ma_7 = db.Column(db.Float)
+    ma_30 = db.Column(db.Float)
+    ma_90 = db.Column(db.Float)
+    # 近 30 日對數報酬的年化標準差 (%)
+    volatility_30 = db.Column(db.Float)
+    # 近一年價格的第 20 / 80 百分位：低於 buy_below 適合進貨，高於 avoid_above 建議避開
+    buy_below = db.Column(db.Float)
+    avoid_above = db.Column(db.Float)
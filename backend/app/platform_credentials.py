@@ -0,0 +1,90 @@
+import os
+from datetime import datetime
+
+from app.cache import TTLCache
+from app.models import PlatformToken
+
+# ============================================================
+# 發佈憑證：依 tenant 讀取 PlatformToken，並以 TTL 快取減少 DB 查詢
+# ============================================================
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 300))
+TOKEN_CACHE_MAXSIZE = int(os.getenv("TOKEN_CACHE_MAXSIZE", 1024))
+
+# 尚未綁定粉專的 tenant 是否沿用 .env 的單一帳號：僅供單品牌 / 開發環境明確開啟，
+# 多品牌部署若開啟，未綁定的品牌會發到其他品牌的粉專
+ALLOW_ENV_CREDENTIALS = os.getenv("ALLOW_ENV_CREDENTIALS", "false").lower() == "true"
+
+# 各發佈平台所需的憑證欄位與顯示名稱
+PLATFORM_CREDENTIAL_KEYS = {
+    'fb': ('fb_page_id', 'fb_access_token'),
+    'ig': ('ig_id', 'ig_access_token'),
+}
+PLATFORM_LABELS = {'fb': 'Facebook 粉絲專頁', 'ig': 'Instagram 商業帳號'}
+
+_credential_cache = TTLCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=TOKEN_CACHE_TTL)
+
+
+class PlatformNotConnected(Exception):
+    """tenant 尚未綁定要發佈的平台"""
+
+    def __init__(self, platforms):
+        self.platforms = platforms
+        labels = "、".join(PLATFORM_LABELS.get(p, p) for p in platforms)
+        super().__init__(f"尚未連結{labels}，請先完成帳號綁定再發佈")
+
+
+def env_credentials():
+    """以環境變數提供的單一粉專 / IG 帳號憑證"""
+    return {
+        'fb_page_id': os.getenv("FB_PAGE_ID"),
+        'fb_access_token': os.getenv("FB_ACCESS_TOKEN"),
+        'ig_id': os.getenv("IG_ID"),
+        'ig_access_token': os.getenv("IG_ACCESS_TOKEN"),
+    }
+
+
+def _load_tenant_credentials(tenant_id):
+    now = datetime.utcnow()
+    rows = PlatformToken.query.filter_by(tenant_id=tenant_id).all()
+    credentials = {}
+    for row in rows:
+        # expires_at 以 UTC 寫入；過期的 token 視同未綁定
+        if row.expires_at and row.expires_at.replace(tzinfo=None) <= now:
+            continue
+        if row.platform_name == 'facebook':
+            credentials['fb_page_id'] = row.page_id
+            credentials['fb_access_token'] = row.access_token
+        elif row.platform_name == 'instagram':
+            credentials['ig_id'] = row.page_id
+            credentials['ig_access_token'] = row.access_token
+    return credentials
+
+
+def resolve_credentials(tenant_id):
+    """回傳 {"fb_page_id", "fb_access_token", "ig_id", "ig_access_token"}，需在 app context 內呼叫"""
+    credentials = _credential_cache.get(tenant_id)
+    if credentials is not None:
+        return credentials
+
+    credentials = _load_tenant_credentials(tenant_id)
+    if not credentials and ALLOW_ENV_CREDENTIALS:
+        credentials = env_credentials()
+    _credential_cache.set(tenant_id, credentials)
+    return credentials
+
+
+def require_connected(tenant_id, platforms):
+    """確認 tenant 已綁定所有 platforms（'fb' / 'ig'），否則拋出 PlatformNotConnected；回傳憑證"""
+    credentials = resolve_credentials(tenant_id)
+    missing = [
+        platform for platform in platforms
+        if not all(credentials.get(key) for key in PLATFORM_CREDENTIAL_KEYS[platform])
+    ]
+    if missing:
+        raise PlatformNotConnected(missing)
+    return credentials
+
+
+def invalidate_credentials(tenant_id):
+    """重新綁定粉專後呼叫，讓下一次發佈立即使用新 token"""
+    _credential_cache.pop(tenant_id)
@@ -0,0 +1,217 @@
+import json
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import text
+
+# ============================================================
+# 水果價格分析：PriceHistory 載入成 NumPy 陣列，以向量運算計算移動平均 / 波動度 / 季節指數 / 百分位買賣區間，
+# 結果寫入 price_rollup（每日一列），API 只做索引查詢，回應時間與歷史長度無關
+# ============================================================
+MA_WINDOWS = (7, 30, 90)
+VOLATILITY_WINDOW = 30
+# 買賣區間回看天數與百分位
+BAND_WINDOW = int(os.getenv("PRICE_BAND_WINDOW", 365))
+BAND_PERCENTILES = (20, 80)
+# 季節指數的分級門檻 → monthly_status_matrix 1 最佳(低價) / 2 適合 / 3 偏高 / 4 高價，沒有成交的月份為 0
+# 只使用完整涵蓋 1/1 ~ 12/31 的年份；還沒有完整的一年時不覆寫 monthly_status_matrix
+SEASONAL_THRESHOLDS = (0.92, 1.0, 1.08)
+
+ROLLUP_COLUMNS = ("price", "ma_7", "ma_30", "ma_90", "volatility_30", "buy_below", "avoid_above")
+
+
+def load_series(session, ingredient_id):
+    """(days: datetime64[D], prices: float64)，依日期排序；同一天多筆取最後一筆"""
+    row = session.execute(text("""
+        SELECT array_agg(day ORDER BY day) AS days, array_agg(price ORDER BY day) AS prices
+        FROM (
+            SELECT DISTINCT ON (recorded_at::date) recorded_at::date AS day, market_price::float8 AS price
+            FROM price_history
+            WHERE ingredient_id = :id AND market_price > 0
+            ORDER BY recorded_at::date, recorded_at DESC
+        ) t
+    """), {"id": ingredient_id}).one()
+    if not row.days:
+        return np.array([], dtype="datetime64[D]"), np.array([], dtype=np.float64)
+    return np.array(row.days, dtype="datetime64[D]"), np.array(row.prices, dtype=np.float64)
+
+
+def densify(days, prices):
+    """補成連續日曆，缺的日子延用前一日價格（與爬蟲的休市處理一致）"""
+    offsets = (days - days[0]).astype(np.int64)
+    full = np.full(offsets[-1] + 1, np.nan)
+    full[offsets] = prices
+    idx = np.where(np.isnan(full), 0, np.arange(full.size))
+    np.maximum.accumulate(idx, out=idx)
+    return days[0] + np.arange(full.size), full[idx]
+
+
+def moving_average(prices, window):
+    """以累積和計算，前 window - 1 天為 NaN"""
+    out = np.full(prices.shape, np.nan)
+    if prices.size >= window:
+        csum = np.concatenate(([0.0], np.cumsum(prices)))
+        out[window - 1:] = (csum[window:] - csum[:-window]) / window
+    return out
+
+
+def rolling_volatility(prices, window=VOLATILITY_WINDOW):
+    """近 window 日對數報酬的標準差，年化後以百分比表示"""
+    out = np.full(prices.shape, np.nan)
+    returns = np.diff(np.log(prices))
+    if returns.size >= window:
+        s1 = np.concatenate(([0.0], np.cumsum(returns)))
+        s2 = np.concatenate(([0.0], np.cumsum(returns ** 2)))
+        mean = (s1[window:] - s1[:-window]) / window
+        var = np.maximum((s2[window:] - s2[:-window]) / window - mean ** 2, 0.0)
+        out[window:] = np.sqrt(var * 365) * 100
+    return out
+
+
+def percentile_bands(prices, window=BAND_WINDOW, percentiles=BAND_PERCENTILES):
+    """每一天往前 window 日（歷史不足時取全部）的百分位，回傳 shape (len(percentiles), n)"""
+    window = min(window, prices.size)
+    out = np.full((len(percentiles), prices.size), np.nan)
+    if window:
+        out[:, window - 1:] = np.percentile(sliding_window_view(prices, window), percentiles, axis=1)
+    return out
+
+
+def seasonal_sample(days, prices):
+    """
+    季節指數使用的資料：只取實際成交日（爬蟲在休市日寫入前一日價格，與前一筆同價的列視為延用），
+    且只取觀察期間內完整的年份（不完整的年份會讓年平均偏向有資料的月份）
+    """
+    traded = np.concatenate(([True], np.diff(prices) != 0))
+    years = days.astype("datetime64[Y]")
+    first_year = years[0] if days[0] == years[0].astype("datetime64[D]") else years[0] + 1
+    last_year = years[-1] if days[-1] == (years[-1] + 1).astype("datetime64[D]") - 1 else years[-1] - 1
+    keep = traded & (years >= first_year) & (years <= last_year)
+    return days[keep], prices[keep]
+
+
+def seasonal_index(days, prices):
+    """各月份價格相對當年平均的比值（去除年度趨勢後按月平均），1.0 為平均；沒有成交的月份為 NaN"""
+    months = days.astype("datetime64[M]").astype(np.int64) % 12
+    years = days.astype("datetime64[Y]").astype(np.int64)
+    year_idx = years - years.min()
+    year_mean = np.bincount(year_idx, prices) / np.bincount(year_idx)
+    ratio = prices / year_mean[year_idx]
+    counts = np.bincount(months, minlength=12)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.bincount(months, ratio, minlength=12) / counts
+
+
+def status_matrix(index):
+    """季節指數 → 12 個月的採購建議等級"""
+    status = np.digitize(index, SEASONAL_THRESHOLDS) + 1
+    status[np.isnan(index)] = 0
+    return status.tolist()
+
+
+def compute_rollup(days, prices):
+    """連續日曆上的全部指標：{欄位: 與 days 等長的陣列}"""
+    lower, upper = percentile_bands(prices)
+    rollup = {"price": prices, "volatility_30": rolling_volatility(prices), "buy_below": lower, "avoid_above": upper}
+    for window in MA_WINDOWS:
+        rollup[f"ma_{window}"] = moving_average(prices, window)
+    return rollup
+
+
+def _to_param(values):
+    """四捨五入到小數 2 位、NaN 轉成 NULL：重算時數值不變的列不會被改寫"""
+    out = np.round(values, 2).astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+
+def refresh_ingredient(session, ingredient_id):
+    """重算單一原物料的每日彙總與季節指數，回傳實際變動的列數（沒有價格資料時為 0）"""
+    raw_days, raw_prices = load_series(session, ingredient_id)
+    if not raw_days.size:
+        return 0
+    days, prices = densify(raw_days, raw_prices)
+    rollup = compute_rollup(days, prices)
+
+    params = {"id": ingredient_id, "days": days.astype(object).tolist()}
+    params.update({column: _to_param(rollup[column]) for column in ROLLUP_COLUMNS})
+    changed = session.execute(text(f"""
+        INSERT INTO price_rollup (ingredient_id, day, {", ".join(ROLLUP_COLUMNS)})
+        SELECT :id, r.* FROM unnest(
+            CAST(:days AS date[]), {", ".join(f"CAST(:{c} AS float8[])" for c in ROLLUP_COLUMNS)}
+        ) AS r
+        ON CONFLICT (ingredient_id, day) DO UPDATE SET
+            {", ".join(f"{c} = EXCLUDED.{c}" for c in ROLLUP_COLUMNS)}
+        WHERE ({", ".join(f"price_rollup.{c}" for c in ROLLUP_COLUMNS)})
+            IS DISTINCT FROM ({", ".join(f"EXCLUDED.{c}" for c in ROLLUP_COLUMNS)})
+    """), params).rowcount
+
+    sample_days, sample_prices = seasonal_sample(raw_days, raw_prices)
+    if sample_days.size:
+        index = seasonal_index(sample_days, sample_prices)
+        session.execute(text("""
+            UPDATE ingredient
+            SET seasonal_index = CAST(:index AS JSON), monthly_status_matrix = CAST(:matrix AS JSON)
+            WHERE id = :id
+        """), {
+            "id": ingredient_id,
+            "index": json.dumps(_to_param(index)),
+            "matrix": json.dumps(status_matrix(index)),
+        })
+    return changed
+
+
+def refresh_rollups(session, ingredient_ids=None):
+    """重算多個原物料（預設為所有有價格資料者），回傳 {ingredient_id: 變動列數}；由呼叫端 commit"""
+    if ingredient_ids is None:
+        ingredient_ids = session.execute(text("SELECT DISTINCT ingredient_id FROM price_history")).scalars().all()
+    return {ingredient_id: refresh_ingredient(session, ingredient_id) for ingredient_id in ingredient_ids}
+
+
+# ============================================================
+# 查詢（API 使用）：只讀 price_rollup，每個原物料一次索引查詢
+# ============================================================
+
+def _signal(row):
+    if row.buy_below is not None and row.price <= row.buy_below:
+        return "buy"
+    if row.avoid_above is not None and row.price >= row.avoid_above:
+        return "avoid"
+    return "hold"
+
+
+def _serialize(row):
+    data = {"day": row.day.isoformat()}
+    data.update({column: getattr(row, column) for column in ROLLUP_COLUMNS})
+    data["signal"] = _signal(row)
+    return data
+
+
+def latest_rollups(session):
+    """每個原物料最新一天的指標與買賣訊號"""
+    rows = session.execute(text("""
+        SELECT i.id AS ingredient_id, i.name, r.*
+        FROM ingredient i
+        CROSS JOIN LATERAL (
+            SELECT day, price, ma_7, ma_30, ma_90, volatility_30, buy_below, avoid_above
+            FROM price_rollup
+            WHERE ingredient_id = i.id
+            ORDER BY day DESC
+            LIMIT 1
+        ) r
+        ORDER BY i.id
+    """)).all()
+    return [dict(_serialize(row), ingredient_id=row.ingredient_id, name=row.name) for row in rows]
+
+
+def rollup_series(session, ingredient_id, days):
+    """最近 days 天的每日指標（依日期排序）"""
+    rows = session.execute(text("""
+        SELECT day, price, ma_7, ma_30, ma_90, volatility_30, buy_below, avoid_above
+        FROM price_rollup
+        WHERE ingredient_id = :id
+          AND day > (SELECT max(day) FROM price_rollup WHERE ingredient_id = :id) - :days
+        ORDER BY day
+    """), {"id": ingredient_id, "days": days}).all()
+    return [_serialize(row) for row in rows]
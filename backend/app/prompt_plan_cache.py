@@ -0,0 +1,42 @@
+import hashlib
+import os
+import re
+import unicodedata
+
+from app.cache import TTLCache
+
+# ============================================================
+# 提示詞方案快取：相同情境直接沿用 ImageSearchQueries + NanoBananaPrompt
+# ============================================================
+PROMPT_PLAN_TTL = int(os.getenv("PROMPT_PLAN_TTL", 24 * 3600))
+PROMPT_PLAN_MAXSIZE = int(os.getenv("PROMPT_PLAN_MAXSIZE", 256))
+
+_prompt_plan_cache = TTLCache(maxsize=PROMPT_PLAN_MAXSIZE, ttl=PROMPT_PLAN_TTL)
+
+# 移除標點、emoji 與空白，只保留文字與數字（含中文）
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    """全形轉半形、轉小寫並移除標點 / emoji，讓只差排版或符號的文案視為相同"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _NON_WORD.sub("", text)
+
+
+def context_fingerprint(product_name: str, copywriting: str, weather: str, festival: str) -> str:
+    """以正規化後的 (產品, 天氣, 節慶, 文案) 組成情境指紋"""
+    parts = [normalize_text(v) for v in (product_name, weather, festival, copywriting)]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def get_prompt_plan(fingerprint: str):
+    """回傳 {"search": ImageSearchQueries, "prompt": NanoBananaPrompt} 或 None"""
+    return _prompt_plan_cache.get(fingerprint)
+
+
+def save_prompt_plan(fingerprint: str, search_plan, prompt_plan):
+    _prompt_plan_cache.set(fingerprint, {"search": search_plan, "prompt": prompt_plan})
+
+
+def invalidate_prompt_plan(fingerprint: str):
+    _prompt_plan_cache.pop(fingerprint)
@@ -0,0 +1,201 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.graph_client import GraphAPIError, graph_client
+
+# ============================================================
+# 發佈分派器：FB / IG 併行發佈，IG 以輪詢容器狀態取代固定 sleep(15)
+# ============================================================
+# IG 容器輪詢參數（秒）：由短到長指數退避，最長等待 IG_CONTAINER_TIMEOUT
+IG_POLL_INITIAL = float(os.getenv("IG_POLL_INITIAL", 1.0))
+IG_POLL_MAX = float(os.getenv("IG_POLL_MAX", 5.0))
+IG_POLL_FACTOR = 1.6
+IG_CONTAINER_TIMEOUT = float(os.getenv("IG_CONTAINER_TIMEOUT", 120))
+
+PUBLISH_WORKERS = int(os.getenv("PUBLISH_WORKERS", 8))
+
+# 每個粉專 / IG 帳號的發文速率（token bucket）：每分鐘補充 PAGE_POSTS_PER_MINUTE 個，最多累積 PAGE_POST_BURST 個
+PAGE_POSTS_PER_MINUTE = float(os.getenv("PAGE_POSTS_PER_MINUTE", 6))
+PAGE_POST_BURST = int(os.getenv("PAGE_POST_BURST", 2))
+
+
+class ContainerNotReady(Exception):
+    """IG 媒體容器處理失敗、過期或逾時（只有逾時可沿用同一容器重試）"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class PageRateLimiter:
+    """
+    以粉專 / IG 帳號為單位的 token bucket，多品牌同時發佈時各帳號各自限速，
+    不會因單一帳號觸發 Meta 的頁面層級速率限制 (code 32) 而拖累其他帳號。
+    """
+
+    def __init__(self, per_minute=PAGE_POSTS_PER_MINUTE, burst=PAGE_POST_BURST,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._sleep = sleep
+        self._clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _reserve(self, key):
+        """扣一個 token，回傳需等待的秒數（可能為 0）"""
+        with self._lock:
+            now = self._clock()
+            tokens, updated = self._buckets.get(key, (float(self.burst), now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate) - 1
+            self._buckets[key] = (tokens, now)
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+    def acquire(self, key):
+        wait = self._reserve(key)
+        if wait > 0:
+            print(f"   🚦 [RateLimit] {key} 速率限制，等待 {wait:.1f}s", flush=True)
+            self._sleep(wait)
+        return wait
+
+
+class PublishDispatcher:
+    """
+    graph / sleep 皆可注入，
+    方便指向本地的假 Graph API（scripts/fake_graph_api.py）進行驗證。
+    """
+
+    def __init__(self, graph=None, sleep=time.sleep, clock=time.monotonic, limiter=None):
+        self.graph = graph or graph_client
+        self._sleep = sleep
+        self._clock = clock
+        self.limiter = limiter or PageRateLimiter(sleep=sleep, clock=clock)
+        self._pool = ThreadPoolExecutor(max_workers=PUBLISH_WORKERS, thread_name_prefix="publish")
+
+    # ---------------- Facebook ----------------
+    def post_to_fb(self, page_id, access_token, image_url, caption):
+        """Facebook Page 發佈邏輯 (透過 URL 抓取)"""
+        if not page_id or not access_token:
+            return {"platform": "fb", "ok": False, "error": "尚未綁定 Facebook 粉絲專頁", "retryable": False}
+        self.limiter.acquire(f"fb:{page_id}")
+        print(f"📘 [FB] 開始發佈貼文至粉絲專頁 {page_id}，圖片 URL: {image_url}", flush=True)
+        try:
+            res = self.graph.post(f"{page_id}/photos", data={
+                'url': image_url,
+                'caption': caption,
+                'access_token': access_token,
+            })
+        except GraphAPIError as e:
+            print(f"❌ [FB] 發布失敗: {e}", flush=True)
+            return {"platform": "fb", "ok": False, "error": str(e), "retryable": e.retryable, "unknown": e.unknown}
+
+        print(f"🎉 [FB] 貼文發布成功！ID: {res['id']}", flush=True)
+        return {"platform": "fb", "ok": True, "id": res.get('post_id', res['id'])}
+
+    # ---------------- Instagram ----------------
+    def wait_for_container(self, creation_id, access_token):
+        """輪詢容器 status_code，FINISHED 即返回；ERROR / EXPIRED / 逾時則拋出例外"""
+        deadline = self._clock() + IG_CONTAINER_TIMEOUT
+        delay = IG_POLL_INITIAL
+        while True:
+            res = self.graph.get(creation_id, params={
+                'fields': 'status_code',
+                'access_token': access_token,
+            })
+            status = res.get('status_code')
+            if status == 'FINISHED':
+                return status
+            if status in ('ERROR', 'EXPIRED'):
+                raise ContainerNotReady(f"容器狀態 {status}: {res}")
+
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                raise ContainerNotReady(f"等待容器逾時（最後狀態 {status}）", retryable=True)
+            # 加入少量抖動，避免多個發佈同時輪詢
+            self._sleep(min(delay * random.uniform(0.8, 1.2), remaining))
+            delay = min(delay * IG_POLL_FACTOR, IG_POLL_MAX)
+
+    def post_to_ig(self, ig_id, access_token, image_url, caption, creation_id=None, on_container=None):
+        """
+        Instagram 發佈邏輯
+        creation_id: 重試時沿用先前建立的容器（同一容器只能發佈一次，不會重複發文）
+        on_container: 容器建立後立即回呼，讓呼叫端先記下 creation_id
+        """
+        if not ig_id or not access_token:
+            return {"platform": "ig", "ok": False, "error": "尚未綁定 Instagram 商業帳號", "retryable": False}
+        if creation_id is None:
+            self.limiter.acquire(f"ig:{ig_id}")
+            print(f"📸 [IG] 開始建立媒體容器 ({ig_id})，URL: {image_url}", flush=True)
+            try:
+                res_container = self.graph.post(f"{ig_id}/media", data={
+                    'image_url': image_url,
+                    'caption': caption,
+                    'access_token': access_token,
+                })
+            except GraphAPIError as e:
+                print(f"❌ [IG] 容器建立失敗: {e}", flush=True)
+                return {"platform": "ig", "ok": False, "error": str(e), "retryable": e.retryable}
+            creation_id = res_container['id']
+            if on_container:
+                on_container(creation_id)
+
+        started = self._clock()
+        print(f"⏳ [IG] 容器 ID: {creation_id}，輪詢處理狀態中...", flush=True)
+        try:
+            self.wait_for_container(creation_id, access_token)
+        except ContainerNotReady as e:
+            print(f"❌ [IG] {e}", flush=True)
+            return {"platform": "ig", "ok": False, "error": str(e), "creation_id": creation_id,
+                    "retryable": e.retryable}
+        except GraphAPIError as e:
+            print(f"❌ [IG] {e}", flush=True)
+            return {"platform": "ig", "ok": False, "error": str(e), "creation_id": creation_id,
+                    "retryable": e.retryable}
+        print(f"✅ [IG] 容器就緒（{self._clock() - started:.1f}s）", flush=True)
+
+        try:
+            res_publish = self.graph.post(f"{ig_id}/media_publish", data={
+                'creation_id': creation_id,
+                'access_token': access_token,
+            })
+        except GraphAPIError as e:
+            print(f"❌ [IG] 正式發布失敗: {e}", flush=True)
+            return {"platform": "ig", "ok": False, "error": str(e), "creation_id": creation_id,
+                    "retryable": e.retryable}
+
+        print(f"🎉 [IG] 貼文發布成功！ID: {res_publish['id']}", flush=True)
+        return {"platform": "ig", "ok": True, "id": res_publish['id'], "creation_id": creation_id}
+
+    # ---------------- 分派 ----------------
+    def _safe(self, fn, platform, *args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            # 非預期的例外無法判斷貼文是否已送出：不自動重試，FB 標記為結果未知
+            print(f"💥 [{platform.upper()}] API 呼叫異常: {str(e)}", flush=True)
+            return {"platform": platform, "ok": False, "error": str(e), "retryable": False,
+                    "unknown": platform == 'fb'}
+
+    def dispatch(self, platform, image_url, caption, credentials):
+        """
+        依平台發佈；sync 時 FB 與 IG 兩段併行執行。
+        credentials: {"fb_page_id", "fb_access_token", "ig_id", "ig_access_token"}
+        """
+        futures = []
+        if platform in ('fb', 'sync'):
+            futures.append(self._pool.submit(
+                self._safe, self.post_to_fb, 'fb',
+                credentials.get('fb_page_id'), credentials.get('fb_access_token'), image_url, caption,
+            ))
+        if platform in ('ig', 'sync'):
+            futures.append(self._pool.submit(
+                self._safe, self.post_to_ig, 'ig',
+                credentials.get('ig_id'), credentials.get('ig_access_token'), image_url, caption,
+            ))
+        return [f.result() for f in futures]
+
+
+publish_dispatcher = PublishDispatcher()
@@ -0,0 +1,264 @@
+import hashlib
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.extensions import db
+from app.platform_credentials import resolve_credentials
+from app.publish_dispatcher import publish_dispatcher
+
+# ============================================================
+# 發佈 Outbox：與貼文資料同一個 transaction 寫入，由分派器批次送出並重試
+# ============================================================
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 16))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 15))
+OUTBOX_RETRY_BASE = 30.0
+OUTBOX_RETRY_MAX = 3600.0
+# sending 狀態超過這個秒數仍未結束，視為行程中斷
+OUTBOX_STALE_SECONDS = float(os.getenv("OUTBOX_STALE_SECONDS", 900))
+
+PLATFORM_LEGS = {
+    'fb': ['fb'],
+    'facebook': ['fb'],
+    'ig': ['ig'],
+    'instagram': ['ig'],
+    'sync': ['fb', 'ig'],
+}
+
+
+def idempotency_key(content_id, platform):
+    return hashlib.sha256(f"{content_id}:{platform}".encode("utf-8")).hexdigest()
+
+
+def enqueue(content_id, tenant_id, platform, image_url, caption):
+    """在呼叫端的 transaction 內排入各平台的發佈工作（不 commit）"""
+    legs = PLATFORM_LEGS.get(platform, [])
+    for leg in legs:
+        db.session.execute(text("""
+            INSERT INTO publish_outbox
+                (content_id, tenant_id, platform, idempotency_key, image_url, caption,
+                 status, attempts, next_attempt_at, created_at)
+            VALUES
+                (:content_id, :tenant_id, :platform, :key, :image_url, :caption,
+                 'pending', 0, :now, :now)
+            ON CONFLICT (idempotency_key) DO NOTHING
+        """), {
+            "content_id": content_id,
+            "tenant_id": tenant_id,
+            "platform": leg,
+            "key": idempotency_key(content_id, leg),
+            "image_url": image_url,
+            "caption": caption,
+            "now": datetime.utcnow(),
+        })
+    return legs
+
+
+def retry_delay(attempts):
+    """指數退避 + full jitter"""
+    return random.uniform(OUTBOX_RETRY_BASE, min(OUTBOX_RETRY_BASE * (2 ** attempts), OUTBOX_RETRY_MAX))
+
+
+class OutboxDispatcher:
+    """
+    以 FOR UPDATE SKIP LOCKED 認領待送出的工作，多個 worker / 執行緒可同時消化積壓，
+    速率由 publish_dispatcher 的各粉專 token bucket 控制。
+    IG 容器建立後立即記下 provider_ref，中斷重試時沿用同一容器，不會重複發文；
+    FB 無法查詢是否已發出，中斷的 FB 工作標記為 unknown 而不自動重送。
+    """
+
+    def __init__(self, batch_size=OUTBOX_BATCH_SIZE, poll_seconds=OUTBOX_POLL_SECONDS):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._pool = ThreadPoolExecutor(max_workers=OUTBOX_WORKERS, thread_name_prefix="outbox")
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------------- 認領 / 結算 ----------------
+    def claim(self):
+        now = datetime.utcnow()
+        # 認領放在 CTE（只執行一次）；WHERE id IN (子查詢) 可能被 nested loop 逐列重跑而超過 LIMIT
+        rows = db.session.execute(text("""
+            WITH due AS (
+                SELECT id FROM publish_outbox
+                WHERE status = 'pending' AND next_attempt_at <= :now
+                ORDER BY next_attempt_at
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE publish_outbox AS o
+            SET status = 'sending', claimed_at = :now, attempts = o.attempts + 1
+            FROM due
+            WHERE o.id = due.id
+            RETURNING o.id, o.content_id, o.tenant_id, o.platform, o.image_url, o.caption, o.provider_ref, o.attempts
+        """), {"now": now, "limit": self.batch_size}).mappings().all()
+        db.session.commit()
+        return [dict(r) for r in rows]
+
+    def _save_provider_ref(self, job_id, creation_id):
+        db.session.execute(
+            text("UPDATE publish_outbox SET provider_ref = :ref WHERE id = :id"),
+            {"id": job_id, "ref": creation_id},
+        )
+        db.session.commit()
+
+    def _mark_sent(self, job, external_id):
+        db.session.execute(text("""
+            UPDATE publish_outbox
+            SET status = 'sent', external_id = :external_id, sent_at = :now, last_error = NULL
+            WHERE id = :id
+        """), {"id": job['id'], "external_id": external_id, "now": datetime.utcnow()})
+        db.session.execute(text("""
+            UPDATE marketing_content
+            SET external_post_ids = (
+                COALESCE(external_post_ids::jsonb, '{}'::jsonb) || jsonb_build_object(:platform, :external_id)
+            )::json
+            WHERE id = :content_id
+        """), {"content_id": job['content_id'], "platform": job['platform'], "external_id": external_id})
+        db.session.commit()
+
+    def _mark_failed(self, job, error, retryable):
+        if retryable and job['attempts'] < OUTBOX_MAX_ATTEMPTS:
+            delay = retry_delay(job['attempts'])
+            status, next_at = 'pending', datetime.utcnow() + timedelta(seconds=delay)
+            print(f"🔁 [Outbox] #{job['id']} {job['platform'].upper()} 第 {job['attempts']} 次失敗，"
+                  f"{delay:.0f}s 後重試: {error}", flush=True)
+        else:
+            status, next_at = 'dead', datetime.utcnow()
+            print(f"☠️ [Outbox] #{job['id']} {job['platform'].upper()} 放棄重試: {error}", flush=True)
+        db.session.execute(text("""
+            UPDATE publish_outbox
+            SET status = :status, next_attempt_at = :next_at, last_error = :error
+            WHERE id = :id
+        """), {"id": job['id'], "status": status, "next_at": next_at, "error": str(error)})
+        db.session.commit()
+
+    def _mark_unknown(self, job, error):
+        """FB 送出後結果不明：不自動重送，留待人工確認是否已發出"""
+        print(f"❓ [Outbox] #{job['id']} {job['platform'].upper()} 發佈結果未知，待人工確認: {error}", flush=True)
+        db.session.execute(text("""
+            UPDATE publish_outbox
+            SET status = 'unknown', next_attempt_at = :now, last_error = :error
+            WHERE id = :id
+        """), {"id": job['id'], "now": datetime.utcnow(), "error": str(error)})
+        db.session.commit()
+
+    def recover_stale(self):
+        """中斷在 sending 的工作：IG 可安全重試（沿用容器），FB 標記 unknown 待人工確認"""
+        cutoff = datetime.utcnow() - timedelta(seconds=OUTBOX_STALE_SECONDS)
+        result = db.session.execute(text("""
+            UPDATE publish_outbox
+            SET status = CASE WHEN platform = 'ig' THEN 'pending' ELSE 'unknown' END,
+                next_attempt_at = :now,
+                last_error = '發佈過程中斷'
+            WHERE status = 'sending' AND claimed_at < :cutoff
+        """), {"now": datetime.utcnow(), "cutoff": cutoff})
+        db.session.commit()
+        if result.rowcount:
+            print(f"⚠️ [Outbox] 回收 {result.rowcount} 筆中斷的發佈工作", flush=True)
+
+    # ---------------- 送出 ----------------
+    def _send(self, app, job):
+        with app.app_context():
+            try:
+                credentials = resolve_credentials(job['tenant_id'])
+            except Exception as e:
+                # 尚未呼叫 Graph API，可安全重試
+                db.session.rollback()
+                credentials = None
+                result = {"ok": False, "error": str(e), "retryable": True}
+
+            if credentials is not None:
+                try:
+                    if job['platform'] == 'fb':
+                        result = publish_dispatcher.post_to_fb(
+                            credentials.get('fb_page_id'), credentials.get('fb_access_token'),
+                            job['image_url'], job['caption'],
+                        )
+                    else:
+                        result = publish_dispatcher.post_to_ig(
+                            credentials.get('ig_id'), credentials.get('ig_access_token'),
+                            job['image_url'], job['caption'],
+                            creation_id=job['provider_ref'],
+                            on_container=lambda cid: self._save_provider_ref(job['id'], cid),
+                        )
+                except Exception as e:
+                    # 只有已知的暫時性錯誤才重試；非預期例外無法確定是否已發出，FB 與 recover_stale 一樣標記 unknown
+                    db.session.rollback()
+                    result = {"ok": False, "error": str(e), "retryable": False, "unknown": job['platform'] == 'fb'}
+
+            try:
+                if result.get('ok'):
+                    self._mark_sent(job, result['id'])
+                elif result.get('unknown'):
+                    self._mark_unknown(job, result.get('error'))
+                else:
+                    self._mark_failed(job, result.get('error'), result.get('retryable', False))
+            except Exception as e:
+                # 結算失敗時保持 sending，交給 recover_stale 處理
+                db.session.rollback()
+                print(f"❌ [Outbox] #{job['id']} 狀態更新失敗: {e}", flush=True)
+            return result
+
+    def drain(self, app):
+        """持續認領並送出到期工作，直到沒有為止；回傳處理筆數"""
+        total = 0
+        while True:
+            with app.app_context():
+                jobs = self.claim()
+            if not jobs:
+                return total
+            futures = [self._pool.submit(self._send, app, job) for job in jobs]
+            for f in futures:
+                f.result()
+            total += len(jobs)
+            if len(jobs) < self.batch_size:
+                return total
+
+    # ---------------- 背景輪詢（重試與行程重啟後的補送） ----------------
+    def _seconds_until_next(self, app):
+        with app.app_context():
+            due = db.session.execute(text(
+                "SELECT min(next_attempt_at) FROM publish_outbox WHERE status = 'pending'"
+            )).scalar()
+        if due is None:
+            return self.poll_seconds
+        return max(0.0, min(self.poll_seconds, (due - datetime.utcnow()).total_seconds()))
+
+    def _loop(self, app):
+        print(f"📮 [Outbox] 發佈分派器啟動（每 {self.poll_seconds:.0f}s 檢查）", flush=True)
+        while not self._stop.is_set():
+            try:
+                with app.app_context():
+                    self.recover_stale()
+                self.drain(app)
+                wait = self._seconds_until_next(app)
+            except Exception as e:
+                print(f"❌ [Outbox] 輪詢失敗: {e}", flush=True)
+                wait = self.poll_seconds
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+    def start(self, app):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(app,), name="publish-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def notify(self):
+        self._wakeup.set()
+
+
+outbox_dispatcher = OutboxDispatcher()
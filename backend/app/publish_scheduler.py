@@ -0,0 +1,179 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text
+
+from app.extensions import db
+
+# ============================================================
+# 排程發佈：以 (scheduled_at) 部分索引輪詢到期貼文，批次交給既有發佈流程
+# ============================================================
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", 30))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", 50))
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", 8))
+# publishing 狀態超過這個秒數仍未結束，視為行程中斷
+SCHEDULER_STALE_SECONDS = float(os.getenv("SCHEDULER_STALE_SECONDS", 300))
+
+LOCAL_TZ = ZoneInfo("Asia/Taipei")
+
+# 尖峰時段（台灣時間）
+PEAK_SLOTS = {
+    "morning": time(7, 30),
+    "lunch": time(11, 30),
+    "after_school": time(16, 0),
+    "evening": time(19, 30),
+}
+DEFAULT_SLOT = "lunch"
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """未帶時區的時間視為台灣時間；資料庫一律存 UTC（naive）"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=LOCAL_TZ)
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def slot_datetime(day, slot=DEFAULT_SLOT) -> datetime:
+    """某日的尖峰時段 → UTC"""
+    if slot not in PEAK_SLOTS:
+        raise ValueError(f"未知的時段: {slot}（可用: {', '.join(PEAK_SLOTS)}）")
+    return to_utc_naive(datetime.combine(day, PEAK_SLOTS[slot]))
+
+
+class PublishScheduler:
+    """
+    到期判斷只走 ix_scheduled_post_due（WHERE status = 'pending' 的部分索引），
+    每批以 FOR UPDATE SKIP LOCKED 認領並改成 publishing 後 commit，多個 gunicorn worker 同時輪詢也不會撿到同一筆。
+    貼文寫入、排入發佈 outbox 與標記 published 在同一個 transaction 內完成，
+    因此中斷在 publishing 的貼文必定尚未排入 outbox，可安全地放回 pending 重新處理。
+    """
+
+    def __init__(self, poll_seconds=SCHEDULER_POLL_SECONDS, batch_size=SCHEDULER_BATCH_SIZE):
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = ThreadPoolExecutor(max_workers=SCHEDULER_WORKERS, thread_name_prefix="scheduled")
+
+    # ---------------- 認領 / 結算 ----------------
+    def claim_due(self, now=None):
+        now = now or datetime.utcnow()
+        # 認領的子查詢放在 CTE：寫成 WHERE id IN (...) 時，planner 可能選擇 nested loop 逐列重跑子查詢，
+        # 已被本次 UPDATE 改過的列會被 SKIP LOCKED 略過，LIMIT 便失效（統計資料顯示空表時整張表都會被認領）
+        rows = db.session.execute(text("""
+            WITH due AS (
+                SELECT id FROM scheduled_post
+                WHERE status = 'pending' AND scheduled_at <= :now
+                ORDER BY scheduled_at
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE scheduled_post AS p SET status = 'publishing', claimed_at = :now
+            FROM due
+            WHERE p.id = due.id
+            RETURNING p.id, p.store_id, p.product_name, p.caption, p.image_key, p.platform
+        """), {"now": now, "limit": self.batch_size}).mappings().all()
+        db.session.commit()
+        return [dict(r) for r in rows]
+
+    def mark(self, post_id, status, error=None):
+        """不 commit：與貼文寫入共用同一個 transaction"""
+        db.session.execute(text("""
+            UPDATE scheduled_post
+            SET status = :status, published_at = :now, last_error = :error
+            WHERE id = :id AND status = 'publishing'
+        """), {"id": post_id, "status": status, "now": datetime.utcnow(), "error": error})
+
+    def expire_stale(self, now=None):
+        now = now or datetime.utcnow()
+        result = db.session.execute(text("""
+            UPDATE scheduled_post
+            SET status = 'pending', claimed_at = NULL
+            WHERE status = 'publishing' AND claimed_at < :cutoff
+        """), {"cutoff": now - timedelta(seconds=SCHEDULER_STALE_SECONDS)})
+        db.session.commit()
+        if result.rowcount:
+            print(f"⚠️ [Scheduler] {result.rowcount} 筆排程發佈中斷，已放回待發佈", flush=True)
+
+    def next_due(self):
+        return db.session.execute(text(
+            "SELECT min(scheduled_at) FROM scheduled_post WHERE status = 'pending'"
+        )).scalar()
+
+    # ---------------- 執行 ----------------
+    def _publish_one(self, app, post):
+        from app.publish_workflow import external_url_for, publish_for_store
+        with app.app_context():
+            try:
+                publish_for_store(
+                    post['product_name'], post['caption'], external_url_for(post['image_key']),
+                    post['store_id'], post['platform'],
+                )
+                self.mark(post['id'], 'published')
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ [Scheduler] 排程 #{post['id']} 失敗: {e}", flush=True)
+                self.mark(post['id'], 'failed', str(e))
+                db.session.commit()
+
+    def run_once(self, app):
+        """認領一批到期貼文，寫入貼文並排入發佈 outbox，回傳處理筆數"""
+        from app.publish_outbox import outbox_dispatcher
+        with app.app_context():
+            posts = self.claim_due()
+        if not posts:
+            return 0
+        print(f"⏰ [Scheduler] 發佈 {len(posts)} 筆到期貼文", flush=True)
+        futures = [self._pool.submit(self._publish_one, app, post) for post in posts]
+        for f in futures:
+            f.result()
+        outbox_dispatcher.drain(app)
+        return len(posts)
+
+    def _seconds_until_next(self, app):
+        with app.app_context():
+            due = self.next_due()
+        if due is None:
+            return self.poll_seconds
+        return max(0.0, min(self.poll_seconds, (due - datetime.utcnow()).total_seconds()))
+
+    def _loop(self, app):
+        print(f"⏰ [Scheduler] 排程發佈服務啟動（每 {self.poll_seconds:.0f}s 檢查）", flush=True)
+        with app.app_context():
+            self.expire_stale()
+        while not self._stop.is_set():
+            try:
+                # 一批剛好滿載代表可能還有到期貼文，直接處理下一批
+                while self.run_once(app) >= self.batch_size:
+                    pass
+                with app.app_context():
+                    self.expire_stale()
+                wait = self._seconds_until_next(app)
+            except Exception as e:
+                print(f"❌ [Scheduler] 輪詢失敗: {e}", flush=True)
+                wait = self.poll_seconds
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+    def start(self, app):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(app,), name="publish-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def notify(self):
+        """新排程的時間可能早於目前的等待時間，喚醒排程器重新計算"""
+        self._wakeup.set()
+
+
+publish_scheduler = PublishScheduler()
@@ -1,158 +1,141 @@
-import os
-import io
-import time
-import json
-import requests
+import re
+import base64
 from datetime import datetime, timezone
-from minio import Minio
 from app import db 
+from app.publish_outbox import enqueue, outbox_dispatcher
+from app.storage import extension_for, post_store, variant_store, upload_store, InvalidUpload
 
-# --- 環境變數讀取 ---
-IG_ID = os.getenv("IG_ID")
-
-IG_ACCESS_TOKEN = os.getenv("IG_ACCESS_TOKEN")
-
-FB_PAGE_ID = os.getenv("FB_PAGE_ID")
-FB_ACCESS_TOKEN = os.getenv("FB_ACCESS_TOKEN")
-
-GRAPH_URL = os.getenv("IG_GRAPH_URL", "https://graph.facebook.com/v25.0")
-
-# MinIO 連線資訊
-minio_client = Minio(
-    os.getenv("MINIO_ENDPOINT", "minio:9000"),
-    access_key=os.getenv("MINIO_ROOT_USER"),
-    secret_key=os.getenv("MINIO_ROOT_PASSWORD"),
-    secure=False
-)
-
-def auto_post_to_fb(image_url, caption):
-    """Facebook Page 發佈邏輯 (透過 URL 抓取)"""
-    try:
-        print(f"📘 [FB] 開始發佈貼文至粉絲專頁，圖片 URL: {image_url}", flush=True)
-        # FB 發佈圖片貼文的端點
-        publish_url = f"{GRAPH_URL}/{FB_PAGE_ID}/photos"
-        
-        payload = {
-            'url': image_url,
-            'caption': caption,
-            'access_token': FB_ACCESS_TOKEN
-        }
-        
-        res_publish = requests.post(publish_url, data=payload).json()
-        
-        if 'id' in res_publish:
-            print(f"🎉 [FB] 貼文發布成功！ID: {res_publish['id']}", flush=True)
-        else:
-            print(f"❌ [FB] 發布失敗: {res_publish}", flush=True)
-    except Exception as e:
-        print(f"💥 [FB] API 呼叫異常: {str(e)}", flush=True)
-
-def auto_post_to_ig(image_url, caption):
-    """Instagram 發佈邏輯"""
-    try:
-        print(f"📸 [IG] 開始建立媒體容器，URL: {image_url}", flush=True)
-        container_url = f"{GRAPH_URL}/{IG_ID}/media"
-        payload = {'image_url': image_url, 'caption': caption, 'access_token': IG_ACCESS_TOKEN}
-        
-        res_container = requests.post(container_url, data=payload).json()
-        if 'id' not in res_container:
-            print(f"❌ [IG] 容器建立失敗: {res_container}", flush=True)
-            return
+POST_PREFIX = "posts"
 
-        creation_id = res_container['id']
-        print(f"⏳ [IG] 容器 ID: {creation_id}，等待 15 秒讓 Meta 處理...", flush=True)
-        time.sleep(15) 
-
-        publish_url = f"{GRAPH_URL}/{IG_ID}/media_publish"
-        res_publish = requests.post(publish_url, data={'creation_id': creation_id, 'access_token': IG_ACCESS_TOKEN}).json()
-        
-        if 'id' in res_publish:
-            print(f"🎉 [IG] 貼文發布成功！ID: {res_publish['id']}", flush=True)
-        else:
-            print(f"❌ [IG] 正式發布失敗: {res_publish}", flush=True)
-    except Exception as e:
-        print(f"💥 [IG] API 呼叫異常: {str(e)}", flush=True)
-
-def ensure_bucket_exists(bucket_name):
-    """確保 MinIO Bucket 存在並設定為公開讀取"""
-    try:
-        if not minio_client.bucket_exists(bucket_name):
-            print(f"🪣 [MinIO] 建立儲存桶: {bucket_name}", flush=True)
-            minio_client.make_bucket(bucket_name)
-            
-            policy = {
-                "Version": "2012-10-17",
-                "Statement": [{
-                    "Effect": "Allow",
-                    "Principal": {"AWS": ["*"]},
-                    "Action": ["s3:GetBucketLocation", "s3:ListBucket"],
-                    "Resource": [f"arn:aws:s3:::{bucket_name}"]
-                }, {
-                    "Effect": "Allow",
-                    "Principal": {"AWS": ["*"]},
-                    "Action": ["s3:GetObject"],
-                    "Resource": [f"arn:aws:s3:::{bucket_name}/*"]
-                }]
-            }
-            minio_client.set_bucket_policy(bucket_name, json.dumps(policy))
-            print(f"✅ [MinIO] {bucket_name} 已設定公開權限", flush=True)
-    except Exception as e:
-        print(f"⚠️ [MinIO] 檢查/建立儲存桶失敗: {str(e)}", flush=True)
+# 可被引用發佈的既有物件：生成方案圖（/api/content/variants/...）、先前發佈過的貼文圖，
+# 或以預簽章網址直接上傳到私有暫存 bucket 的檔案（uploads/...，見 /api/content/upload-url）
+VARIANT_REF_PATTERN = re.compile(r"(?:^|/)variants/([0-9a-f]{64}\.png)$")
+POST_REF_PATTERN = re.compile(r"(?:^|/)posts/([0-9a-f]{64}\.(?:png|jpg|webp|gif))$")
+UPLOAD_REF_PATTERN = re.compile(r"(?:^|/)(uploads/[0-9a-f]{32}\.(png|jpg|webp|gif))$")
+
+class InvalidImageReference(ValueError):
+    """image_ref 不是可發佈的既有物件"""
+
+
+def stage_upload(stream, content_type):
+    """multipart 上傳：串流雜湊後分段寫入 MinIO，記憶體用量與圖片大小無關"""
+    return post_store.put_stream(stream, prefix=POST_PREFIX, ext=extension_for(content_type),
+                                 content_type=content_type or "image/png")
 
-def run_workflow(app, product_name, caption, image_binary_data, store_id, platform):
-    """完整發佈流程 (支援 FB, IG, Sync)"""
+
+def stage_reference(image_ref):
+    """引用已在儲存空間中的物件；方案圖以伺服器端複製搬到公開 bucket，bytes 不經過後端"""
+    ref = (image_ref or "").split("?", 1)[0]
+    match = POST_REF_PATTERN.search(ref)
+    if match:
+        key = f"{POST_PREFIX}/{match.group(1)}"
+        if not post_store.exists(key):
+            raise InvalidImageReference(f"找不到圖片: {image_ref}")
+        return key, False
+
+    match = UPLOAD_REF_PATTERN.search(ref)
+    if match:
+        if not upload_store.exists(match.group(1)):
+            raise InvalidImageReference(f"找不到圖片: {image_ref}")
+        try:
+            return post_store.adopt(upload_store, match.group(1), prefix=POST_PREFIX)
+        except InvalidUpload as e:
+            raise InvalidImageReference(str(e))
+
+    match = VARIANT_REF_PATTERN.search(ref)
+    if not match:
+        raise InvalidImageReference(f"無效的圖片引用: {image_ref}")
+    from app.image_dedup import VARIANT_PREFIX
+    source_key = f"{VARIANT_PREFIX}/{match.group(1)}"
+    if not variant_store.exists(source_key):
+        raise InvalidImageReference(f"找不到圖片: {image_ref}")
+    return post_store.copy_from(variant_store, source_key, prefix=POST_PREFIX)
+
+
+def stage_base64(image_base64):
+    """舊版 JSON base64 上傳，保留給尚未更新的前端"""
+    if "base64," in image_base64:
+        image_base64 = image_base64.split("base64,")[1]
+    return post_store.put_bytes(base64.b64decode(image_base64), prefix=POST_PREFIX, ext="png")
+
+
+def external_url_for(key):
+    """外部連結 (讓 Meta 伺服器可以抓到圖)"""
+    return post_store.public_url(key)
+
+
+def publish_for_store(product_name, caption, external_url, store_id, platform):
+    """
+    寫入 MarketingContent / ContentImage，並在同一個 transaction 內排入發佈 outbox；
+    不 commit，由呼叫端決定交易邊界。需在 app context 內呼叫，回傳 MarketingContent。
+    """
+    from app.models import MarketingContent, ContentImage, Store
+    new_content = MarketingContent(
+        store_id=store_id,
+        final_text=caption,
+        product_name=product_name,
+        platform=platform,
+        created_at=datetime.now(timezone.utc)
+    )
+    db.session.add(new_content)
+    db.session.flush()
+
+    new_image = ContentImage(
+        content_id=new_content.id,
+        minio_url=external_url,
+    )
+    db.session.add(new_image)
+
+    # 發佈工作以門市所屬 tenant 的憑證送出（見 publish_outbox）
+    tenant_id = Store.query.get(store_id).tenant_id
+    legs = enqueue(new_content.id, tenant_id, platform, external_url, caption)
+    if not legs:
+        print(f"⚠️ [Workflow] 未知的發佈平台: {platform}，僅儲存貼文", flush=True)
+    return new_content
+
+
+def run_workflow(app, product_name, caption, image_key, store_id, platform):
+    """
+    完整發佈流程 (支援 FB, IG, Sync)
+    image_key 為已寫入 POST_BUCKET 的物件（見 stage_upload / stage_reference / stage_base64），
+    背景執行緒只傳遞 key，不再持有整張圖片。
+    """
     with app.app_context():
         try:
             print(f"🚀 [Workflow] 啟動流程: {product_name} (平台: {platform})", flush=True)
-            
-            # 1. 確保並上傳至 MinIO
-            bucket_name = "tea-master-images"
-            ensure_bucket_exists(bucket_name)
-            
-            file_name = f"post_{int(time.time())}.png"
-            minio_client.put_object(
-                bucket_name,
-                file_name,
-                io.BytesIO(image_binary_data),
-                length=len(image_binary_data),
-                content_type='image/png'
-            )
-            
-            internal_url = f"http://{os.getenv('MINIO_ENDPOINT')}/{bucket_name}/{file_name}"
-            print(f"✅ [Workflow] MinIO 上傳成功: {internal_url}", flush=True)
-
-            # 2. 轉換為外部連結 (讓 Meta 伺服器可以抓到圖)
-            external_url = internal_url.replace("minio:9000", os.getenv("EXTERNAL_DOMAIN"))
-            if not external_url.startswith("https://"):
-                external_url = external_url.replace("http://", "https://")
-
-            # 3. 存入資料庫
-            from app.models import MarketingContent, ContentImage
-            new_content = MarketingContent(
-                store_id=store_id,
-                final_text=caption,
-                product_name=product_name,
-                platform=platform,
-                created_at=datetime.now(timezone.utc)
-            )
-            db.session.add(new_content)
-            db.session.flush()
-
-            new_image = ContentImage(
-                content_id=new_content.id,
-                minio_url=external_url,
-            )
-            db.session.add(new_image)
+            content = publish_for_store(product_name, caption, external_url_for(image_key), store_id, platform)
             db.session.commit()
-            print("✅ [Workflow] 資料庫寫入成功", flush=True)
+            print(f"✅ [Workflow] 資料庫寫入成功，已排入發佈 (content {content.id})", flush=True)
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ [Workflow] 執行失敗: {str(e)}", flush=True)
+            return
+
+    # 立即送出；失敗的工作留在 outbox 由背景分派器重試
+    outbox_dispatcher.drain(app)
 
-            # 4. 根據平台執行發布
-            if platform in ['fb', 'sync']:
-                auto_post_to_fb(external_url, caption)
-                
-            if platform in ['ig', 'sync']:
-                auto_post_to_ig(external_url, caption)
 
+def run_fanout(app, product_name, caption, image_key, store_ids, platform):
+    """
+    同一則活動發佈到多個品牌的粉專：所有門市的貼文與 outbox 工作在同一個 transaction 寫入，
+    再由 outbox 分派器併行送出（每個門市使用自己 tenant 的憑證、各粉專各自限速）。
+    回傳 {store_id: content_id}。
+    """
+    external_url = external_url_for(image_key)
+    print(f"📣 [Fanout] {product_name} → {len(store_ids)} 個門市 (平台: {platform})", flush=True)
+
+    with app.app_context():
+        try:
+            outcome = {
+                store_id: publish_for_store(product_name, caption, external_url, store_id, platform).id
+                for store_id in store_ids
+            }
+            db.session.commit()
         except Exception as e:
             db.session.rollback()
-            print(f"❌ [Workflow] 執行失敗: {str(e)}", flush=True)
\ No newline at end of file
+            print(f"❌ [Fanout] 執行失敗: {str(e)}", flush=True)
+            return {}
+
+    sent = outbox_dispatcher.drain(app)
+    print(f"🏁 [Fanout] 已排入 {len(outcome)} 則貼文，本輪送出 {sent} 個發佈工作", flush=True)
+    return outcome
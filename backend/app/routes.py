@@ -1,35 +1,52 @@
-from flask import jsonify, request, make_response, current_app
+from flask import jsonify, request, make_response, current_app, redirect
 from app.models import (
     db, Product, Tenant, MarketingContent, Users, Store,
     Ingredient, PlatformToken, ContentImage, WeatherForecast, HolidayCalendar,
-    ExternalTrends
+    ExternalTrends, ScheduledPost, CrawlRun, CrawlState, FruitWatchlist
 )
-from app.image_flow import process_image_generation
+from app.image_flow import process_image_generation, VARIANT_COUNT
 from app.AI_services import run_generation_pipeline
 from datetime import datetime, timezone, timedelta, date
-from app.publish_workflow import run_workflow, auto_post_to_ig
+from app.publish_workflow import (
+    run_workflow, run_fanout, stage_upload, stage_reference, stage_base64, InvalidImageReference
+)
+from app.platform_credentials import invalidate_credentials, require_connected, PlatformNotConnected
+from app.publish_outbox import PLATFORM_LEGS
+from app.publish_scheduler import publish_scheduler, to_utc_naive, slot_datetime, DEFAULT_SLOT
+from app.graph_client import graph_client, GraphAPIError
+from app.image_dedup import dhash, source_image_index, store_variant_images, variant_url, VARIANT_PREFIX
+from app.prompt_plan_cache import context_fingerprint, invalidate_prompt_plan
+from app.idempotency import idempotent
+from app.price_analytics import latest_rollups, rollup_series
+from app.storage import (
+    storage_backend, variant_store, post_store, upload_store, extension_for, ObjectNotFound,
+    IMMUTABLE_CACHE_CONTROL, PRIVATE_CACHE_CONTROL,
+)
 import os
+import re
 import jwt
 import uuid
 import io
 import json
-import requests
-import base64
 import threading
 from PIL import Image as PILImage
 
 
 SECRET_KEY = os.getenv("MY_APP_SECRET_KEY", "your_fallback_key")
 
+# 平台管理者（可跨品牌發佈），以逗號分隔的 email 清單
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
 # 全域 task store（in-memory，足夠此規模使用）
 generation_tasks = {}
 
+# 方案圖改以 302 導向 MinIO 預簽章網址讀取，圖片 bytes 不經過 gunicorn worker
+STORAGE_REDIRECT_READS = os.getenv("STORAGE_REDIRECT_READS", "false").lower() == "true"
+
 # Task 清理閾值（秒）
 TASK_EXPIRY_SECONDS = 300  # 5 分鐘
 
 def register_routes(app):
-    from app import minio_client, BUCKET_NAME
-
     # ==========================================
     # Health check
     # ==========================================
@@ -314,10 +331,55 @@ def register_routes(app):
             print(f"Ingredient Matrix Fetch Error: {e}")
             return jsonify({"status": "error", "message": "無法讀取採購矩陣資料"}), 500
 
+    @app.route('/api/ingredients/analytics', methods=['GET'])
+    def get_ingredient_analytics():
+        """ 各水果最新一天的價格指標（移動平均 / 波動度 / 百分位買賣區間）與買賣訊號，讀取預先計算的 price_rollup """
+        token = request.cookies.get('access_token')
+        if not token:
+            return jsonify({"status": "error", "message": "請先登入"}), 401
+        try:
+            jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        except Exception:
+            return jsonify({"status": "error", "message": "認證失效，請重新登入"}), 401
+
+        return jsonify({"status": "success", "data": latest_rollups(db.session)})
+
+    @app.route('/api/ingredients/<int:ingredient_id>/analytics', methods=['GET'])
+    def get_ingredient_price_series(ingredient_id):
+        """ 單一水果最近 days 天（預設 180，最多 3650）的每日指標、季節指數與採購矩陣 """
+        token = request.cookies.get('access_token')
+        if not token:
+            return jsonify({"status": "error", "message": "請先登入"}), 401
+        try:
+            jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        except Exception:
+            return jsonify({"status": "error", "message": "認證失效，請重新登入"}), 401
+
+        try:
+            days = min(max(int(request.args.get('days', 180)), 1), 3650)
+        except ValueError:
+            return jsonify({"status": "error", "message": "days 格式錯誤"}), 400
+
+        ingredient = Ingredient.query.get(ingredient_id)
+        if not ingredient:
+            return jsonify({"status": "error", "message": "找不到此原物料"}), 404
+
+        return jsonify({
+            "status": "success",
+            "data": {
+                "ingredient_id": ingredient.id,
+                "name": ingredient.name,
+                "seasonal_index": ingredient.seasonal_index,
+                "monthly_status_matrix": ingredient.monthly_status_matrix,
+                "series": rollup_series(db.session, ingredient.id, days),
+            },
+        })
+
     # ==========================================
     # AI Content Generation API
     # ==========================================
     @app.route('/api/generate_post', methods=['POST'])
+    @idempotent
     def handle_generate_post():
         token = request.cookies.get('access_token')
         if not token:
@@ -433,6 +495,7 @@ def register_routes(app):
     image_generation_tasks = {}
 
     @app.route('/api/upload_and_generate', methods=['POST'])
+    @idempotent
     def upload_and_generate_route():
         """ 改良版：支持一次產出三張圖的非同步任務 """
         if 'file' not in request.files:
@@ -443,21 +506,91 @@ def register_routes(app):
         copywriting = request.form.get('copywriting', '')
         weather = request.form.get('weather', '')
         festival = request.form.get('festival', '')
+        regenerate = request.form.get('regenerate', '').lower() in ('1', 'true', 'yes')
+
+        # 登入狀態為選填：有 tenant 才能啟用來源圖片去重
+        tenant_id = None
+        token = request.cookies.get('access_token')
+        if token:
+            try:
+                decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+                store = Store.query.get(decoded.get("store"))
+                tenant_id = store.tenant_id if store else None
+            except Exception:
+                tenant_id = None
 
         try:
             img_data = file.read()
             pil_img = PILImage.open(io.BytesIO(img_data)).convert("RGB")
 
+            image_hash = dhash(pil_img)
+            context_fp = context_fingerprint(product_name, copywriting, weather, festival)
+
             task_id = str(uuid.uuid4())
+
+            # 使用者要求重新生成：捨棄此情境快取的提示詞方案，重新走策略分析與提示詞撰寫
+            if regenerate:
+                invalidate_prompt_plan(context_fp)
+
+            # 同一張產品照 + 相同文案情境：直接提供既有的生成結果，除非前端要求重新生成
+            if tenant_id and not regenerate:
+                match = source_image_index.find(tenant_id, product_name, context_fp, image_hash)
+                if match:
+                    image_generation_tasks[task_id] = {
+                        "status": "success",
+                        "images": [variant_url(k) for k in match["variant_keys"]],
+                        "error": None,
+                        "deduplicated": True,
+                        "source_match": {
+                            "distance": match["distance"],
+                            "created_at": match["created_at"].isoformat() if match["created_at"] else None,
+                        },
+                        "created_at": datetime.now(timezone.utc)
+                    }
+                    return jsonify({
+                        "status": "pending",
+                        "task_id": task_id,
+                        "deduplicated": True,
+                        "message": "偵測到相同的產品照片與文案，已提供先前生成的方案（可選擇重新生成）"
+                    })
+
             # 修改點 1：初始化任務狀態，將儲存欄位改為複數型態 images
+            # variants 只記錄每一張圖的狀態（不含圖片，輪詢回應不重複傳送 Base64），
+            # images 依方案順序放已完成的圖，variants[i]["image_index"] 指向其位置
             image_generation_tasks[task_id] = {
                 "status": "processing",
                 "images": [], # 這裡改為空清單
+                "variants": [
+                    {"index": i, "status": "pending", "image_index": None, "error": None}
+                    for i in range(VARIANT_COUNT)
+                ],
+                "completed": 0,
+                "total": VARIANT_COUNT,
                 "error": None,
                 "created_at": datetime.now(timezone.utc)
             }
 
+            app_instance = current_app._get_current_object()
+
             def run_async_image_flow(t_id, p_name, p_copy, p_weather, p_fest, p_img):
+                task = image_generation_tasks[t_id]
+                finished = {}  # 方案 index → Base64
+
+                def on_variant(index, status, image=None, error=None):
+                    """每張圖完成就寫入任務狀態，前端輪詢可先拿到部分結果"""
+                    if status == "success":
+                        finished[index] = image
+                    order = sorted(finished)
+                    variants = [dict(v) for v in task["variants"]]
+                    variants[index].update({"status": status, "error": error})
+                    for v in variants:
+                        v["image_index"] = order.index(v["index"]) if v["index"] in finished else None
+                    task.update({
+                        "variants": variants,
+                        "images": [finished[i] for i in order],
+                        "completed": sum(1 for v in variants if v["status"] in ("success", "error")),
+                    })
+
                 try:
                     # 執行 Flow，現在會回傳 List[str]
                     generated_images_list = process_image_generation(
@@ -465,7 +598,8 @@ def register_routes(app):
                         copywriting=p_copy,
                         weather=p_weather,
                         festival=p_fest,
-                        pil_image=p_img
+                        pil_image=p_img,
+                        on_variant=on_variant
                     )
                     
                     # 修改點 2：檢查清單是否有效
@@ -474,6 +608,8 @@ def register_routes(app):
                             "status": "success",
                             "images": generated_images_list # 儲存完整的 Base64 清單
                         })
+                        if tenant_id:
+                            register_generated_variants(p_name, generated_images_list)
                     else:
                         image_generation_tasks[t_id].update({
                             "status": "error",
@@ -485,6 +621,16 @@ def register_routes(app):
                         "error": str(e)
                     })
 
+            def register_generated_variants(p_name, images):
+                """存下生成結果並登錄來源圖片指紋，失敗不影響任務結果"""
+                with app_instance.app_context():
+                    try:
+                        keys = store_variant_images(images)
+                        source_image_index.record(tenant_id, p_name, context_fp, image_hash, keys)
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"⚠️ 來源圖片指紋登錄失敗: {e}")
+
             thread = threading.Thread(
                 target=run_async_image_flow,
                 args=(task_id, product_name, copywriting, weather, festival, pil_img)
@@ -509,12 +655,107 @@ def register_routes(app):
         if not task:
             return jsonify({"status": "error", "message": "找不到此任務"}), 404
         
-        # 確保這裡回傳的是 images
-        return jsonify(task)
+        # 確保這裡回傳的是 images；處理中也會回傳已完成的部分方案
+        return jsonify({
+            **task,
+            "partial": task.get("status") == "processing" and bool(task.get("images")),
+        })
+
+    @app.route('/api/content/variants/<string:filename>', methods=['GET'])
+    def get_variant_image(filename):
+        """ 讀取已生成的方案圖（以內容雜湊命名，可長期快取；僅限登入者，瀏覽器私有快取） """
+        token = request.cookies.get('access_token')
+        if not token:
+            return jsonify({"status": "error", "message": "請先登入"}), 401
+        try:
+            jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        except Exception:
+            return jsonify({"status": "error", "message": "認證失效"}), 401
+
+        if not re.fullmatch(r"[0-9a-f]{64}\.png", filename):
+            return jsonify({"status": "error", "message": "無效的圖片名稱"}), 400
+        key = f"{VARIANT_PREFIX}/{filename}"
+        if STORAGE_REDIRECT_READS and storage_backend.name == "minio":
+            resp = redirect(variant_store.presigned_get(key, cache_control=PRIVATE_CACHE_CONTROL), code=302)
+            resp.headers["Cache-Control"] = "private, max-age=600"
+            return resp
+        try:
+            chunks = variant_store.open(key)
+        except ObjectNotFound:
+            return jsonify({"status": "error", "message": "找不到此圖片"}), 404
+
+        resp = current_app.response_class(chunks, mimetype="image/png")
+        # 需登入才能讀取，不可讓共用快取（CDN / proxy）保存
+        resp.headers["Cache-Control"] = PRIVATE_CACHE_CONTROL
+        return resp
+
+    @app.route('/api/content/upload-url', methods=['POST'])
+    def create_upload_url():
+        """ 發給前端預簽章 PUT 網址，大圖直接上傳至儲存空間；發佈時以 image_ref 引用回傳的 key """
+        token = request.cookies.get('access_token')
+        if not token:
+            return jsonify({"status": "error", "message": "請先登入"}), 401
+        try:
+            jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        except Exception:
+            return jsonify({"status": "error", "message": "認證失效"}), 401
+
+        data = request.get_json(silent=True) or {}
+        key = upload_store.staging_key(extension_for(data.get('content_type')))
+        return jsonify({
+            "status": "success",
+            "key": key,
+            "upload_url": upload_store.presigned_put(key),
+            "method": "PUT",
+        })
+
+    if storage_backend.name == "local":
+        @app.route(f'{storage_backend.route_prefix}/<string:bucket>/<path:key>', methods=['GET', 'PUT'])
+        def local_storage_object(bucket, key):
+            """ 本地儲存後端：驗證預簽章後讀寫檔案（公開 bucket 的 GET 不需簽章；暫存上傳在私有 bucket） """
+            public = bucket == post_store.bucket and request.method == 'GET'
+            if not public and not storage_backend.verify(
+                request.method, bucket, key, request.args.get('expires'), request.args.get('signature')
+            ):
+                return jsonify({"status": "error", "message": "簽章無效或已過期"}), 403
+            try:
+                if request.method == 'PUT':
+                    storage_backend.ensure_bucket(bucket)
+                    storage_backend.put(bucket, key, request.stream, request.content_length,
+                                        request.content_type)
+                    return "", 200
+                chunks = storage_backend.open(bucket, key)
+            except ValueError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+            except ObjectNotFound:
+                return jsonify({"status": "error", "message": "找不到此物件"}), 404
+            resp = current_app.response_class(chunks, mimetype=storage_backend.content_type(key))
+            resp.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if public else PRIVATE_CACHE_CONTROL
+            return resp
+
     # ==========================================
     # AI Image Generation API
     # ==========================================
+    def publish_request_data():
+        """發佈請求可為 multipart（file）或 JSON（image_ref / 舊版 image_data）"""
+        if request.files or request.form:
+            return request.form
+        return request.get_json(silent=True) or {}
+
+    def has_publish_image(data):
+        return bool(request.files.get('file') or data.get('image_ref') or data.get('image_data'))
+
+    def stage_publish_image(data):
+        """圖片寫入 MinIO（以內容雜湊命名），回傳 object key"""
+        image_file = request.files.get('file')
+        if image_file:
+            return stage_upload(image_file.stream, image_file.mimetype)[0]
+        if data.get('image_ref'):
+            return stage_reference(data['image_ref'])[0]
+        return stage_base64(data['image_data'])[0]
+
     @app.route('/api/content/publish', methods=['POST'])
+    @idempotent
     def handle_publish_post():
         # --- 1. 驗證登入狀態 ---
         token = request.cookies.get('access_token')
@@ -528,24 +769,31 @@ def register_routes(app):
             if not user_record:
                 return jsonify({"status": "error", "message": "找不到使用者"}), 404
             current_store_id = user_record.store_id
+            store = Store.query.get(current_store_id)
+            if not store:
+                return jsonify({"status": "error", "message": "找不到門市"}), 404
         except Exception:
             return jsonify({"status": "error", "message": "認證失效"}), 401
 
         # --- 2. 解析前端資料 ---
-        data = request.json
+        # 支援三種形式：multipart 檔案 (file)、既有物件引用 (image_ref)、舊版 base64 (image_data)
+        data = publish_request_data()
         product_name = data.get('product_name')
         final_text = data.get('final_text')
         platform = data.get('platform', 'instagram')
-        image_base64 = data.get('image_data') 
 
-        if not final_text or not image_base64:
+        if not final_text or not has_publish_image(data):
             return jsonify({"status": "error", "message": "文案或圖片數據缺失"}), 400
 
+        # 未綁定的平台直接告知，不排入發佈（也不會改用其他品牌的帳號）
+        try:
+            require_connected(store.tenant_id, PLATFORM_LEGS.get(platform, []))
+        except PlatformNotConnected as e:
+            return jsonify({"status": "error", "message": str(e), "platforms": e.platforms}), 409
+
         try:
-            # --- 3. 處理圖片數據 ---
-            if "base64," in image_base64:
-                image_base64 = image_base64.split("base64,")[1]
-            image_binary = base64.b64decode(image_base64)
+            # --- 3. 圖片寫入 MinIO（以內容雜湊命名），之後只傳遞 object key ---
+            image_key = stage_publish_image(data)
 
             # --- 4. 非同步執行完整 Workflow ---
             # 獲取 Flask App 實體，供 Thread 內部使用 App Context
@@ -553,18 +801,211 @@ def register_routes(app):
             
             thread = threading.Thread(
                 target=run_workflow, 
-                # 參數順序：app, 產品名, 文案, 圖片, 門市ID, 平台
-                args=(app_instance, product_name, final_text, image_binary, current_store_id, platform)
+                # 參數順序：app, 產品名, 文案, 圖片 key, 門市ID, 平台
+                args=(app_instance, product_name, final_text, image_key, current_store_id, platform)
             )
             thread.start()
 
             return jsonify({
                 "status": "success", 
-                "message": "內容已進入處理程序，系統正在進行上傳與發布。"
+                "message": "內容已進入處理程序，系統正在進行上傳與發布。",
+                "image_key": image_key,
             })
 
+        except InvalidImageReference as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
         except Exception as e:
             return jsonify({"status": "error", "message": f"發布請求失敗: {str(e)}"}), 500
+
+    @app.route('/api/content/publish/fanout', methods=['POST'])
+    def handle_publish_fanout():
+        """ 同一則活動併行發佈到多個品牌的粉專（僅限平台管理者） """
+        token = request.cookies.get('access_token')
+        if not token:
+            return jsonify({"status": "error", "message": "請先登入"}), 401
+        try:
+            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            user_record = Users.query.get(decoded.get("user"))
+            if not user_record:
+                return jsonify({"status": "error", "message": "找不到使用者"}), 404
+        except Exception:
+            return jsonify({"status": "error", "message": "認證失效"}), 401
+        if user_record.email.lower() not in ADMIN_EMAILS:
+            return jsonify({"status": "error", "message": "權限不足"}), 403
+
+        data = publish_request_data()
+        product_name = data.get('product_name')
+        final_text = data.get('final_text')
+        platform = data.get('platform', 'sync')
+        if not final_text or not has_publish_image(data):
+            return jsonify({"status": "error", "message": "文案或圖片數據缺失"}), 400
+
+        # tenant_ids 可為 JSON 陣列或逗號分隔字串；省略時發佈到所有已綁定粉專的品牌
+        tenant_ids = data.get('tenant_ids')
+        if isinstance(tenant_ids, str):
+            tenant_ids = [t for t in tenant_ids.split(",") if t.strip()]
+        try:
+            tenant_ids = [int(t) for t in tenant_ids] if tenant_ids else None
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "message": "tenant_ids 格式錯誤"}), 400
+        if tenant_ids is None:
+            tenant_ids = [row.tenant_id for row in db.session.query(PlatformToken.tenant_id).distinct()]
+
+        # 每個品牌以最早建立的門市作為貼文歸屬
+        store_rows = db.session.query(Store.tenant_id, db.func.min(Store.id)) \
+            .filter(Store.tenant_id.in_(tenant_ids)).group_by(Store.tenant_id).all()
+        store_ids = [store_id for _, store_id in store_rows]
+        if not store_ids:
+            return jsonify({"status": "error", "message": "沒有可發佈的品牌"}), 400
+
+        not_connected = {}
+        for tenant_id, _ in store_rows:
+            try:
+                require_connected(tenant_id, PLATFORM_LEGS.get(platform, []))
+            except PlatformNotConnected as e:
+                not_connected[tenant_id] = e.platforms
+        if not_connected:
+            return jsonify({
+                "status": "error",
+                "message": f"{len(not_connected)} 個品牌尚未連結發佈平台",
+                "not_connected": not_connected,
+            }), 409
+
+        try:
+            image_key = stage_publish_image(data)
+            app_instance = current_app._get_current_object()
+            threading.Thread(
+                target=run_fanout,
+                args=(app_instance, product_name, final_text, image_key, store_ids, platform)
+            ).start()
+            return jsonify({
+                "status": "success",
+                "message": f"已排入 {len(store_ids)} 個品牌的發佈程序。",
+                "tenant_ids": [tenant_id for tenant_id, _ in store_rows],
+                "image_key": image_key,
+            })
+        except InvalidImageReference as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        except Exception as e:
+            return jsonify({"status": "error", "message": f"發布請求失敗: {str(e)}"}), 500
+
+    # ==========================================
+    # Scheduled Publishing API
+    # ==========================================
+    @app.route('/api/content/schedule', methods=['GET', 'POST'])
+    def handle_schedule():
+        """ 排程發佈：指定 scheduled_at，或指定節日 (holiday_id) + 尖峰時段 (slot) """
+        token = request.cookies.get('access_token')
+        if not token:
+            return jsonify({"status": "error", "message": "請先登入"}), 401
+        try:
+            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            user_record = Users.query.get(decoded.get("user"))
+            if not user_record:
+                return jsonify({"status": "error", "message": "找不到使用者"}), 404
+            store = Store.query.get(user_record.store_id)
+        except Exception:
+            return jsonify({"status": "error", "message": "認證失效"}), 401
+        if not store:
+            return jsonify({"status": "error", "message": "找不到門市"}), 404
+
+        if request.method == 'GET':
+            status = request.args.get('status', 'pending')
+            try:
+                limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+            except ValueError:
+                return jsonify({"status": "error", "message": "limit 必須為整數"}), 400
+            posts = ScheduledPost.query.filter_by(tenant_id=store.tenant_id, status=status) \
+                .order_by(ScheduledPost.scheduled_at).limit(limit).all()
+            return jsonify({
+                "status": "success",
+                "data": [{
+                    "id": p.id,
+                    "product_name": p.product_name,
+                    "caption": p.caption,
+                    "platform": p.platform,
+                    "scheduled_at": p.scheduled_at.replace(tzinfo=timezone.utc).isoformat(),
+                    "holiday_id": p.holiday_id,
+                    "status": p.status,
+                    "last_error": p.last_error,
+                } for p in posts]
+            })
+
+        data = publish_request_data()
+        final_text = data.get('final_text')
+        if not final_text or not has_publish_image(data):
+            return jsonify({"status": "error", "message": "文案或圖片數據缺失"}), 400
+
+        holiday_id = data.get('holiday_id')
+        try:
+            if data.get('scheduled_at'):
+                scheduled_at = to_utc_naive(datetime.fromisoformat(data['scheduled_at'].replace('Z', '+00:00')))
+            elif holiday_id:
+                holiday = HolidayCalendar.query.get(int(holiday_id))
+                if not holiday:
+                    return jsonify({"status": "error", "message": "找不到此節日"}), 404
+                scheduled_at = slot_datetime(holiday.target_date, data.get('slot', DEFAULT_SLOT))
+            else:
+                return jsonify({"status": "error", "message": "請指定 scheduled_at 或 holiday_id"}), 400
+        except ValueError as e:
+            return jsonify({"status": "error", "message": f"時間格式錯誤: {e}"}), 400
+
+        if scheduled_at <= datetime.utcnow():
+            return jsonify({"status": "error", "message": "排程時間必須晚於現在"}), 400
+
+        try:
+            require_connected(store.tenant_id, PLATFORM_LEGS.get(data.get('platform', 'sync'), []))
+        except PlatformNotConnected as e:
+            return jsonify({"status": "error", "message": str(e), "platforms": e.platforms}), 409
+
+        try:
+            # 圖片於排程時就寫入 MinIO，排程表只存 object key
+            image_key = stage_publish_image(data)
+            post = ScheduledPost(
+                tenant_id=store.tenant_id,
+                store_id=store.id,
+                holiday_id=int(holiday_id) if holiday_id else None,
+                product_name=data.get('product_name'),
+                caption=final_text,
+                image_key=image_key,
+                platform=data.get('platform', 'sync'),
+                scheduled_at=scheduled_at,
+            )
+            db.session.add(post)
+            db.session.commit()
+            publish_scheduler.notify()
+            return jsonify({
+                "status": "success",
+                "message": "已加入排程",
+                "id": post.id,
+                "scheduled_at": scheduled_at.replace(tzinfo=timezone.utc).isoformat(),
+            })
+        except InvalidImageReference as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"status": "error", "message": f"排程失敗: {str(e)}"}), 500
+
+    @app.route('/api/content/schedule/<int:post_id>', methods=['DELETE'])
+    def cancel_schedule(post_id):
+        token = request.cookies.get('access_token')
+        if not token:
+            return jsonify({"status": "error", "message": "請先登入"}), 401
+        try:
+            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            user_record = Users.query.get(decoded.get("user"))
+            store = Store.query.get(user_record.store_id)
+        except Exception:
+            return jsonify({"status": "error", "message": "認證失效"}), 401
+
+        # 只能取消尚未被排程器認領的貼文
+        cancelled = ScheduledPost.query.filter_by(id=post_id, tenant_id=store.tenant_id, status='pending') \
+            .update({"status": "cancelled"}, synchronize_session=False)
+        db.session.commit()
+        if not cancelled:
+            return jsonify({"status": "error", "message": "找不到可取消的排程"}), 404
+        return jsonify({"status": "success", "message": "已取消排程"})
+
     @app.route('/api/content/history', methods=['GET'])
     def get_history():
         token = request.cookies.get('access_token')
@@ -636,7 +1077,6 @@ def register_routes(app):
 
         FB_APP_ID = os.getenv('FB_APP_ID', '')
         FB_APP_SECRET = os.getenv('FB_APP_SECRET', '')
-        auth_url = "https://graph.facebook.com/v18.0/oauth/access_token"
         params = {
             "grant_type": "fb_exchange_token",
             "client_id": FB_APP_ID,
@@ -644,10 +1084,9 @@ def register_routes(app):
             "fb_exchange_token": short_token
         }
         try:
-            auth_res = requests.get(auth_url, params=params).json()
+            auth_res = graph_client.get("oauth/access_token", params=params)
             long_user_token = auth_res.get('access_token')
-            accounts_url = f"https://graph.facebook.com/v18.0/me/accounts?access_token={long_user_token}"
-            accounts_res = requests.get(accounts_url).json()
+            accounts_res = graph_client.get("me/accounts", params={"access_token": long_user_token})
             if not accounts_res.get('data'):
                 return jsonify({"status": "error", "message": "此帳號無管理的粉絲專頁"}), 400
             
@@ -668,12 +1107,36 @@ def register_routes(app):
             target_record.page_name = page_data['name']
             target_record.access_token = page_data['access_token']
             target_record.expires_at = datetime.now(timezone.utc) + timedelta(days=60)
+
+            # 粉專若已連結 IG 商業帳號，一併存下（IG 發佈使用同一個粉專 token）
+            page_info = graph_client.get(page_data['id'], params={
+                "fields": "instagram_business_account",
+                "access_token": page_data['access_token'],
+            })
+            ig_account = page_info.get('instagram_business_account')
+            if ig_account:
+                ig_record = PlatformToken.query.filter_by(
+                    tenant_id=store.tenant_id,
+                    platform_name='instagram'
+                ).first()
+                if not ig_record:
+                    ig_record = PlatformToken(tenant_id=store.tenant_id, platform_name='instagram')
+                    db.session.add(ig_record)
+                ig_record.page_id = ig_account['id']
+                ig_record.page_name = page_data['name']
+                ig_record.access_token = page_data['access_token']
+                ig_record.expires_at = target_record.expires_at
             db.session.commit()
+            invalidate_credentials(store.tenant_id)
             
             return jsonify({
                 "status": "success",
-                "message": f"成功連接粉專：{page_data['name']}"
+                "message": f"成功連接粉專：{page_data['name']}",
+                "instagram_linked": bool(ig_account),
             })
+        except GraphAPIError as e:
+            db.session.rollback()
+            return jsonify({"status": "error", "message": f"Facebook 授權失敗: {e}"}), 502
         except Exception as e:
             return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -816,4 +1279,122 @@ def register_routes(app):
 
         except Exception as e:
             print(f"Trends Fetch Error: {e}")
-            return jsonify({"status": "error", "message": "無法讀取社群趨勢資料"}), 500
\ No newline at end of file
+            return jsonify({"status": "error", "message": "無法讀取社群趨勢資料"}), 500
+
+    # ==========================================
+    # Crawler Admin API
+    # ==========================================
+    @app.route('/api/admin/crawl/runs', methods=['GET'])
+    def get_crawl_runs():
+        """ 爬蟲執行紀錄（每次嘗試一筆）與各來源的最新狀態（僅限平台管理者） """
+        token = request.cookies.get('access_token')
+        if not token:
+            return jsonify({"status": "error", "message": "請先登入"}), 401
+        try:
+            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            user_record = Users.query.get(decoded.get("user"))
+            if not user_record:
+                return jsonify({"status": "error", "message": "找不到使用者"}), 404
+        except Exception:
+            return jsonify({"status": "error", "message": "認證失效"}), 401
+        if user_record.email.lower() not in ADMIN_EMAILS:
+            return jsonify({"status": "error", "message": "權限不足"}), 403
+
+        try:
+            limit = min(int(request.args.get('limit', 50)), 200)
+        except ValueError:
+            return jsonify({"status": "error", "message": "limit 格式錯誤"}), 400
+
+        query = CrawlRun.query
+        if request.args.get('job'):
+            query = query.filter(CrawlRun.job == request.args['job'])
+        if request.args.get('status'):
+            query = query.filter(CrawlRun.status == request.args['status'])
+        runs = query.order_by(CrawlRun.started_at.desc()).limit(limit).all()
+
+        def iso(value):
+            return value.isoformat() if value else None
+
+        return jsonify({
+            "status": "success",
+            "runs": [{
+                "id": r.id,
+                "job": r.job,
+                "attempt": r.attempt,
+                "trigger": r.trigger,
+                "status": r.status,
+                "started_at": iso(r.started_at),
+                "finished_at": iso(r.finished_at),
+                "duration_ms": r.duration_ms,
+                "rows_written": r.rows_written,
+                "error": r.error,
+            } for r in runs],
+            "sources": [{
+                "source": s.source,
+                "last_attempt_at": iso(s.last_attempt_at),
+                "last_success_at": iso(s.last_success_at),
+                "last_duration_ms": s.last_duration_ms,
+                "content_changed_at": iso(s.content_changed_at),
+                "last_error": s.last_error,
+            } for s in CrawlState.query.order_by(CrawlState.source).all()],
+        })
+
+    @app.route('/api/admin/fruit/watchlist', methods=['GET', 'POST'])
+    @app.route('/api/admin/fruit/watchlist/<int:item_id>', methods=['PATCH', 'DELETE'])
+    def fruit_watchlist(item_id=None):
+        """
+        水果價格觀察清單（僅限平台管理者）：清單內的品項由爬蟲以全國量加權均價寫入 PriceHistory。
+        POST {"crop_name": "芒果-愛文"} 新增；PATCH {"enabled": false} 暫停；DELETE 移除（已寫入的價格保留）。
+        """
+        token = request.cookies.get('access_token')
+        if not token:
+            return jsonify({"status": "error", "message": "請先登入"}), 401
+        try:
+            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            user_record = Users.query.get(decoded.get("user"))
+            if not user_record:
+                return jsonify({"status": "error", "message": "找不到使用者"}), 404
+        except Exception:
+            return jsonify({"status": "error", "message": "認證失效"}), 401
+        if user_record.email.lower() not in ADMIN_EMAILS:
+            return jsonify({"status": "error", "message": "權限不足"}), 403
+
+        def serialize(item):
+            return {
+                "id": item.id,
+                "crop_name": item.crop_name,
+                "ingredient_id": item.ingredient_id,
+                "enabled": item.enabled,
+                "created_at": item.created_at.isoformat() if item.created_at else None,
+            }
+
+        if request.method == 'GET':
+            items = FruitWatchlist.query.order_by(FruitWatchlist.id).all()
+            return jsonify({"status": "success", "items": [serialize(i) for i in items]})
+
+        if request.method == 'POST':
+            crop_name = ((request.json or {}).get('crop_name') or '').strip()
+            if not crop_name:
+                return jsonify({"status": "error", "message": "缺少 crop_name"}), 400
+            if FruitWatchlist.query.filter_by(crop_name=crop_name).first():
+                return jsonify({"status": "error", "message": "此品項已在觀察清單中"}), 409
+            # ingredient 由爬蟲下次執行時對應（不存在則建立）
+            item = FruitWatchlist(crop_name=crop_name, enabled=True)
+            db.session.add(item)
+            db.session.commit()
+            return jsonify({"status": "success", "item": serialize(item)}), 201
+
+        item = FruitWatchlist.query.get(item_id)
+        if not item:
+            return jsonify({"status": "error", "message": "找不到此品項"}), 404
+        if request.method == 'PATCH':
+            enabled = (request.json or {}).get('enabled')
+            if not isinstance(enabled, bool):
+                return jsonify({"status": "error", "message": "enabled 需為 true / false"}), 400
+            item.enabled = enabled
+            db.session.commit()
+            return jsonify({"status": "success", "item": serialize(item)})
+
+        db.session.delete(item)
+        db.session.commit()
+        return jsonify({"status": "success"})
@@ -0,0 +1,83 @@
+import io
+import os
+from typing import Optional
+
+from PIL import Image as PILImage
+from google.genai import types
+
+# ============================================================
+# 來源素材層：同一張產品照只序列化 / 上傳一次，三個變體共用同一個參照
+# ============================================================
+# SOURCE_ASSET_MODE:
+#   - "files"  ：透過 Gemini Files API 上傳一次，之後只傳 file_uri（預設）
+#   - "inline" ：只在本地預先序列化成 bytes，不呼叫任何外部 API（離線測試用）
+SOURCE_ASSET_MODE = os.getenv("SOURCE_ASSET_MODE", "files")
+SOURCE_ASSET_FORMAT = "PNG"
+SOURCE_ASSET_MIME = "image/png"
+
+
+def serialize_image(pil_image: PILImage.Image, fmt: str = SOURCE_ASSET_FORMAT) -> bytes:
+    """將 PIL 圖片序列化為 bytes（整個生成流程只做一次）"""
+    buf = io.BytesIO()
+    pil_image.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+class InlineSourceAsset:
+    """預先序列化的來源圖片，不需要網路，亦可作為離線測試的替身"""
+
+    def __init__(self, data: bytes, mime_type: str = SOURCE_ASSET_MIME):
+        self.data = data
+        self.mime_type = mime_type
+        self._part = types.Part.from_bytes(data=data, mime_type=mime_type)
+
+    @classmethod
+    def from_pil(cls, pil_image: PILImage.Image):
+        return cls(serialize_image(pil_image))
+
+    def as_part(self) -> types.Part:
+        return self._part
+
+    def release(self):
+        pass
+
+
+class UploadedSourceAsset:
+    """透過 Files API 上傳一次，之後每個變體請求只帶 file_uri 參照"""
+
+    def __init__(self, client, data: bytes, mime_type: str = SOURCE_ASSET_MIME):
+        self._client = client
+        self.mime_type = mime_type
+        self.file = client.files.upload(
+            file=io.BytesIO(data),
+            config=types.UploadFileConfig(mime_type=mime_type),
+        )
+        self._part = types.Part.from_uri(file_uri=self.file.uri, mime_type=self.file.mime_type or mime_type)
+        print(f"   ☁️ 來源圖片已上傳 Files API: {self.file.name} ({len(data)} bytes)")
+
+    def as_part(self) -> types.Part:
+        return self._part
+
+    def release(self):
+        """生成結束後刪除暫存檔（Files API 也會在 48 小時後自動清除）"""
+        try:
+            self._client.files.delete(name=self.file.name)
+        except Exception as e:
+            print(f"   ⚠️ 刪除 Files API 暫存檔失敗（將自動過期）: {e}")
+
+
+def prepare_source_asset(client, pil_image: PILImage.Image, mode: Optional[str] = None):
+    """
+    建立可重複使用的來源素材。
+    Files API 上傳失敗時自動退回 inline 模式，避免整個生成流程中斷。
+    """
+    mode = mode or SOURCE_ASSET_MODE
+    data = serialize_image(pil_image)
+
+    if mode == "files" and client is not None:
+        try:
+            return UploadedSourceAsset(client, data)
+        except Exception as e:
+            print(f"   ⚠️ Files API 上傳失敗，改用 inline bytes: {e}")
+
+    return InlineSourceAsset(data)
@@ -0,0 +1,465 @@
+import hashlib
+import hmac
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+# ============================================================
+# 物件儲存層：單一 MinIO 連線池 / 本地檔案系統，以 SHA-256 命名物件
+# ============================================================
+# minio（預設）或 local（測試 / 壓測時不需要 MinIO）
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "minio").lower()
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", os.path.join(tempfile.gettempdir(), "cupcampaign-storage"))
+
+# 生成方案圖（私有，經後端代理或預簽章網址讀取）與發佈用圖片（公開，Meta 伺服器直接抓圖）
+VARIANT_BUCKET = "marketing-images"
+POST_BUCKET = "tea-master-images"
+# 預簽章 PUT 的暫存上傳（私有）；發佈時驗證格式與大小後才複製到公開 bucket
+UPLOAD_BUCKET = "upload-staging"
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", 20)) * 1024 * 1024
+
+# 對外網址：預設沿用 EXTERNAL_DOMAIN（ngrok 指向 MinIO），可用 STORAGE_PUBLIC_URL 覆寫
+STORAGE_PUBLIC_URL = os.getenv("STORAGE_PUBLIC_URL") or (
+    f"https://{os.getenv('EXTERNAL_DOMAIN')}" if os.getenv("EXTERNAL_DOMAIN") else ""
+)
+PRESIGN_EXPIRES_SECONDS = int(os.getenv("PRESIGN_EXPIRES_SECONDS", 3600))
+MINIO_POOL_SIZE = int(os.getenv("MINIO_POOL_SIZE", 16))
+
+# 串流上傳時每次讀取的區塊大小，以及 MinIO multipart 的分段大小
+STREAM_CHUNK_SIZE = 1024 * 1024
+MULTIPART_PART_SIZE = 10 * 1024 * 1024
+
+# 以內容雜湊命名的物件永遠不會改變
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 需登入才能讀取的物件（生成方案圖）：內容同樣不變，但只能存在瀏覽器私有快取，不可讓 CDN / proxy 保存
+PRIVATE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+_NOT_FOUND_CODES = ("NoSuchKey", "NoSuchObject", "NotFound", "NoSuchBucket")
+
+
+class ObjectNotFound(Exception):
+    pass
+
+
+class InvalidUpload(ValueError):
+    """暫存上傳不是支援的圖片格式或超過大小上限"""
+
+
+def sniff_image_extension(head: bytes):
+    """依檔頭判斷圖片格式，回傳副檔名；不是支援的格式則回傳 None（不採信用戶端宣告的 Content-Type）"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def public_read_policy(bucket_name):
+    """匿名可讀取（Meta 伺服器需要直接抓圖）"""
+    return {
+        "Version": "2012-10-17",
+        "Statement": [{
+            "Effect": "Allow",
+            "Principal": {"AWS": ["*"]},
+            "Action": ["s3:GetBucketLocation", "s3:ListBucket"],
+            "Resource": [f"arn:aws:s3:::{bucket_name}"]
+        }, {
+            "Effect": "Allow",
+            "Principal": {"AWS": ["*"]},
+            "Action": ["s3:GetObject"],
+            "Resource": [f"arn:aws:s3:::{bucket_name}/*"]
+        }]
+    }
+
+
+def extension_for(content_type, default="png"):
+    return CONTENT_TYPE_EXTENSIONS.get((content_type or "").split(";")[0].strip().lower(), default)
+
+
+def _signing_window(expires):
+    """
+    預簽章時間對齊到 expires 的整數倍，同一時段內產生的網址完全相同，
+    瀏覽器 / CDN 快取才會生效；實際有效期介於 expires ~ 2 * expires。
+    """
+    seconds = int(expires.total_seconds())
+    now = int(time.time())
+    return datetime.fromtimestamp(now - now % seconds, tz=timezone.utc), timedelta(seconds=2 * seconds)
+
+
+class MinioBackend:
+    """
+    整個行程共用一個 MinIO client（urllib3 連線池 + 逾時 + 重試）。
+    預簽章網址的簽名包含 host，因此另建一個指向對外網域的 signer（只用來簽名，不發出請求）。
+    """
+
+    name = "minio"
+
+    def __init__(self, endpoint=None, access_key=None, secret_key=None, secure=False, public_url=STORAGE_PUBLIC_URL):
+        import urllib3
+        from minio import Minio
+
+        endpoint = endpoint or os.getenv("MINIO_ENDPOINT", "minio:9000")
+        access_key = access_key or os.getenv("MINIO_ROOT_USER", "minioadmin")
+        secret_key = secret_key or os.getenv("MINIO_ROOT_PASSWORD", "minioadmin")
+        http_client = urllib3.PoolManager(
+            maxsize=MINIO_POOL_SIZE,
+            timeout=urllib3.Timeout(connect=3.0, read=60.0),
+            retries=urllib3.Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+        )
+        # 指定 region 可省去每個 bucket 第一次存取時的 GetBucketLocation 請求
+        self.client = Minio(endpoint, access_key=access_key, secret_key=secret_key,
+                            secure=secure, region="us-east-1", http_client=http_client)
+        self.public_url = public_url.rstrip("/")
+        if self.public_url:
+            external = self.public_url.split("://", 1)[-1].split("/", 1)[0]
+            self.signer = Minio(external, access_key=access_key, secret_key=secret_key,
+                                secure=self.public_url.startswith("https://"), region="us-east-1")
+        else:
+            self.signer = self.client
+
+    def ensure_bucket(self, bucket, public=False):
+        if self.client.bucket_exists(bucket):
+            return False
+        self.client.make_bucket(bucket)
+        if public:
+            self.client.set_bucket_policy(bucket, json.dumps(public_read_policy(bucket)))
+        return True
+
+    def exists(self, bucket, key):
+        from minio.error import S3Error
+        try:
+            self.client.stat_object(bucket, key)
+            return True
+        except S3Error as e:
+            if e.code in _NOT_FOUND_CODES:
+                return False
+            raise
+
+    def put(self, bucket, key, stream, length, content_type, cache_control=None):
+        metadata = {"Cache-Control": cache_control} if cache_control else None
+        self.client.put_object(bucket, key, stream, length=length, content_type=content_type,
+                               metadata=metadata, part_size=MULTIPART_PART_SIZE)
+
+    def open(self, bucket, key, chunk_size=64 * 1024):
+        from minio.error import S3Error
+        try:
+            resp = self.client.get_object(bucket, key)
+        except S3Error as e:
+            if e.code in _NOT_FOUND_CODES:
+                raise ObjectNotFound(key)
+            raise
+
+        def chunks():
+            try:
+                for chunk in resp.stream(chunk_size):
+                    yield chunk
+            finally:
+                resp.close()
+                resp.release_conn()
+        return chunks()
+
+    def copy(self, src_bucket, src_key, dst_bucket, dst_key, content_type=None, cache_control=None):
+        from minio.commonconfig import CopySource, REPLACE
+        if content_type is None:
+            self.client.copy_object(dst_bucket, dst_key, CopySource(src_bucket, src_key))
+            return
+        # 改寫中繼資料：不沿用上傳者設定的 Content-Type
+        metadata = {"Content-Type": content_type}
+        if cache_control:
+            metadata["Cache-Control"] = cache_control
+        self.client.copy_object(dst_bucket, dst_key, CopySource(src_bucket, src_key),
+                                metadata=metadata, metadata_directive=REPLACE)
+
+    def remove(self, bucket, key):
+        self.client.remove_object(bucket, key)
+
+    def presigned_get(self, bucket, key, expires, cache_control=None):
+        request_date, valid_for = _signing_window(expires)
+        headers = {"response-cache-control": cache_control} if cache_control else None
+        return self.signer.presigned_get_object(bucket, key, expires=valid_for,
+                                                response_headers=headers, request_date=request_date)
+
+    def presigned_put(self, bucket, key, expires):
+        return self.signer.presigned_put_object(bucket, key, expires=expires)
+
+    def public_object_url(self, bucket, key):
+        return f"{self.public_url}/{bucket}/{key}"
+
+
+class LocalBackend:
+    """
+    以本地目錄模擬 bucket，供測試與壓測使用。
+    預簽章網址以 HMAC 簽名，由 /api/storage/local/<bucket>/<key> 驗證後讀寫。
+    """
+
+    name = "local"
+    route_prefix = "/api/storage/local"
+
+    def __init__(self, root=LOCAL_STORAGE_ROOT, secret=None, public_url=STORAGE_PUBLIC_URL):
+        self.root = os.path.abspath(root)
+        self.secret = (secret or os.getenv("MY_APP_SECRET_KEY", "your_fallback_key")).encode("utf-8")
+        self.public_url = public_url.rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, bucket, key):
+        path = os.path.abspath(os.path.join(self.root, bucket, *key.split("/")))
+        if not path.startswith(os.path.join(self.root, bucket) + os.sep):
+            raise ValueError(f"無效的物件路徑: {bucket}/{key}")
+        return path
+
+    def ensure_bucket(self, bucket, public=False):
+        path = os.path.join(self.root, bucket)
+        if os.path.isdir(path):
+            return False
+        os.makedirs(path, exist_ok=True)
+        return True
+
+    def exists(self, bucket, key):
+        return os.path.isfile(self._path(bucket, key))
+
+    def put(self, bucket, key, stream, length, content_type, cache_control=None):
+        path = self._path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先寫暫存檔再 rename，讀取端不會看到寫到一半的檔案
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(stream, f, STREAM_CHUNK_SIZE)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def open(self, bucket, key, chunk_size=64 * 1024):
+        path = self._path(bucket, key)
+        if not os.path.isfile(path):
+            raise ObjectNotFound(key)
+
+        def chunks():
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        return chunks()
+
+    def copy(self, src_bucket, src_key, dst_bucket, dst_key, content_type=None, cache_control=None):
+        # 本地檔案不存中繼資料，讀取時依副檔名決定 Content-Type
+        with open(self._path(src_bucket, src_key), "rb") as f:
+            self.put(dst_bucket, dst_key, f, None, content_type)
+
+    def remove(self, bucket, key):
+        path = self._path(bucket, key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def sign(self, method, bucket, key, expires_at):
+        message = f"{method}\n{bucket}/{key}\n{expires_at}".encode("utf-8")
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()
+
+    def verify(self, method, bucket, key, expires_at, signature):
+        try:
+            if int(expires_at) < time.time():
+                return False
+        except (TypeError, ValueError):
+            return False
+        return hmac.compare_digest(self.sign(method, bucket, key, expires_at), signature or "")
+
+    def _presigned(self, method, bucket, key, expires_at):
+        query = {"expires": expires_at, "signature": self.sign(method, bucket, key, expires_at)}
+        return f"{self.public_url}{self.route_prefix}/{bucket}/{key}?{urlencode(query)}"
+
+    def presigned_get(self, bucket, key, expires, cache_control=None):
+        request_date, valid_for = _signing_window(expires)
+        expires_at = int((request_date + valid_for).timestamp())
+        return self._presigned("GET", bucket, key, expires_at)
+
+    def presigned_put(self, bucket, key, expires):
+        return self._presigned("PUT", bucket, key, int(time.time() + expires.total_seconds()))
+
+    def public_object_url(self, bucket, key):
+        return f"{self.public_url}{self.route_prefix}/{bucket}/{key}"
+
+    def content_type(self, key):
+        return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+def create_backend(kind=STORAGE_BACKEND):
+    if kind == "local":
+        return LocalBackend()
+    return MinioBackend()
+
+
+storage_backend = create_backend()
+
+
+class ContentAddressedStore:
+    """
+    同一份 bytes 永遠對應同一個 key（{prefix}/{sha256}.{ext}），
+    重複發佈或跨平台同步時不會再上傳一次，也不會因同一秒內發佈而互相覆蓋。
+    Bucket 是否就緒在每個行程只檢查一次（通常已由 ensure_buckets 在啟動時完成）。
+    """
+
+    def __init__(self, bucket, public=False, backend=None):
+        self.bucket = bucket
+        self.public = public
+        self.backend = backend or storage_backend
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def mark_ready(self):
+        self._ready = True
+
+    def ensure_bucket(self):
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            if self.backend.ensure_bucket(self.bucket, self.public):
+                print(f"🪣 [Storage] 建立儲存桶: {self.bucket}", flush=True)
+            self._ready = True
+
+    @staticmethod
+    def key_for(digest, prefix, ext):
+        return f"{prefix}/{digest}.{ext}" if prefix else f"{digest}.{ext}"
+
+    def exists(self, key):
+        return self.backend.exists(self.bucket, key)
+
+    def put_bytes(self, data: bytes, prefix="", ext="png", content_type="image/png"):
+        """回傳 (key, uploaded)；uploaded 為 False 代表物件已存在、未重新上傳"""
+        self.ensure_bucket()
+        key = self.key_for(hashlib.sha256(data).hexdigest(), prefix, ext)
+        if self.exists(key):
+            return key, False
+        self.backend.put(self.bucket, key, io.BytesIO(data), len(data), content_type, IMMUTABLE_CACHE_CONTROL)
+        return key, True
+
+    def put_stream(self, stream, prefix="", ext="png", content_type="image/png"):
+        """
+        從可 seek 的串流（例如 Werkzeug 的暫存檔）上傳，記憶體用量固定為一個區塊：
+        先逐塊計算 SHA-256 與長度，再倒回開頭交給後端分段上傳。
+        """
+        self.ensure_bucket()
+        digest = hashlib.sha256()
+        length = 0
+        while True:
+            chunk = stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            length += len(chunk)
+        stream.seek(0)
+
+        key = self.key_for(digest.hexdigest(), prefix, ext)
+        if self.exists(key):
+            return key, False
+        self.backend.put(self.bucket, key, stream, length, content_type, IMMUTABLE_CACHE_CONTROL)
+        return key, True
+
+    def copy_from(self, source_store, source_key, prefix=""):
+        """
+        以伺服器端複製把其他 bucket 的物件（例如已生成的方案圖）搬過來，
+        圖片 bytes 不經過後端；檔名本身就是內容雜湊，可直接沿用。
+        """
+        self.ensure_bucket()
+        name = posixpath.basename(source_key)
+        key = f"{prefix}/{name}" if prefix else name
+        if self.exists(key):
+            return key, False
+        self.backend.copy(source_store.bucket, source_key, self.bucket, key)
+        return key, True
+
+    def staging_key(self, ext="png"):
+        return f"uploads/{uuid.uuid4().hex}.{ext}"
+
+    def adopt(self, staging_store, staging_key, prefix="", max_bytes=MAX_UPLOAD_BYTES):
+        """
+        把以預簽章 PUT 上傳到私有暫存 bucket 的物件搬進這個 store，改為內容雜湊命名：
+        串流計算雜湊並檢查檔頭與大小，通過後才以伺服器端複製寫入（公開 bucket 中只會有驗證過的圖片）。
+        副檔名與 Content-Type 依檔頭決定，不信任用戶端宣告的雜湊或格式，也不把整個檔案讀進記憶體。
+        驗證失敗時刪除暫存物件並拋出 InvalidUpload。
+        """
+        digest = hashlib.sha256()
+        ext = None
+        length = 0
+        try:
+            for chunk in staging_store.open(staging_key, STREAM_CHUNK_SIZE):
+                if ext is None:
+                    ext = sniff_image_extension(chunk[:16])
+                    if ext is None:
+                        raise InvalidUpload("不支援的圖片格式（僅接受 PNG / JPEG / WebP / GIF）")
+                length += len(chunk)
+                if length > max_bytes:
+                    raise InvalidUpload(f"圖片超過 {max_bytes // (1024 * 1024)} MB 上限")
+                digest.update(chunk)
+            if ext is None:
+                raise InvalidUpload("上傳的檔案是空的")
+        except InvalidUpload:
+            staging_store.remove(staging_key)
+            raise
+
+        self.ensure_bucket()
+        key = self.key_for(digest.hexdigest(), prefix, ext)
+        uploaded = not self.exists(key)
+        if uploaded:
+            content_type = next(t for t, e in CONTENT_TYPE_EXTENSIONS.items() if e == ext)
+            self.backend.copy(staging_store.bucket, staging_key, self.bucket, key,
+                              content_type=content_type, cache_control=IMMUTABLE_CACHE_CONTROL)
+        staging_store.remove(staging_key)
+        return key, uploaded
+
+    def remove(self, key):
+        self.backend.remove(self.bucket, key)
+
+    def open(self, key, chunk_size=64 * 1024):
+        return self.backend.open(self.bucket, key, chunk_size)
+
+    def presigned_get(self, key, expires=None, cache_control=IMMUTABLE_CACHE_CONTROL):
+        """cache_control 會簽入網址（response-cache-control），覆寫物件本身的 Cache-Control"""
+        expires = expires or timedelta(seconds=PRESIGN_EXPIRES_SECONDS)
+        return self.backend.presigned_get(self.bucket, key, expires, cache_control)
+
+    def presigned_put(self, key, expires=None):
+        self.ensure_bucket()
+        return self.backend.presigned_put(self.bucket, key, expires or timedelta(seconds=PRESIGN_EXPIRES_SECONDS))
+
+    def public_url(self, key):
+        return self.backend.public_object_url(self.bucket, key)
+
+
+variant_store = ContentAddressedStore(VARIANT_BUCKET)
+post_store = ContentAddressedStore(POST_BUCKET, public=True)
+upload_store = ContentAddressedStore(UPLOAD_BUCKET)
+
+
+def ensure_buckets():
+    """啟動時檢查所有 bucket；失敗時各 store 會在第一次使用時再試"""
+    for store in (variant_store, post_store, upload_store):
+        if store.backend.ensure_bucket(store.bucket, store.public):
+            print(f"🪣 [Storage] 建立儲存桶: {store.bucket}{'（公開）' if store.public else ''}", flush=True)
+        store.mark_ready()
+    print(f"✅ [Storage] {storage_backend.name} 儲存空間就緒", flush=True)
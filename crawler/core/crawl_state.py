@@ -0,0 +1,74 @@
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from core.db import session_scope
+
+# ============================================================
+# 爬蟲狀態：每個來源記錄最後成功時間 / 耗時 / 內容雜湊，資料仍新鮮時跳過重爬
+# ============================================================
+
+
+def content_hash(content):
+    """以排序後的 JSON 計算 sha256，dict 鍵順序不同也視為相同內容"""
+    payload = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def last_success(source):
+    with session_scope() as session:
+        return session.execute(
+            text("SELECT last_success_at FROM crawl_state WHERE source = :source"),
+            {"source": source},
+        ).scalar()
+
+
+def is_fresh(source, ttl_seconds, now=None):
+    """最後一次成功距今未超過 ttl_seconds"""
+    now = now or datetime.utcnow()
+    succeeded_at = last_success(source)
+    return succeeded_at is not None and now - succeeded_at < timedelta(seconds=ttl_seconds)
+
+
+def record_success(source, started_at, duration_seconds, content):
+    """寫入成功紀錄，回傳內容是否與上次不同"""
+    digest = content_hash(content)
+    now = datetime.utcnow()
+    with session_scope() as session:
+        previous = session.execute(
+            text("SELECT content_hash FROM crawl_state WHERE source = :source FOR UPDATE"),
+            {"source": source},
+        ).scalar()
+        session.execute(text("""
+            INSERT INTO crawl_state
+                (source, last_attempt_at, last_success_at, last_duration_ms, content_hash, content_changed_at, last_error)
+            VALUES (:source, :started_at, :now, :duration_ms, :digest, :now, NULL)
+            ON CONFLICT (source) DO UPDATE SET
+                last_attempt_at = EXCLUDED.last_attempt_at,
+                last_success_at = EXCLUDED.last_success_at,
+                last_duration_ms = EXCLUDED.last_duration_ms,
+                content_changed_at = CASE
+                    WHEN crawl_state.content_hash IS DISTINCT FROM EXCLUDED.content_hash THEN EXCLUDED.content_changed_at
+                    ELSE crawl_state.content_changed_at
+                END,
+                content_hash = EXCLUDED.content_hash,
+                last_error = NULL
+        """), {
+            "source": source, "started_at": started_at, "now": now,
+            "duration_ms": int(duration_seconds * 1000), "digest": digest,
+        })
+    return previous != digest
+
+
+def record_failure(source, started_at, error):
+    """只更新嘗試時間與錯誤，保留最後成功時間（下次啟動仍會重試）"""
+    with session_scope() as session:
+        session.execute(text("""
+            INSERT INTO crawl_state (source, last_attempt_at, last_error)
+            VALUES (:source, :started_at, :error)
+            ON CONFLICT (source) DO UPDATE SET
+                last_attempt_at = EXCLUDED.last_attempt_at,
+                last_error = EXCLUDED.last_error
+        """), {"source": source, "started_at": started_at, "error": str(error)[:2000]})
@@ -0,0 +1,58 @@
+import os
+import sys
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# --- 共用 backend 的 models（docker 內掛載於 /app/backend）---
+backend_path = os.getenv("BACKEND_PATH", "/app/backend")
+if backend_path not in sys.path:
+    sys.path.insert(0, backend_path)
+
+from app.config import Config
+from app.extensions import db
+
+# ============================================================
+# 爬蟲端的資料存取：共用一個 engine / 連線池，直接以 app.models 的 metadata 建立 Session，
+# 不建立 Flask app（不註冊路由、不載入 AI 套件、不重跑啟動時的 seed / DDL）
+# 匯入 app.config / app.extensions 會執行 app/__init__.py；該檔只在 create_app 內載入 CORS / Migrate / 儲存空間
+# ============================================================
+CRAWLER_DB_POOL_SIZE = int(os.getenv("CRAWLER_DB_POOL_SIZE", 5))
+CRAWLER_DB_MAX_OVERFLOW = int(os.getenv("CRAWLER_DB_MAX_OVERFLOW", 5))
+
+metadata = db.metadata
+
+engine = create_engine(
+    Config.SQLALCHEMY_DATABASE_URI,
+    pool_size=CRAWLER_DB_POOL_SIZE,
+    max_overflow=CRAWLER_DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+)
+
+# expire_on_commit=False：commit 後仍可讀取物件欄位（例如剛建立的 Ingredient.id）
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+
+
+@contextmanager
+def session_scope():
+    """區塊正常結束時 commit，發生例外則 rollback，最後歸還連線"""
+    session = SessionLocal()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def ensure_schema():
+    """
+    爬蟲先於 backend 啟動時，補建尚不存在的資料表（checkfirst，已存在的表不會有任何 DDL）。
+    欄位補丁與 seed 資料仍由 backend 的 create_app 負責。
+    """
+    import app.models  # noqa: F401 — 載入所有 model 到 metadata
+    metadata.create_all(engine, checkfirst=True)
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# ============================================================
+# 爬蟲共用 HTTP 客戶端：連線池 + 逾時 + 每個 host 的併行上限 + 退避重試 + 磁碟條件式快取（ETag / Last-Modified）
+# ============================================================
+CRAWL_HTTP_CONNECT_TIMEOUT = float(os.getenv("CRAWL_HTTP_CONNECT_TIMEOUT", 3.05))
+CRAWL_HTTP_READ_TIMEOUT = float(os.getenv("CRAWL_HTTP_READ_TIMEOUT", 30))
+CRAWL_HTTP_MAX_RETRIES = int(os.getenv("CRAWL_HTTP_MAX_RETRIES", 3))
+CRAWL_HTTP_PER_HOST = int(os.getenv("CRAWL_HTTP_PER_HOST", 4))
+CRAWL_HTTP_POOL_SIZE = int(os.getenv("CRAWL_HTTP_POOL_SIZE", 8))
+# 空字串代表停用磁碟快取
+CRAWL_HTTP_CACHE_DIR = os.getenv("CRAWL_HTTP_CACHE_DIR", "/app/data/http_cache")
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+
+class HTTPCache:
+    """
+    每個請求（method + url + 參數 + body）一組檔案：<key>.json 存驗證標頭與回應標頭，<key>.body 存內容。
+    以 os.replace 寫入，多個 thread / 行程同時寫也不會讀到半個檔案。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def key(method, url, params=None, data=None):
+        raw = json.dumps([method.upper(), url, sorted((params or {}).items()), data], default=str, ensure_ascii=False)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key[:2], key)
+        return base + ".json", base + ".body"
+
+    def get(self, key):
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return meta, body
+
+    @staticmethod
+    def _write(path, payload, mode):
+        # 快取只是加速用，寫入失敗（磁碟滿 / 唯讀）不影響爬取結果
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, mode) as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ [HTTP] 快取寫入失敗: {e}", flush=True)
+
+    def put(self, key, resp):
+        meta_path, body_path = self._paths(key)
+        try:
+            os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        except OSError as e:
+            print(f"⚠️ [HTTP] 無法建立快取目錄: {e}", flush=True)
+            return
+        meta = {
+            "url": resp.url,
+            "stored_at": time.time(),
+            "encoding": resp.encoding,
+            "headers": {k: v for k, v in resp.headers.items()
+                        if k.lower() in ("content-type", "etag", "last-modified")},
+        }
+        self._write(body_path, resp.content, "wb")
+        self._write(meta_path, json.dumps(meta), "w")
+
+    def touch(self, key, meta):
+        """上游回 304：內容未變，只更新確認時間"""
+        meta["stored_at"] = time.time()
+        self._write(self._paths(key)[0], json.dumps(meta), "w")
+
+
+class RateLimiter:
+    """每秒最多 rate 次（thread-safe）；多個 worker 共用一個實例即為整體速率上限"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def cached_response(meta, body):
+    """以快取內容組出 requests.Response，呼叫端照常使用 .json() / .text"""
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = body
+    resp.headers = CaseInsensitiveDict(meta.get("headers") or {})
+    resp.url = meta.get("url")
+    resp.encoding = meta.get("encoding")
+    resp.from_cache = True
+    return resp
+
+
+class CrawlerHTTP:
+    """
+    一個實例共用一個 keep-alive Session（含 cookie）。
+    cache=True 的請求會帶上次的 ETag / Last-Modified，上游回 304 時直接回傳快取內容（幾乎不耗頻寬）；
+    max_age 秒內的快取（例如已收盤的歷史資料）連請求都不送。
+    """
+
+    def __init__(self, cache_dir=CRAWL_HTTP_CACHE_DIR, max_retries=CRAWL_HTTP_MAX_RETRIES,
+                 per_host=CRAWL_HTTP_PER_HOST, timeout=None, session=None, sleep=time.sleep):
+        self.cache = HTTPCache(cache_dir) if cache_dir else None
+        self.max_retries = max_retries
+        self.per_host = per_host
+        self.timeout = timeout or (CRAWL_HTTP_CONNECT_TIMEOUT, CRAWL_HTTP_READ_TIMEOUT)
+        self._sleep = sleep
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0, "cache_hits": 0, "bytes": 0}
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=CRAWL_HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+
+    @property
+    def cookies(self):
+        return self.session.cookies
+
+    def _slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+        # full jitter：0 ~ base * 2^attempt
+        return random.uniform(0, min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX))
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=None,
+                cache=False, max_age=None, retry=None, limiter=None):
+        """
+        回傳 requests.Response（非 2xx / 304 仍會回傳，由呼叫端 raise_for_status）。
+        retry 預設只對 GET / HEAD 開啟；POST 需呼叫端確認可安全重送。
+        limiter（RateLimiter）只限制實際送出的請求，快取命中不佔額度。
+        """
+        method = method.upper()
+        retry = method in IDEMPOTENT_METHODS if retry is None else retry
+        headers = dict(headers or {})
+
+        cache_key = entry = None
+        if cache and self.cache is not None:
+            cache_key = HTTPCache.key(method, url, params, data)
+            entry = self.cache.get(cache_key)
+            if entry is not None:
+                meta, body = entry
+                if max_age is not None and time.time() - meta.get("stored_at", 0) < max_age:
+                    self._count("cache_hits")
+                    return cached_response(meta, body)
+                cached_headers = CaseInsensitiveDict(meta.get("headers") or {})
+                if cached_headers.get("ETag"):
+                    headers["If-None-Match"] = cached_headers["ETag"]
+                if cached_headers.get("Last-Modified"):
+                    headers["If-Modified-Since"] = cached_headers["Last-Modified"]
+
+        attempts = self.max_retries + 1 if retry else 1
+        for attempt in range(attempts):
+            retry_after = None
+            if limiter is not None:
+                limiter.wait()
+            try:
+                with self._slot(url):
+                    self._count("requests")
+                    resp = self.session.request(method, url, params=params, data=data, headers=headers,
+                                                timeout=timeout or self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt + 1 >= attempts:
+                    raise
+                print(f"   🔁 [HTTP] {method} {url} 失敗（{e}），重試中", flush=True)
+            else:
+                if resp.status_code == 304 and entry is not None:
+                    self._count("not_modified")
+                    # max_age 從這次確認起算
+                    meta, body = entry
+                    self.cache.touch(cache_key, meta)
+                    return cached_response(meta, body)
+                if resp.status_code not in RETRYABLE_STATUS or attempt + 1 >= attempts:
+                    self._count("bytes", len(resp.content))
+                    if cache_key and resp.status_code == 200:
+                        self.cache.put(cache_key, resp)
+                    return resp
+                retry_after = resp.headers.get("Retry-After")
+                print(f"   🔁 [HTTP] {method} {url} HTTP {resp.status_code}，重試中", flush=True)
+            self._sleep(self._backoff(attempt, retry_after))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+http_client = CrawlerHTTP()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from core.db import session_scope
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# 爬蟲工作執行器：每個工作有執行期限、有限次數的退避重試、全域併行上限，每次嘗試寫入 crawl_run
+# ============================================================
+CRAWL_MAX_CONCURRENCY = int(os.getenv("CRAWL_MAX_CONCURRENCY", 2))
+CRAWL_RETRY_BACKOFF_SECONDS = float(os.getenv("CRAWL_RETRY_BACKOFF_SECONDS", 30))
+
+
+class JobFailed(Exception):
+    """重試用盡仍失敗"""
+
+
+def start_run(job, attempt, trigger):
+    with session_scope() as session:
+        return session.execute(text("""
+            INSERT INTO crawl_run (job, attempt, trigger, status, started_at)
+            VALUES (:job, :attempt, :trigger, 'running', :now)
+            RETURNING id
+        """), {"job": job, "attempt": attempt, "trigger": trigger, "now": datetime.utcnow()}).scalar()
+
+
+def finish_run(run_id, status, duration_seconds, rows=None, error=None):
+    with session_scope() as session:
+        session.execute(text("""
+            UPDATE crawl_run
+            SET status = :status, finished_at = :now, duration_ms = :duration_ms,
+                rows_written = :rows, error = :error
+            WHERE id = :id
+        """), {
+            "id": run_id, "status": status, "now": datetime.utcnow(),
+            "duration_ms": int(duration_seconds * 1000), "rows": rows,
+            "error": error[:2000] if error else None,
+        })
+
+
+def expire_interrupted(older_than_seconds):
+    """行程中斷而停在 running 的紀錄（開始時間早於最長執行期限）標為 interrupted"""
+    with session_scope() as session:
+        result = session.execute(text("""
+            UPDATE crawl_run SET status = 'interrupted', finished_at = :now
+            WHERE status = 'running' AND started_at < :cutoff
+        """), {"now": datetime.utcnow(), "cutoff": datetime.utcnow() - timedelta(seconds=older_than_seconds)})
+        return result.rowcount
+
+
+class JobRunner:
+    """
+    同步的 pipeline 在專用 thread pool 執行。逾時後 thread 無法被中止，
+    因此記下仍在執行的 future，同一個工作在前一次結束前不會再開新的 thread（Selenium / API 卡住時不會越疊越多）。
+    async 的 pipeline 逾時時直接取消。
+    """
+
+    def __init__(self, max_concurrency=CRAWL_MAX_CONCURRENCY, backoff_seconds=CRAWL_RETRY_BACKOFF_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.backoff_seconds = backoff_seconds
+        self._semaphore = None
+        self._executor = ThreadPoolExecutor(max_workers=max(4, max_concurrency * 2), thread_name_prefix="crawl")
+        self._threads = {}
+
+    async def _call(self, name, fn, timeout):
+        if asyncio.iscoroutinefunction(fn):
+            return await asyncio.wait_for(fn(), timeout)
+        previous = self._threads.get(name)
+        if previous is not None and not previous.done():
+            raise RuntimeError("上一次執行逾時後仍未結束")
+        future = self._executor.submit(fn)
+        self._threads[name] = future
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    async def wait_idle(self, name):
+        """
+        等待該工作逾時後仍在執行的 thread 真正結束。
+        持有工作鎖的呼叫端在釋放鎖之前呼叫，其他 replica 不會與殘留的 thread 同時寫入。
+        """
+        future = self._threads.get(name)
+        if future is None or future.done():
+            return
+        logger.warning("%s worker thread is still running after timeout, holding the job lock until it exits", name)
+        started = time.monotonic()
+        await asyncio.wait([asyncio.wrap_future(future)])
+        logger.info("%s worker thread exited %.1fs later", name, time.monotonic() - started)
+
+    async def _attempt(self, name, fn, timeout, attempt, trigger):
+        """回傳 (result, error)；result 為 pipeline 回傳的 {"content", "rows"}"""
+        # semaphore 需在事件迴圈內建立
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            run_id = await asyncio.to_thread(start_run, name, attempt, trigger)
+            started = time.monotonic()
+            try:
+                result = await self._call(name, fn, timeout)
+                if not result or not result.get("content"):
+                    raise RuntimeError("沒有取得任何資料")
+            except asyncio.TimeoutError:
+                status, error = "timeout", f"超過 {timeout:.0f}s 未完成"
+            except Exception as e:
+                status, error = "failed", f"{type(e).__name__}: {e}"
+            else:
+                await asyncio.to_thread(finish_run, run_id, "success", time.monotonic() - started, result.get("rows"))
+                return result, None
+            await asyncio.to_thread(finish_run, run_id, status, time.monotonic() - started, None, error)
+            return None, error
+
+    async def run(self, name, fn, timeout, retries=0, trigger="schedule"):
+        """最多執行 retries + 1 次，兩次之間以指數退避等待；全部失敗時拋出 JobFailed"""
+        for attempt in range(1, retries + 2):
+            result, error = await self._attempt(name, fn, timeout, attempt, trigger)
+            if result is not None:
+                return result
+            if attempt > retries:
+                raise JobFailed(error)
+            delay = self.backoff_seconds * 2 ** (attempt - 1)
+            logger.warning("%s attempt %d failed (%s), retrying in %.0fs", name, attempt, error, delay)
+            await asyncio.sleep(delay)
+
+
+job_runner = JobRunner()
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import text
+
+from core.db import engine
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# 多個 crawler replica 的工作協調：Postgres advisory lock（session 層級）
+# 持有者的連線斷開（行程 / 節點掛掉）時鎖自動釋放，其他 replica 接手
+# ============================================================
+# advisory lock 的第一個 key，避免與其他服務的 advisory lock 撞號
+CRAWL_LOCK_NAMESPACE = 48_201
+CRAWL_LOCK_POLL_SECONDS = float(os.getenv("CRAWL_LOCK_POLL_SECONDS", 15))
+
+
+class AdvisoryLock:
+    """
+    以獨立連線（AUTOCOMMIT，不會 idle in transaction）持有 pg_advisory_lock(namespace, hashtext(name))。
+    同一個 name 在所有 replica 間同時只會有一個持有者。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._conn = None
+
+    @property
+    def held(self):
+        return self._conn is not None
+
+    def _connect(self):
+        return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+    def try_acquire(self):
+        if self.held:
+            return True
+        conn = self._connect()
+        try:
+            acquired = conn.execute(
+                text("SELECT pg_try_advisory_lock(:ns, hashtext(:name))"),
+                {"ns": CRAWL_LOCK_NAMESPACE, "name": self.name},
+            ).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if acquired:
+            self._conn = conn
+        else:
+            conn.close()
+        return bool(acquired)
+
+    def acquire(self):
+        """阻塞直到取得鎖"""
+        if self.held:
+            return
+        conn = self._connect()
+        try:
+            conn.execute(
+                text("SELECT pg_advisory_lock(:ns, hashtext(:name))"),
+                {"ns": CRAWL_LOCK_NAMESPACE, "name": self.name},
+            )
+        except Exception:
+            conn.close()
+            raise
+        self._conn = conn
+
+    def release(self):
+        if not self.held:
+            return
+        conn, self._conn = self._conn, None
+        try:
+            conn.execute(
+                text("SELECT pg_advisory_unlock(:ns, hashtext(:name))"),
+                {"ns": CRAWL_LOCK_NAMESPACE, "name": self.name},
+            )
+        except Exception as e:
+            # 連線已斷時鎖早已隨 session 釋放
+            logger.warning("Failed to unlock %s: %s", self.name, e)
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+async def acquire_job_lock(name, wait_seconds, done=None, poll_seconds=CRAWL_LOCK_POLL_SECONDS):
+    """
+    取得工作鎖則回傳 AdvisoryLock，否則回傳 None。
+    鎖被其他 replica 持有時每 poll_seconds 重試一次：done() 為 True（對方已完成）即放棄；
+    對方中途掛掉則鎖被釋放，由這裡接手。超過 wait_seconds 仍未取得也放棄。
+    """
+    lock = AdvisoryLock(f"crawl:{name}")
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        if await asyncio.to_thread(lock.try_acquire):
+            return lock
+        if done is not None and await asyncio.to_thread(done):
+            return None
+        if time.monotonic() >= deadline:
+            return None
+        await asyncio.sleep(min(poll_seconds, max(0.0, deadline - time.monotonic())))
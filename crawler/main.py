@@ -1,10 +1,17 @@
+import argparse
 import asyncio
 import logging
-from datetime import datetime, timedelta
+import os
+import time
+from datetime import datetime
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
+from core import crawl_state
+from core.db import ensure_schema
+from core.jobs import job_runner, expire_interrupted
+from core.locks import AdvisoryLock, acquire_job_lock
 from spiders import news_analyzer
 from spiders.weather_spider import WeatherSpider
 from spiders.beverage_spider import run_beverage_pipeline
@@ -16,80 +23,164 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 啟動時忽略新鮮度、全部重爬（也可用 --force）
+CRAWL_FORCE = os.getenv("CRAWL_FORCE", "false").lower() == "true"
+CRAWL_TIMEZONE = "Asia/Taipei"
 
+
+# 同步的 pipeline 由 job_runner 放到 thread pool 執行；皆回傳 {"content", "rows"}
 async def run_news_pipeline():
     """Run Gemini Google Search to find trending topics."""
     logger.info("=== Starting news trends pipeline ===")
-    try:
-        await news_analyzer.run()
-        logger.info("News trends pipeline complete")
-    except Exception:
-        logger.exception("News trends pipeline failed")
+    return await news_analyzer.run()
 
 
-async def run_weather_pipeline():
+def run_weather_pipeline():
     """Run weather forecast scrape and update."""
     logger.info("=== Starting weather pipeline ===")
-    try:
-        weather_spider = WeatherSpider()
-        await asyncio.to_thread(weather_spider.run)
-        logger.info("Weather pipeline complete")
-    except Exception:
-        logger.exception("Weather pipeline failed")
+    return WeatherSpider().run()
 
 
-async def run_beverage_task():
+def run_beverage_task():
     """Run beverage menu scrape and update."""
     logger.info("=== Starting beverage pipeline ===")
-    try:
-        await asyncio.to_thread(run_beverage_pipeline)
-        logger.info("Beverage pipeline complete")
-    except Exception:
-        logger.exception("Beverage pipeline failed")
+    return run_beverage_pipeline()
 
 
-async def run_fruit_pipeline():
+def run_fruit_pipeline():
     """Run fruit price scrape and update."""
     logger.info("=== Starting fruit pipeline ===")
+    logger.info("Targeting fruit data for the past 7 days.")
+    return run_fruit_crawler()
+
+
+# ============================================================
+# 每個來源各自的新鮮期限（秒）與排程（台灣時間）
+# ttl 略短於排程間隔，排程觸發時資料必定已過期；jitter（秒）避免整點同時打外部服務
+# timeout 為單次嘗試的執行期限（秒），retries 為失敗後的重試次數
+# ============================================================
+SOURCES = {
+    "weather": {
+        "pipeline": run_weather_pipeline, "ttl": 150 * 60,
+        "cron": {"hour": "*/3", "minute": 5}, "jitter": 300,
+        "timeout": 120, "retries": 2,
+    },
+    "fruit": {
+        "pipeline": run_fruit_pipeline, "ttl": 20 * 3600,
+        "cron": {"hour": 4, "minute": 30}, "jitter": 900,
+        "timeout": 600, "retries": 2,
+    },
+    "beverage": {
+        "pipeline": run_beverage_task, "ttl": 20 * 3600,
+        "cron": {"hour": 3, "minute": 0}, "jitter": 1800,
+        "timeout": 1800, "retries": 1,
+    },
+    "news": {
+        "pipeline": run_news_pipeline, "ttl": 10 * 3600,
+        "cron": {"hour": "7,17", "minute": 0}, "jitter": 900,
+        "timeout": 600, "retries": 1,
+    },
+}
+
+
+async def run_source(name, force=False, trigger="schedule"):
+    """
+    多個 replica 以 advisory lock 協調：同一來源同時只有一個 replica 執行。
+    沒搶到鎖的 replica 等待持有者：對方完成（資料變新鮮）就跳過，對方掛掉（鎖被釋放）就接手。
+    """
+    source = SOURCES[name]
+    # 最長等待時間：持有者用盡所有重試的時間再加上一個輪詢間隔
+    wait_seconds = 0 if force else source["timeout"] * (source["retries"] + 1) + 60
+    lock = await acquire_job_lock(name, wait_seconds, done=lambda: crawl_state.is_fresh(name, source["ttl"]))
+    if lock is None:
+        logger.info("%s is handled by another replica, skipped", name)
+        return
     try:
-        logger.info("Targeting fruit data for the past 7 days.")
-        await asyncio.to_thread(run_fruit_crawler)
-        
-        logger.info("Fruit pipeline complete")
-    except Exception:
-        logger.exception("Fruit pipeline failed")
+        await run_source_locked(name, source, force, trigger)
+    finally:
+        # 逾時的 thread 無法中止：等它真正結束才釋放鎖，接手的 replica 不會與它同時執行
+        await job_runner.wait_idle(name)
+        await asyncio.to_thread(lock.release)
+
+
+async def run_source_locked(name, source, force, trigger):
+    """資料仍新鮮則跳過；否則執行並寫入爬蟲狀態（成功時間、耗時、內容雜湊）"""
+    if not force:
+        try:
+            if await asyncio.to_thread(crawl_state.is_fresh, name, source["ttl"]):
+                logger.info("%s is still fresh (ttl %ds), skipped", name, source["ttl"])
+                return
+        except Exception:
+            logger.exception("Failed to read crawl state for %s, running anyway", name)
+
+    started_at = datetime.utcnow()
+    started = time.monotonic()
+    try:
+        result = await job_runner.run(name, source["pipeline"], source["timeout"], source["retries"], trigger)
+    except Exception as e:
+        logger.error("%s pipeline failed: %s", name, e)
+        try:
+            await asyncio.to_thread(crawl_state.record_failure, name, started_at, e)
+        except Exception:
+            logger.exception("Failed to record crawl state for %s", name)
+        return
+
+    elapsed = time.monotonic() - started
+    changed = await asyncio.to_thread(crawl_state.record_success, name, started_at, elapsed, result["content"])
+    logger.info("%s pipeline complete in %.1fs, %s rows (%s)", name, elapsed, result.get("rows"),
+                "content changed" if changed else "no change")
+
 
+def prepare_database():
+    # 多個 replica 同時啟動時依序建表，避免 create_all 互相衝突
+    with AdvisoryLock("crawl:schema"):
+        ensure_schema()
+        # 上次行程中斷而停在 running 的執行紀錄
+        expire_interrupted(max(source["timeout"] for source in SOURCES.values()))
 
-async def run_all():
-    """Run all spiders concurrently."""
-    await asyncio.gather(
-        run_weather_pipeline(),
-        run_beverage_task(),
-        run_news_pipeline(),
-        run_fruit_pipeline(), # 已將水果爬蟲加入並發清單
-    )
 
+async def run_all(force=False):
+    """Run all spiders concurrently (fresh sources are skipped unless forced)."""
+    trigger = "force" if force else "startup"
+    await asyncio.gather(*(run_source(name, force, trigger) for name in SOURCES))
 
-async def main():
+
+async def main(force=False, once=False):
     logger.info("Crawler service starting...")
 
-    # 1. 啟動時立刻跑一次 (Run once immediately on startup)
-    await run_all()
-
-    # 2. 設定每天凌晨 3 點的排程 (Schedule daily runs at 3 AM)
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(
-        run_all,
-        trigger=CronTrigger(hour=3, minute=0),
-        id="daily_crawl",
-        name="Daily crawl job",
-    )
+    # 0. 只補建缺少的資料表，不建立 Flask app（seed 與欄位補丁由 backend 負責）
+    try:
+        await asyncio.to_thread(prepare_database)
+    except Exception:
+        logger.exception("Schema check failed")
+
+    # 1. 啟動時補爬已過期的來源（重啟不會重爬仍新鮮的資料）
+    await run_all(force=force)
+    if once:
+        return
+
+    # 2. 每個來源依自己的排程執行
+    scheduler = AsyncIOScheduler(timezone=CRAWL_TIMEZONE)
+    for name, source in SOURCES.items():
+        scheduler.add_job(
+            run_source,
+            trigger=CronTrigger(timezone=CRAWL_TIMEZONE, jitter=source["jitter"], **source["cron"]),
+            args=(name,),
+            id=f"crawl_{name}",
+            name=f"Crawl {name}",
+        )
     scheduler.start()
-    logger.info("Scheduler started, scheduled to run daily at 03:00")
+    logger.info("Scheduler started: %s", ", ".join(
+        f"{name} {source['cron']}" for name, source in SOURCES.items()
+    ))
 
     # Keep process alive
     await asyncio.Event().wait()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force", action="store_true", help="忽略新鮮度，啟動時全部重爬")
+    parser.add_argument("--once", action="store_true", help="跑完啟動時的爬取後結束，不進入排程")
+    args = parser.parse_args()
+    asyncio.run(main(force=args.force or CRAWL_FORCE, once=args.once))
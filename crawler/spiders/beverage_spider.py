@@ -1,4 +1,3 @@
-import sys
 import os
 import time
 import re
@@ -10,13 +9,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 
-# --- 終極強制校正路徑 ---
-backend_path = "/app/backend"
-if backend_path not in sys.path:
-    sys.path.insert(0, backend_path)
-
-from app import create_app
-from app.extensions import db
+from core.db import session_scope
 from app.models import Tenant, Product
 
 # --- 基礎爬蟲類別 ---
@@ -160,8 +153,7 @@ class NidinSpider(BaseBeverageSpider):
 
 # --- 資料庫同步函數 ---
 def save_scraped_data_to_db(data_list):
-    flask_app = create_app()
-    with flask_app.app_context():
+    with session_scope() as session:
         brand_data_map = {}
         for item in data_list:
             brand = item.get('brand')
@@ -173,13 +165,13 @@ def save_scraped_data_to_db(data_list):
         for brand_name, items in brand_data_map.items():
             try:
                 brand_added_count = 0
-                tenant = Tenant.query.filter_by(name=brand_name).first()
+                tenant = session.query(Tenant).filter_by(name=brand_name).first()
                 if not tenant:
                     tenant = Tenant(name=brand_name, is_registered=True)
-                    db.session.add(tenant)
-                    db.session.flush()
+                    session.add(tenant)
+                    session.flush()
 
-                Product.query.filter_by(tenant_id=tenant.id).delete()
+                session.query(Product).filter_by(tenant_id=tenant.id).delete()
                 print(f"🧹 已清除 [{brand_name}] 的舊菜單資料", flush=True)
 
                 for item in items:
@@ -189,7 +181,7 @@ def save_scraped_data_to_db(data_list):
                         scraped_dt = datetime.datetime.strptime(item.get('scraped_at'), '%Y-%m-%d %H:%M:%S')
                     except: continue
 
-                    db.session.add(Product(
+                    session.add(Product(
                         tenant_id=tenant.id, 
                         name=drink_name,
                         category=item.get('category'), 
@@ -198,13 +190,14 @@ def save_scraped_data_to_db(data_list):
                     ))
                     brand_added_count += 1
                 
-                db.session.commit()
+                session.commit()
                 total_added_count += brand_added_count
                 print(f"✅ [{brand_name}] 同步完成，最新品項共 {brand_added_count} 筆。", flush=True)
             except Exception as e:
-                db.session.rollback()
+                session.rollback()
                 print(f"❌ [{brand_name}] 寫入失敗: {e}", flush=True)
         print(f"🎉 菜單更新作業結束，總計寫入 {total_added_count} 筆最新品項。", flush=True)
+        return total_added_count
 
 # --- 主任務函數 ---
 def run_beverage_pipeline():
@@ -239,15 +232,26 @@ def run_beverage_pipeline():
     except Exception as e:
         print(f"❌ [coco都可] 整體爬取發生錯誤，已跳過: {e}", flush=True)
         
+    written = 0
     try:
         if spider.final_menu_list:
-            save_scraped_data_to_db(spider.final_menu_list)
+            written = save_scraped_data_to_db(spider.final_menu_list)
         else:
             print("⚠️ 本次執行沒有抓到任何菜單資料", flush=True)
     except Exception as e:
         print(f"❌ 資料庫儲存發生錯誤: {e}", flush=True)
+        raise
     finally:
         spider.close()
 
+    # 菜單內容不含抓取時間，供爬蟲狀態計算內容雜湊
+    return {
+        "content": [
+            (item.get('brand'), item.get('item_name'), item.get('category'), item.get('price'))
+            for item in spider.final_menu_list
+        ],
+        "rows": written,
+    }
+
 if __name__ == "__main__":
     run_beverage_pipeline()
\ No newline at end of file
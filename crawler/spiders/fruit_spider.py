@@ -1,17 +1,23 @@
+import argparse
 import os
 import sys
-import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
-import requests
 
-# 將專案根目錄加入 sys.path，確保能匯入 app 與 models
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__name__), '..')))
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
 
-from app.extensions import db
-from app.models import Ingredient, PriceHistory
+# 將 crawler 目錄加入 sys.path，直接執行此檔時也能匯入 core
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# 目標水果清單
-TARGET_FRUITS = [
+from core.db import session_scope
+from core.http import http_client, RateLimiter
+from app.models import Ingredient, PriceHistory, FruitWatchlist, PriceSeries
+from app.price_analytics import refresh_rollups
+
+# 預設觀察清單：fruit_watchlist 為空時寫入（之後由資料表 / 管理 API 調整，要暫停請設 enabled=false 而非全部刪除）
+DEFAULT_WATCHLIST = [
     "草莓", "百香果-其他", "鳳梨-金鑽鳳梨", "甜橙-柳橙", 
     "雜柑-檸檬", "酪梨-進口", "葡萄柚-紅肉", "番石榴-紅心", 
     "芒果-其他", "蘋果-惠"
@@ -27,133 +33,444 @@ def parse_minguo(s: str) -> date:
 def to_minguo(d: date) -> str:
     return f"{d.year - 1911}.{d.month:02d}.{d.day:02d}"
 
-def get_fruit_data(start_time: str, end_time: str) -> list:
-    """呼叫農委會 API 獲取資料"""
+# 🛠️ 時光機機制：API 以「實際日期減 2 年」查詢真實歷史資料，寫入時再把年份加回
+API_YEAR_SHIFT = 2
+
+def to_api_minguo(d: date) -> str:
+    return f"{d.year - 1911 - API_YEAR_SHIFT}.{d.month:02d}.{d.day:02d}"
+
+def from_api_minguo(s: str) -> str:
+    """API 的交易日（民國）→ 資料庫使用的日期（民國）"""
+    parts = s.split('.')
+    return f"{int(parts[0]) + API_YEAR_SHIFT}.{parts[1]}.{parts[2]}"
+
+# 交易日超過這個天數的資料不再變動，快取期間內直接使用不再請求
+FINAL_AFTER_DAYS = 3
+FINAL_CACHE_SECONDS = 30 * 24 * 3600
+
+# 每次 API 查詢涵蓋的天數
+WINDOW_DAYS = 7
+
+# 主要果菜批發市場（API 的 MarketName），以逗號分隔的 FRUIT_MARKETS 覆寫
+FRUIT_MARKETS = [
+    m.strip() for m in os.getenv(
+        "FRUIT_MARKETS", "台北一,台北二,三重區,桃農,台中市,豐原區,嘉義市,高雄市,鳳山區"
+    ).split(",") if m.strip()
+]
+# 同一個區間同時查詢的市場數（實際併行仍受 CRAWL_HTTP_PER_HOST 限制）
+FRUIT_MARKET_WORKERS = int(os.getenv("FRUIT_MARKET_WORKERS", 4))
+# 各市場交易量加權後的全國均價在 price_series 中的市場名稱
+NATIONAL_MARKET = "ALL"
+
+def fetch_fruit_data(start_time: str, end_time: str, max_age=None, limiter=None, market="台北一") -> list:
+    """呼叫農委會 API 獲取單一市場的全部水果（max_age 秒內的快取直接使用）；失敗時拋出例外"""
     url = "https://data.moa.gov.tw/api/v1/AgriProductsTransType/"
     params = {
         "Start_time": start_time,
         "End_time": end_time,
-        "MarketName": "台北一",
+        "MarketName": market,
         "TcType": "N05", # N05 代表水果類
     }
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
     }
-    
-    try:
-        resp = requests.get(url, params=params, headers=headers, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("Data", [])
-    except Exception as e:
-        print(f"❌ 抓取 API 失敗 ({start_time}): {e}")
-        return []
-
-# ⚠️ 這裡移除了 create_app()，改由外部統一建立 Context 以提升效能
-def process_daily_data(target_date: date, daily_records: list):
-    """處理單日資料寫入 DB，並處理休市邏輯"""
-    today_prices = {}
-    for item in daily_records:
-        crop_name = item.get("CropName", "")
-        if crop_name in TARGET_FRUITS:
-            today_prices[crop_name] = float(item.get("Avg_Price", 0))
-
-    record_datetime = datetime(target_date.year, target_date.month, target_date.day)
-
-    for fruit_name in TARGET_FRUITS:
-        # 1. 確保該水果 (Ingredient) 存在
-        ingredient = Ingredient.query.filter_by(name=fruit_name).first()
-        if not ingredient:
-            ingredient = Ingredient(name=fruit_name)
-            db.session.add(ingredient)
-            db.session.flush()
-
-        # 2. 檢查重複與取得歷史紀錄
-        existing = PriceHistory.query.filter_by(
-            ingredient_id=ingredient.id, 
-            recorded_at=record_datetime
-        ).first()
-        if existing: continue
-
-        last_record = PriceHistory.query.filter_by(ingredient_id=ingredient.id)\
-                                        .order_by(PriceHistory.recorded_at.desc()).first()
-        last_price = float(last_record.market_price) if last_record else 0.0
-
-        # 3. 休市邏輯處理
-        if fruit_name in today_prices and today_prices[fruit_name] > 0:
-            current_price = today_prices[fruit_name]
-            change_rate = round(((current_price - last_price) / last_price) * 100, 2) if last_price > 0 else 0.0
-            print(f"[{target_date}] 🍏 {fruit_name}: {current_price} 元")
-        else:
-            if last_price > 0:
+    resp = http_client.get(url, params=params, headers=headers, cache=True, max_age=max_age, limiter=limiter)
+    resp.raise_for_status()
+    return resp.json().get("Data", [])
+
+def fetch_markets(start_time: str, end_time: str, markets=None, max_age=None, limiter=None) -> list:
+    """各市場併行查詢後合併；任一市場失敗即拋出（缺一個市場的全國均價會失真）"""
+    markets = markets or FRUIT_MARKETS
+    with ThreadPoolExecutor(max_workers=min(len(markets), FRUIT_MARKET_WORKERS), thread_name_prefix="fruit-market") as pool:
+        futures = [
+            pool.submit(fetch_fruit_data, start_time, end_time, max_age, limiter, market)
+            for market in markets
+        ]
+        records = []
+        for future in futures:
+            records.extend(future.result())
+    return records
+
+def national_prices(records) -> list:
+    """
+    同一交易日、同一品項（CropCode）跨市場以交易量加權：Σ(均價 × 交易量) / Σ交易量。
+    當天各市場交易量皆為 0 時取簡單平均。回傳與 API 相同欄位的資料，MarketName 為 NATIONAL_MARKET。
+    """
+    totals = {}
+    for r in records:
+        price = float(r.get("Avg_Price") or 0)
+        crop_code, trans_date = r.get("CropCode"), r.get("TransDate")
+        if price <= 0 or not crop_code or not trans_date:
+            continue
+        volume = float(r.get("Trans_Quantity") or 0)
+        # [CropName, Σ均價×量, Σ量, Σ均價, 市場數]
+        t = totals.setdefault((trans_date, crop_code), [r.get("CropName", ""), 0.0, 0.0, 0.0, 0])
+        t[1] += price * volume
+        t[2] += volume
+        t[3] += price
+        t[4] += 1
+    return [{
+        "TransDate": trans_date,
+        "CropCode": crop_code,
+        "CropName": crop_name,
+        "MarketName": NATIONAL_MARKET,
+        "Avg_Price": round(weighted / volume if volume > 0 else price_sum / count, 2),
+        "Trans_Quantity": volume,
+    } for (trans_date, crop_code), (crop_name, weighted, volume, price_sum, count) in totals.items()]
+
+# 單一 INSERT 的最大列數（多年回補時分成幾個批次）
+INSERT_BATCH_SIZE = 5000
+
+def load_watchlist(session) -> dict:
+    """
+    啟用中的觀察清單 {CropName: ingredient_id}。清單為空時寫入 DEFAULT_WATCHLIST；
+    尚未對應 ingredient 的品項依名稱對應，不存在則建立。
+    """
+    if session.query(FruitWatchlist.id).first() is None:
+        stmt = insert(FruitWatchlist).values([{"crop_name": name, "enabled": True} for name in DEFAULT_WATCHLIST])
+        session.execute(stmt.on_conflict_do_nothing(index_elements=['crop_name']))
+    items = session.query(FruitWatchlist).filter(FruitWatchlist.enabled.is_(True)).all()
+
+    unmapped = [item for item in items if item.ingredient_id is None]
+    if unmapped:
+        names = [item.crop_name for item in unmapped]
+        ids = dict(session.query(Ingredient.name, Ingredient.id).filter(Ingredient.name.in_(names)).all())
+        for item in unmapped:
+            if item.crop_name not in ids:
+                ingredient = Ingredient(name=item.crop_name)
+                session.add(ingredient)
+                session.flush()
+                ids[item.crop_name] = ingredient.id
+            item.ingredient_id = ids[item.crop_name]
+        session.flush()
+    return {item.crop_name: item.ingredient_id for item in items}
+
+def load_price_state(session, ingredient_ids, start: datetime, end: datetime):
+    """
+    一次載入：各水果在區間開始前的最後價格（休市延用的起點），以及區間內已存在的價格。
+    回傳 (last_prices {ingredient_id: price}, existing {(ingredient_id, recorded_at): price})
+    """
+    ids = list(ingredient_ids)
+    last_prices = {
+        r.ingredient_id: float(r.market_price)
+        for r in session.execute(text("""
+            SELECT DISTINCT ON (ingredient_id) ingredient_id, market_price
+            FROM price_history
+            WHERE ingredient_id = ANY(:ids) AND recorded_at < :start
+            ORDER BY ingredient_id, recorded_at DESC
+        """), {"ids": ids, "start": start})
+    }
+    existing = {
+        (r.ingredient_id, r.recorded_at): float(r.market_price)
+        for r in session.execute(text("""
+            SELECT ingredient_id, recorded_at, market_price
+            FROM price_history
+            WHERE ingredient_id = ANY(:ids) AND recorded_at BETWEEN :start AND :end
+        """), {"ids": ids, "start": start, "end": end})
+    }
+    return last_prices, existing
+
+def build_price_rows(days, grouped_records, ingredient_ids, last_prices, existing, today: date) -> list:
+    """
+    依日期順序在記憶體中計算每日價格與漲跌幅；休市（無報價）延用前一日價格。
+    today 以後的日期尚未收盤，沒有報價就不寫入（否則延用的價格會讓當天的實際報價無法寫入）。
+    已存在的資料列不重寫，但作為下一日的比較基準。last_prices 會就地更新。
+    """
+    rows = []
+    for target_date in days:
+        today_prices = {}
+        for item in grouped_records.get(to_minguo(target_date), []):
+            crop_name = item.get("CropName", "")
+            if crop_name in ingredient_ids:
+                today_prices[crop_name] = float(item.get("Avg_Price", 0))
+
+        record_datetime = datetime(target_date.year, target_date.month, target_date.day)
+        for fruit_name, ingredient_id in ingredient_ids.items():
+            last_price = last_prices.get(ingredient_id, 0.0)
+            if (ingredient_id, record_datetime) in existing:
+                last_prices[ingredient_id] = existing[(ingredient_id, record_datetime)]
+                continue
+
+            if today_prices.get(fruit_name, 0) > 0:
+                current_price = today_prices[fruit_name]
+                change_rate = round(((current_price - last_price) / last_price) * 100, 2) if last_price > 0 else 0.0
+            elif last_price > 0 and target_date < today:
                 current_price = last_price
                 change_rate = 0.0
-                print(f"[{target_date}] 💤 {fruit_name}: 休市，延用價格 {current_price}")
-            else: continue 
-
-        # 4. 寫入
-        db.session.add(PriceHistory(
-            ingredient_id=ingredient.id,
-            market_price=current_price,
-            change_rate=change_rate,
-            recorded_at=record_datetime
-        ))
-
-    db.session.commit()
-
-def run_crawler():
-    # 👇 把 app_context 開在最外層，整個爬蟲過程只啟動一次 Flask
-    from app import create_app
-    flask_app = create_app()
-    
-    with flask_app.app_context():
-        # 👇 直接計算從今天往前推 7 天的日期
-        today = date.today()
-        start_date = today - timedelta(days=7)
-
-        print(f"🚀 開始整合爬取水果價格：{start_date} ~ {today}")
-
-        current = start_date
-        while current <= today:
-            end = current + timedelta(days=6)
-            if end > today:
-                end = today
-
-            # 🛠️ 時光機機制：打 API 時，將年份減 2 年 (例如 115 轉 113) 來獲取真實歷史資料
-            api_start_str = f"{current.year - 1913}.{current.month:02d}.{current.day:02d}"
-            api_end_str = f"{end.year - 1913}.{end.month:02d}.{end.day:02d}"
-            
-            print(f"📡 正在請求 API (以 {api_start_str} ~ {api_end_str} 替代實際 2026 年資料)...")
-            records = get_fruit_data(api_start_str, api_end_str)
-
-            # 將這週的資料依照「假日期」(把年份加回 2 年) 分組
-            grouped_data = {}
-            for r in records:
-                orig_date = r.get("TransDate") # e.g., "113.03.07"
-                if not orig_date: continue
-                
-                parts = orig_date.split('.')
-                # 轉回 2026 (民國 115) 讓資料庫時間正確
-                fake_future_date = f"{int(parts[0]) + 2}.{parts[1]}.{parts[2]}" 
-                
-                if fake_future_date not in grouped_data:
-                    grouped_data[fake_future_date] = []
-                grouped_data[fake_future_date].append(r)
-
-            day_iter = current
-            while day_iter <= end:
-                day_str = to_minguo(day_iter)
-                daily_records = grouped_data.get(day_str, []) 
-                
-                process_daily_data(day_iter, daily_records)
-                
-                day_iter += timedelta(days=1)
-
-            current = end + timedelta(days=1)
-            time.sleep(1)
-
-    print("🎉 所有價格資料已成功寫入資料庫！")
+            else:
+                continue
+
+            rows.append({
+                "ingredient_id": ingredient_id,
+                "market_price": current_price,
+                "change_rate": change_rate,
+                "recorded_at": record_datetime,
+            })
+            last_prices[ingredient_id] = current_price
+    return rows
+
+def insert_price_rows(session, rows) -> int:
+    """INSERT ... ON CONFLICT (ingredient_id, recorded_at) DO NOTHING，回傳實際寫入筆數"""
+    written = 0
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        stmt = insert(PriceHistory).values(rows[i:i + INSERT_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_nothing(index_elements=['ingredient_id', 'recorded_at'])
+        written += session.execute(stmt).rowcount
+    return written
+
+# ============================================================
+# 每日價格序列（price_series）：每個品項 × 市場 × 年份一列，整年的每日均價 / 交易量存在陣列中，
+# 全品項 × 全市場的列數只隨年份成長，不隨天數成長
+# ============================================================
+SERIES_DAYS = 366
+SERIES_BATCH_SIZE = 500
+
+def day_index(d: date) -> int:
+    """當年第幾天（1/1 = 0），即陣列索引"""
+    return d.timetuple().tm_yday - 1
+
+def series_updates(records) -> dict:
+    """{(CropCode, 市場, 年份): (CropName, {陣列索引: (均價, 交易量)})}；日期為加回年份後的日期"""
+    updates = {}
+    for r in records:
+        price = float(r.get("Avg_Price") or 0)
+        crop_code, market, trans_date = r.get("CropCode"), r.get("MarketName"), r.get("TransDate")
+        if price <= 0 or not crop_code or not market or not trans_date:
+            continue
+        d = parse_minguo(from_api_minguo(trans_date))
+        crop_name, days = updates.setdefault((crop_code, market, d.year), (r.get("CropName", ""), {}))
+        days[day_index(d)] = (price, float(r.get("Trans_Quantity") or 0))
+    return updates
+
+def upsert_price_series(session, records) -> int:
+    """
+    以 FOR UPDATE 一次載入受影響的列，在記憶體中填入新的日期後整列寫回（INSERT ... ON CONFLICT DO UPDATE）。
+    一個區間的全品項 × 全市場只需一次 SELECT 與少數幾次 INSERT，回傳更新的列數。
+    """
+    updates = series_updates(records)
+    if not updates:
+        return 0
+    keys = list(updates)
+    existing = {
+        (r.crop_code, r.market, r.year): (list(r.prices), list(r.volumes))
+        for r in session.execute(text("""
+            SELECT s.crop_code, s.market, s.year, s.prices, s.volumes
+            FROM price_series s
+            JOIN unnest(CAST(:codes AS text[]), CAST(:markets AS text[]), CAST(:years AS int[]))
+                AS k(crop_code, market, year)
+              ON s.crop_code = k.crop_code AND s.market = k.market AND s.year = k.year
+            FOR UPDATE OF s
+        """), {
+            "codes": [k[0] for k in keys],
+            "markets": [k[1] for k in keys],
+            "years": [k[2] for k in keys],
+        })
+    }
+
+    now = datetime.utcnow()
+    rows = []
+    for key, (crop_name, days) in updates.items():
+        prices, volumes = existing.get(key) or ([None] * SERIES_DAYS, [None] * SERIES_DAYS)
+        for i, (price, volume) in days.items():
+            prices[i] = price
+            volumes[i] = volume
+        rows.append({
+            "crop_code": key[0], "market": key[1], "year": key[2], "crop_name": crop_name,
+            "prices": prices, "volumes": volumes, "updated_at": now,
+        })
+    for i in range(0, len(rows), SERIES_BATCH_SIZE):
+        stmt = insert(PriceSeries).values(rows[i:i + SERIES_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['crop_code', 'market', 'year'],
+            set_={
+                "crop_name": stmt.excluded.crop_name,
+                "prices": stmt.excluded.prices,
+                "volumes": stmt.excluded.volumes,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        session.execute(stmt)
+    return len(rows)
+
+def window_ranges(start_date: date, end_date: date) -> list:
+    """[start_date, end_date] 切成 WINDOW_DAYS 天的區間"""
+    windows = []
+    current = start_date
+    while current <= end_date:
+        end = min(current + timedelta(days=WINDOW_DAYS - 1), end_date)
+        windows.append((current, end))
+        current = end + timedelta(days=1)
+    return windows
+
+def fetch_window(start: date, end: date, today: date, limiter=None, markets=None) -> list:
+    """單一區間、所有市場的原始資料；已收盤的歷史區間走快取"""
+    final = end <= today - timedelta(days=FINAL_AFTER_DAYS)
+    return fetch_markets(
+        to_api_minguo(start), to_api_minguo(end), markets,
+        max_age=FINAL_CACHE_SECONDS if final else None, limiter=limiter,
+    )
+
+def group_by_date(records) -> dict:
+    """依「假日期」(把年份加回 2 年) 分組：{民國日期: [資料]}"""
+    grouped_data = {}
+    for r in records:
+        orig_date = r.get("TransDate") # e.g., "113.03.07"
+        if not orig_date: continue
+        grouped_data.setdefault(from_api_minguo(orig_date), []).append(r)
+    return grouped_data
+
+def ingest_window(session, ingredient_ids, start: date, end: date, records, today: date) -> int:
+    """
+    單一區間：全品項 × 各市場與全國均價寫入 price_series；觀察清單內的品項以全國均價
+    （載入區間前的最後價格與已存在資料，在記憶體中補齊休市日）批次寫入 PriceHistory，回傳其寫入筆數
+    """
+    national = national_prices(records)
+    upsert_price_series(session, records + national)
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    last_prices, existing = load_price_state(
+        session, ingredient_ids.values(),
+        datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time()),
+    )
+    rows = build_price_rows(days, group_by_date(national), ingredient_ids, last_prices, existing, today)
+    return insert_price_rows(session, rows)
+
+def refresh_price_rollups(ingredient_ids):
+    """
+    價格分析的每日彙總（API 直接讀取；數值未變的日子不會改寫）。
+    在價格寫入 commit 之後以獨立的 transaction 執行：彙總失敗不會讓已寫入的價格 rollback，
+    下一次執行會從完整的 price_history 重算
+    """
+    try:
+        with session_scope() as session:
+            refresh_rollups(session, ingredient_ids)
+    except Exception as e:
+        print(f"⚠️ 價格彙總重算失敗（價格資料已寫入）: {e}", flush=True)
+
+def run_crawler(start_date: date = None, end_date: date = None):
+    """
+    預設爬取今天往前推 7 天；回傳 {"content": 原始資料, "rows": 寫入筆數}。
+    抓取失敗的區間不寫入（避免把休市延用價格當成資料），其他區間照常 commit 後拋出例外，
+    由 job runner 記錄失敗並重試（已寫入的資料不會重複寫入）。
+    """
+    today = date.today()
+    end_date = end_date or today
+    start_date = start_date or today - timedelta(days=7)
+
+    print(f"🚀 開始整合爬取水果價格：{start_date} ~ {end_date}（{len(FRUIT_MARKETS)} 個市場）")
+    all_records = []
+    written = 0
+    failed = []
+    with session_scope() as session:
+        ingredient_ids = load_watchlist(session)
+        for start, end in window_ranges(start_date, end_date):
+            print(f"📡 正在請求 API (以 {to_api_minguo(start)} ~ {to_api_minguo(end)} 替代實際資料)...")
+            try:
+                records = fetch_window(start, end, today)
+            except Exception as e:
+                print(f"❌ 抓取 API 失敗 ({to_api_minguo(start)}): {e}")
+                failed.append(f"{start} ~ {end}: {e}")
+                continue
+            all_records.extend(records)
+            written += ingest_window(session, ingredient_ids, start, end, records, today)
+
+    refresh_price_rollups(ingredient_ids.values())
+    if failed:
+        raise RuntimeError(f"{len(failed)} 個區間抓取失敗（已新增 {written} 筆）: " + "; ".join(failed))
+    print(f"🎉 所有價格資料已成功寫入資料庫！新增 {written} 筆")
+    return {"content": all_records, "rows": written}
+
+# ============================================================
+# 歷史回補：多個 worker 併行抓取（整體速率上限），依日期順序寫入並記錄檢查點，中斷後可接續
+# ============================================================
+BACKFILL_JOB = "fruit"
+BACKFILL_WORKERS = int(os.getenv("FRUIT_BACKFILL_WORKERS", 4))
+BACKFILL_RPS = float(os.getenv("FRUIT_BACKFILL_RPS", 2))
+
+def completed_windows(session, job=BACKFILL_JOB) -> set:
+    rows = session.execute(
+        text("SELECT window_start, window_end FROM backfill_checkpoint WHERE job = :job"), {"job": job}
+    ).all()
+    return {(r.window_start, r.window_end) for r in rows}
+
+def mark_window_done(session, start: date, end: date, written: int, job=BACKFILL_JOB):
+    session.execute(text("""
+        INSERT INTO backfill_checkpoint (job, window_start, window_end, rows_written, completed_at)
+        VALUES (:job, :start, :end, :written, :now)
+        ON CONFLICT (job, window_start) DO UPDATE SET
+            window_end = EXCLUDED.window_end,
+            rows_written = EXCLUDED.rows_written,
+            completed_at = EXCLUDED.completed_at
+    """), {"job": job, "start": start, "end": end, "written": written, "now": datetime.utcnow()})
+
+def run_backfill(start_date: date, end_date: date, workers=BACKFILL_WORKERS, rps=BACKFILL_RPS, restart=False):
+    """
+    只處理尚未完成的區間。抓取併行（最多 workers * 2 個區間在途，記憶體不隨範圍成長），
+    寫入依日期順序：休市延用價格需要前一個區間的資料。每個區間的資料與檢查點在同一個 transaction commit，
+    任一區間抓取失敗即停止，下次從該區間接續。
+    """
+    today = date.today()
+    limiter = RateLimiter(rps)
+    with session_scope() as session:
+        if restart:
+            session.execute(text("DELETE FROM backfill_checkpoint WHERE job = :job"), {"job": BACKFILL_JOB})
+            session.commit()
+        done = completed_windows(session)
+        ingredient_ids = load_watchlist(session)
+        session.commit()
+
+    pending = [w for w in window_ranges(start_date, end_date) if w not in done]
+    print(f"🚀 水果價格回補 {start_date} ~ {end_date}：{len(pending)} 個區間待處理"
+          f"（已完成 {len(done)}），{workers} workers / {rps:g} req/s", flush=True)
+
+    written = 0
+    completed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fruit-backfill") as pool:
+        in_flight = deque()
+        queue = iter(pending)
+
+        def submit_next():
+            window = next(queue, None)
+            if window is not None:
+                in_flight.append((window, pool.submit(fetch_window, window[0], window[1], today, limiter)))
+
+        for _ in range(workers * 2):
+            submit_next()
+
+        while in_flight:
+            (start, end), future = in_flight.popleft()
+            try:
+                records = future.result()
+            except Exception as e:
+                print(f"❌ 區間 {start} ~ {end} 抓取失敗，停止回補（下次從此接續）: {e}", flush=True)
+                for _, f in in_flight:
+                    f.cancel()
+                break
+            submit_next()
+            with session_scope() as session:
+                n = ingest_window(session, ingredient_ids, start, end, records, today)
+                mark_window_done(session, start, end, n)
+            written += n
+            completed += 1
+            if completed % 20 == 0 or not in_flight:
+                print(f"   ✅ {completed}/{len(pending)} 個區間完成（至 {end}），新增 {written} 筆", flush=True)
+
+    if written:
+        refresh_price_rollups(ingredient_ids.values())
+    print(f"🎉 回補結束：{completed}/{len(pending)} 個區間、新增 {written} 筆", flush=True)
+    return {"windows": completed, "pending": len(pending), "rows": written}
 
 if __name__ == "__main__":
-    # 這裡不再需要 sys.argv 傳入參數，直接執行即可
-    run_crawler()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backfill", nargs=2, metavar=("START", "END"), help="回補區間，例如 2020-01-01 2024-12-31")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--rps", type=float, default=BACKFILL_RPS)
+    parser.add_argument("--restart", action="store_true", help="清除檢查點，從頭回補")
+    args = parser.parse_args()
+
+    if args.backfill:
+        run_backfill(
+            date.fromisoformat(args.backfill[0]), date.fromisoformat(args.backfill[1]),
+            workers=args.workers, rps=args.rps, restart=args.restart,
+        )
+    else:
+        run_crawler()
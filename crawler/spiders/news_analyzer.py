@@ -7,7 +7,6 @@ then saves combined results + hashtags to ExternalTrends.
 
 import os
 import re
-import sys
 import asyncio
 import logging
 from collections import Counter
@@ -17,13 +16,8 @@ from dotenv import load_dotenv
 from google import genai
 from google.genai.types import GenerateContentConfig, GoogleSearch, Tool
 
-# --- Flask / DB imports ---
-backend_path = "/app/backend"
-if backend_path not in sys.path:
-    sys.path.insert(0, backend_path)
-
-from app import create_app
-from app.extensions import db
+# --- DB imports（不建立 Flask app）---
+from core.db import session_scope
 from app.models import ExternalTrends
 
 logger = logging.getLogger(__name__)
@@ -76,7 +70,7 @@ async def google_search_once(client, content, grounding_tool, i):
 async def run():
     """
     Run Gemini Google Search grounding to find trending topics,
-    then save results to ExternalTrends.
+    then save results to ExternalTrends. Returns {"content", "rows"}.
     """
     load_dotenv()
     api_key = os.environ.get("GEMINI_API_KEY", "")
@@ -141,12 +135,10 @@ Hashtag x 3
     logger.info("Extracted %d unique hashtags", len(sorted_tags))
 
     # --- Save to DB ---
-    flask_app = create_app()
-    with flask_app.app_context():
-        trend = ExternalTrends(
+    with session_scope() as session:
+        session.add(ExternalTrends(
             hashtag=hashtag_string,
             summary=combined_text,
-        )
-        db.session.add(trend)
-        db.session.commit()
-        logger.info("[DB] Saved 1 ExternalTrends record")
+        ))
+    logger.info("[DB] Saved 1 ExternalTrends record")
+    return {"content": {"hashtag": hashtag_string, "summary": combined_text}, "rows": 1}
@@ -1,4 +1,3 @@
-import requests
 from bs4 import BeautifulSoup
 import json
 import os
@@ -6,6 +5,8 @@ import random
 import logging
 from datetime import datetime
 
+from core.http import CrawlerHTTP
+
 logger = logging.getLogger(__name__)
 
 USER_AGENTS = [
@@ -39,7 +40,8 @@ def get_cookies(session, headers):
 def fetch_story(session, headers, href):
     """Fetch the story content from a news article page using div.story."""
     try:
-        resp = session.get(href, headers=headers, timeout=15)
+        # 文章內容發佈後幾乎不變，一天內重跑直接使用快取
+        resp = session.get(href, headers=headers, timeout=15, cache=True, max_age=24 * 3600)
         resp.raise_for_status()
         resp.encoding = "utf-8"
         soup = BeautifulSoup(resp.text, "html.parser")
@@ -85,7 +87,8 @@ def fetch_news(session, headers, date_str, stop_time=None):
             "tSi": 0,
             "tAr": 0,
         }
-        resp = session.post(url, data=data, headers=headers)
+        # 列表查詢不會改變伺服器狀態，可安全重送
+        resp = session.post(url, data=data, headers=headers, retry=True)
         resp.raise_for_status()
 
         html = resp.text.strip()
@@ -197,7 +200,8 @@ def run(date_str=None, stop_time=None):
         "Referer": "https://www.ettoday.net/news/news-list.htm",
     }
 
-    session = requests.Session()
+    # 同一個 Session 保留 cookie，並共用連線池
+    session = CrawlerHTTP()
 
     logger.info("Step 1: Getting cookies...")
     get_cookies(session, headers)
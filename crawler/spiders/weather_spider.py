@@ -1,21 +1,19 @@
-import requests
-import time
+import os
 from datetime import datetime, date
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy import delete
-import sys
-import os
 
-# --- 終極強制校正路徑 ---
-backend_path = "/app/backend"
-if backend_path not in sys.path:
-    sys.path.insert(0, backend_path)
-# -----------------------
-
-from app import create_app
-from app.extensions import db  # 改從 extensions 直接拿 db 最安全
+from core.db import session_scope
+from core.http import http_client
 from app.models import WeatherForecast 
 
+# Open-Meteo 的 latitude / longitude 可帶逗號分隔清單，一次取回多個城市
+WEATHER_CITIES_PER_REQUEST = int(os.getenv("WEATHER_CITIES_PER_REQUEST", 50))
+WEATHER_TIMEOUT = (3.05, 10)  # (connect, read)
+FORECAST_DAYS = 7
+DAILY_FIELDS = "temperature_2m_max,temperature_2m_min,precipitation_probability_max"
+UPSERT_COLUMNS = ['min_temp', 'max_temp', 'rain_prob', 'condition', 'recommendation', 'updated_at']
+
 class WeatherSpider:
     def __init__(self):
         self.url = "https://api.open-meteo.com/v1/forecast"
@@ -47,48 +45,82 @@ class WeatherSpider:
         elif rain_prob > 30: return "Cloudy"
         else: return "Sunny"
 
+    def fetch_forecasts(self, client=None):
+        """
+        分批（每批 WEATHER_CITIES_PER_REQUEST 個城市）向 Open-Meteo 取 7 日預報。
+        回傳 {city_name: daily}，取數失敗的批次略過。
+        """
+        client = client or http_client
+        names = list(self.cities)
+        forecasts = {}
+        for start in range(0, len(names), WEATHER_CITIES_PER_REQUEST):
+            batch = names[start:start + WEATHER_CITIES_PER_REQUEST]
+            params = {
+                "latitude": ",".join(str(self.cities[n]["lat"]) for n in batch),
+                "longitude": ",".join(str(self.cities[n]["lon"]) for n in batch),
+                "daily": DAILY_FIELDS,
+                "timezone": "Asia/Taipei", "forecast_days": FORECAST_DAYS
+            }
+            try:
+                # 上游資料未更新時以 ETag / Last-Modified 取回 304，直接使用快取
+                res = client.get(self.url, params=params, timeout=WEATHER_TIMEOUT, cache=True)
+                res.raise_for_status()
+                payload = res.json()
+            except Exception as e:
+                print(f"❌ 天氣批次 {batch[0]}…{batch[-1]} 失敗: {e}")
+                continue
+            # 單一座標時回傳物件，多個座標時回傳與輸入同順序的陣列
+            if isinstance(payload, dict):
+                payload = [payload]
+            for city_name, item in zip(batch, payload):
+                daily = item.get("daily") or {}
+                if daily:
+                    forecasts[city_name] = daily
+        return forecasts
+
+    def build_rows(self, forecasts, now=None):
+        """{city_name: daily} → weather_forecast 的資料列；缺值的日期略過"""
+        now = now or datetime.now()
+        rows = []
+        for city_name, daily in forecasts.items():
+            for i, day in enumerate(daily.get("time", [])):
+                max_t = daily["temperature_2m_max"][i]
+                min_t = daily["temperature_2m_min"][i]
+                rain_prob = daily["precipitation_probability_max"][i]
+                if max_t is None or min_t is None or rain_prob is None:
+                    continue
+                max_t, min_t, rain_prob = int(max_t), int(min_t), int(rain_prob)
+                avg_t = int((max_t + min_t) / 2)
+                rows.append({
+                    "city_name": city_name, "forecast_date": day,
+                    "min_temp": min_t, "max_temp": max_t, "rain_prob": rain_prob,
+                    "condition": self._determine_condition(rain_prob),
+                    "recommendation": self._get_recommendation(avg_t, rain_prob),
+                    "updated_at": now,
+                })
+        return rows
+
+    def upsert_rows(self, session, rows):
+        """單一多列 INSERT ... ON CONFLICT DO UPDATE 寫入全部城市 / 日期"""
+        if not rows:
+            return 0
+        stmt = insert(WeatherForecast).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['city_name', 'forecast_date'],
+            set_={k: getattr(stmt.excluded, k) for k in UPSERT_COLUMNS}
+        )
+        session.execute(stmt)
+        return len(rows)
+
     def run(self):
+        """回傳 {"content": 本次取得的 {city_name: daily}, "rows": 寫入筆數}"""
         print("🌤️ 開始執行一週天氣更新任務...")
-        
-        # 產生 Flask 實例
-        flask_app = create_app()
-        
-        # 開啟 app_context 來操作資料庫
-        with flask_app.app_context():
-            for city_name, coord in self.cities.items():
-                params = {
-                    "latitude": coord["lat"], "longitude": coord["lon"],
-                    "daily": "temperature_2m_max,temperature_2m_min,precipitation_probability_max",
-                    "timezone": "Asia/Taipei", "forecast_days": 7
-                }
-                try:
-                    res = requests.get(self.url, params=params).json()
-                    daily = res.get("daily", {})
-                    if not daily: continue
-
-                    for i in range(7):
-                        max_t, min_t = int(daily["temperature_2m_max"][i]), int(daily["temperature_2m_min"][i])
-                        rain_prob = int(daily["precipitation_probability_max"][i])
-                        avg_t = int((max_t + min_t) / 2)
 
-                        stmt = insert(WeatherForecast).values(
-                            city_name=city_name, forecast_date=daily["time"][i],
-                            min_temp=min_t, max_temp=max_t, rain_prob=rain_prob,
-                            condition=self._determine_condition(rain_prob),
-                            recommendation=self._get_recommendation(avg_t, rain_prob),
-                            updated_at=datetime.now()
-                        )
-                        stmt = stmt.on_conflict_do_update(
-                            index_elements=['city_name', 'forecast_date'],
-                            set_={k: getattr(stmt.excluded, k) for k in ['min_temp', 'max_temp', 'rain_prob', 'condition', 'recommendation', 'updated_at']}
-                        )
-                        db.session.execute(stmt)
-                    print(f"✅ {city_name} 同步完成")
-                    time.sleep(0.1)
-                except Exception as e:
-                    print(f"❌ {city_name} 失敗: {e}")
+        forecasts = self.fetch_forecasts()
+        rows = self.build_rows(forecasts)
 
-            db.session.commit()
-            db.session.execute(delete(WeatherForecast).where(WeatherForecast.forecast_date < date.today()))
-            db.session.commit()
-            print("🎉 天氣任務全數完成！")
\ No newline at end of file
+        with session_scope() as session:
+            written = self.upsert_rows(session, rows)
+            session.execute(delete(WeatherForecast).where(WeatherForecast.forecast_date < date.today()))
+        print(f"🎉 天氣任務全數完成！{len(forecasts)}/{len(self.cities)} 個城市、{written} 筆預報")
+        return {"content": forecasts, "rows": written}
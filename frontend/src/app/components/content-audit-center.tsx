@@ -8,16 +8,18 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogFooter } from '@/app/components/ui/dialog';
 import { Textarea } from '@/app/components/ui/textarea';
 import { ImageUploader } from './content-audit/image-uploader';
-import { GeneratedGallery, generateMockImages, GenerationStatus, GeneratedImage } from './content-audit/generated-gallery';
+import { GeneratedGallery, GenerationStatus, GeneratedImage } from './content-audit/generated-gallery';
 import { SocialPreviewTabs } from './content-audit/social-preview-tabs';
 import { TEMPLATES } from './content-audit/template-picker';
 import { cn } from '@/app/components/ui/utils';
 import { BobaProgress } from '@/app/components/ui/BobaProgress';
 import { useGenerationPolling } from '@/app/hooks/useGenerationPolling';
+import { useIdempotencyKey } from '@/app/hooks/useIdempotencyKey';
 import { TeaFlowProgressBar } from '@/app/components/ui/TeaFlowProgressBar';
 import { useTeaFlowFakeProgress } from '@/app/hooks/useTeaFlowFakeProgress';
 import { Instagram, Facebook, Link2 } from 'lucide-react';
 import { toast } from 'sonner';
+import { idempotentPost } from '@/app/services/idempotentRequest';
 
 type Stage = 'waiting_input' | 'copy_generating' | 'copy_ready' | 'image_generating' | 'done';
 
@@ -69,6 +71,9 @@ export function ContentAuditCenter() {
   const [showBobaProgress, setShowBobaProgress] = useState(false);
   const [selectedStyleName, setSelectedStyleName] = useState<string>('');
   const [publishPlatform, setPublishPlatform] = useState<'ig' | 'fb' | 'sync'>('fb');
+  // 生圖 / 發佈各自的 Idempotency-Key：連線中斷後重按沿用同一個 key，不會重複產圖或重複發文
+  const generateKey = useIdempotencyKey();
+  const publishKey = useIdempotencyKey();
 
   const {
     progress: teaFlowProgress,
@@ -200,33 +205,10 @@ export function ContentAuditCenter() {
     startGeneration({ drink_name: selectedProduct });
   };
 
-  const handleGenerateImage = async (copyId?: string) => {
-    if (!uploadedImage) return;
-    const copyIdToUse = copyId || selectedCopyId;
-    if (!copyIdToUse) return;
-    const copy = copyCandidates.find(c => c.id === copyIdToUse);
-    if (!copy) return;
-
-    setStage('image_generating');
-    setGenerationStatus('generating');
-
-    generateMockImages(uploadedImage)
-      .then((images) => {
-        setGeneratedImages(images);
-        setGenerationStatus('done');
-        setStage('done');
-        if (images.length > 0) setSelectedImage(images[0].id);
-      })
-      .catch((error) => {
-        setGenerationStatus('idle');
-        setStage('copy_ready');
-        setErrorMessage(`圖片生成失敗: ${error.message}`);
-      });
-  };
-
   const handleSelectImage = (imageId: string) => setSelectedImage(imageId);
 
-  const handleRegenerate = () => selectedCopyId && handleGenerateImage();
+  // 後端偵測到相同產品照與文案時會直接提供先前的方案；按「重新生成」才帶 regenerate=1 強制重新產圖
+  const handleRegenerate = () => selectedCopyId && handleSelectCopyStyle(selectedCopyId, true);
 
   const handleEditCopy = (e: React.MouseEvent, copyId: string) => {
     e.stopPropagation();
@@ -252,7 +234,7 @@ export function ContentAuditCenter() {
     setEditTextValue('');
   };
 
-  const handleSelectCopyStyle = async (copyId: string) => {
+  const handleSelectCopyStyle = async (copyId: string, regenerate = false) => {
       // 1. UI 狀態初始化
       setSelectedCopyId(copyId);
       setErrorMessage(null);
@@ -275,14 +257,15 @@ export function ContentAuditCenter() {
         formData.append('file', blob, 'product_image.jpg');
         formData.append('product_name', selectedProduct);
         formData.append('copywriting', finalPrompt || '');
+        if (regenerate) formData.append('regenerate', '1');
 
         // 3. 呼叫後端 API
-        const response = await fetch('/api/upload_and_generate', {
-          method: 'POST',
+        const response = await idempotentPost('/api/upload_and_generate', {
           body: formData,
-        });
+        }, generateKey.keyFor([uploadedImage, selectedProduct, copyId, finalPrompt, regenerate]));
 
         const startData = await response.json();
+        generateKey.settle();
 
         if (startData.status === 'pending' && startData.task_id) {
           const taskId = startData.task_id;
@@ -293,6 +276,16 @@ export function ContentAuditCenter() {
               const statusRes = await fetch(`/api/upload_and_generate/status/${taskId}`);
               const data = await statusRes.json();
 
+              // 部分方案已完成：先顯示在畫廊中，其餘繼續輪詢
+              if (data.status === 'processing' && data.partial && Array.isArray(data.images)) {
+                setGeneratedImages(data.images.map((b64: string, index: number) => ({
+                  id: `${taskId}-${index}`,
+                  url: b64.startsWith('data:') || b64.startsWith('/') ? b64 : `data:image/png;base64,${b64}`,
+                  alt: `${styleName} 方案 ${index + 1}`
+                })));
+                return;
+              }
+
               if (data.status === 'success') {
                 clearInterval(pollTimer);
                 teaFlowFinish();
@@ -301,8 +294,8 @@ export function ContentAuditCenter() {
                 // 假設後端回傳格式為 { "status": "success", "images": ["base64_1", "base64_2", "base64_3"] }
                 if (data.images && Array.isArray(data.images)) {
                   const newImages: GeneratedImage[] = data.images.map((b64: string, index: number) => ({
-                    id: `${Date.now()}-${index}`,
-                    url: b64.startsWith('data:') ? b64 : `data:image/png;base64,${b64}`,
+                    id: `${taskId}-${index}`,
+                    url: b64.startsWith('data:') || b64.startsWith('/') ? b64 : `data:image/png;base64,${b64}`,
                     alt: `${styleName} 方案 ${index + 1}`
                   }));
 
@@ -354,40 +347,36 @@ export function ContentAuditCenter() {
       setStage('image_generating'); // 藉用此狀態顯示 Loading 
       setErrorMessage(null);
 
-      // 1. 將 Blob URL 轉換為 Base64
-      const response = await fetch(selectedGeneratedImageUrl);
-      const blob = await response.blob();
-
-      const reader = new FileReader();
-      reader.readAsDataURL(blob);
-      reader.onloadend = async () => {
-        const base64data = reader.result;
-
-        // 2. 準備傳送給後端的資料
-        const payload = {
-          product_name: selectedProduct,
-          final_text: selectedCopyText,
-          image_data: base64data,
-          platform: publishPlatform, // 傳送目前選中的平台：'ig', 'fb', 或 'sync'
-        };
-
-        const res = await fetch('/api/content/publish', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify(payload)
-        });
+      // 1. 已存在後端的方案圖只送引用；其他來源（data URL / Blob URL）以 multipart 二進位上傳
+      const formData = new FormData();
+      formData.append('product_name', selectedProduct);
+      formData.append('final_text', selectedCopyText);
+      formData.append('platform', publishPlatform); // 傳送目前選中的平台：'ig', 'fb', 或 'sync'
+
+      if (selectedGeneratedImageUrl.startsWith('/api/content/')) {
+        formData.append('image_ref', selectedGeneratedImageUrl);
+      } else {
+        const response = await fetch(selectedGeneratedImageUrl);
+        const blob = await response.blob();
+        formData.append('file', blob, 'post.png');
+      }
 
-        const result = await res.json();
+      // 2. 不手動設定 Content-Type，讓瀏覽器帶上 multipart boundary
+      const res = await idempotentPost('/api/content/publish', {
+        body: formData
+      }, publishKey.keyFor([selectedGeneratedImageUrl, selectedProduct, selectedCopyText, publishPlatform]));
 
-        if (result.status === 'success') {
-          // 可以加上一個成功提示，例如使用 Toast 或簡單的 alert
-          alert(result.message);
-          setStage('done');
-        } else {
-          setErrorMessage(result.message || '發佈失敗，請稍後再試');
-          setStage('done');
-        }
-      };
+      const result = await res.json();
+      publishKey.settle();
+
+      if (result.status === 'success') {
+        // 可以加上一個成功提示，例如使用 Toast 或簡單的 alert
+        alert(result.message);
+        setStage('done');
+      } else {
+        setErrorMessage(result.message || '發佈失敗，請稍後再試');
+        setStage('done');
+      }
     } catch (error) {
       console.error('Publish Error:', error);
       setErrorMessage('發佈過程中發生連線錯誤');
@@ -146,10 +146,29 @@ export function GeneratedGallery({
             {generationStatus === 'generating' && (
               <div className="space-y-3">
                 <div className="grid grid-cols-3 gap-2">
-                  {/* 修改處：併行生成時，顯示三個 Skeleton 對應三個產出方案 */}
-                  {[1, 2, 3].map((i) => (
-                    <Skeleton key={i} className="aspect-square rounded-lg" />
-                  ))}
+                  {/* 修改處：併行生成時，已完成的方案先顯示，其餘以 Skeleton 佔位 */}
+                  {[0, 1, 2].map((i) => {
+                    const img = generatedImages[i];
+                    if (!img) {
+                      return <Skeleton key={i} className="aspect-square rounded-lg" />;
+                    }
+                    return (
+                      <div
+                        key={img.id}
+                        className={cn(
+                          "relative aspect-square rounded-lg overflow-hidden cursor-pointer border-2 transition-all",
+                          selectedImage === img.id ? "border-blue-500 ring-2 ring-blue-200" : "border-gray-200 hover:border-gray-300"
+                        )}
+                        onClick={() => onSelectImage(img.id)}
+                      >
+                        <ImageWithFallback
+                          src={img.url}
+                          alt={`Generated ${img.id}`}
+                          className="w-full h-full object-cover"
+                        />
+                      </div>
+                    );
+                  })}
                 </div>
                 <div className="space-y-1">
                   <div className="flex justify-between text-xs text-muted-foreground">
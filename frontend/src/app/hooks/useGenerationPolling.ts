@@ -1,4 +1,6 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
+import { idempotentPost } from '@/app/services/idempotentRequest';
+import { useIdempotencyKey } from '@/app/hooks/useIdempotencyKey';
 
 interface CopyOption {
   topic_title: string;
@@ -26,6 +28,7 @@ export function useGenerationPolling() {
   const [result, setResult] = useState<GenerationResult | null>(null);
   const [error, setError] = useState<string | null>(null);
   const intervalRef = useRef<NodeJS.Timeout | null>(null);
+  const { keyFor, settle } = useIdempotencyKey();
 
   const startGeneration = useCallback(async (payload: StartGenerationPayload) => {
     // Reset state
@@ -37,13 +40,13 @@ export function useGenerationPolling() {
     setError(null);
 
     try {
-      const res = await fetch('/api/generate_post', {
-        method: 'POST',
+      const res = await idempotentPost('/api/generate_post', {
         headers: { 'Content-Type': 'application/json' },
         credentials: 'include',
         body: JSON.stringify(payload),
-      });
+      }, keyFor(payload));
       const data = await res.json();
+      settle();
 
       if (data.status === 'success' && data.task_id) {
         setTaskId(data.task_id);
@@ -55,7 +58,7 @@ export function useGenerationPolling() {
       setError(e.message || '網路連線錯誤');
       setStatus('idle');
     }
-  }, []);
+  }, [keyFor, settle]);
 
   // Polling logic
   useEffect(() => {
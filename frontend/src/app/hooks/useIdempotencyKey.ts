@@ -0,0 +1,25 @@
+import { useCallback, useRef } from 'react';
+import { newIdempotencyKey } from '@/app/services/idempotentRequest';
+
+/**
+ * 每個會產生工作的操作各自保存一個 Idempotency-Key：
+ * 相同輸入的重試（例如網路中斷後再按一次）沿用同一個 key，後端回傳第一次的結果；
+ * 輸入改變，或請求已得到最終結果（成功或失敗）後呼叫 settle()，下一次才會換新的 key。
+ */
+export function useIdempotencyKey() {
+  const currentRef = useRef<{ key: string; signature: string } | null>(null);
+
+  const keyFor = useCallback((inputs: unknown): string => {
+    const signature = JSON.stringify(inputs);
+    if (!currentRef.current || currentRef.current.signature !== signature) {
+      currentRef.current = { key: newIdempotencyKey(), signature };
+    }
+    return currentRef.current.key;
+  }, []);
+
+  const settle = useCallback(() => {
+    currentRef.current = null;
+  }, []);
+
+  return { keyFor, settle };
+}
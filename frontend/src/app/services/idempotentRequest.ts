@@ -0,0 +1,55 @@
+// 以 Idempotency-Key 送出會產生工作的 POST：
+// 同一次操作的重試沿用同一個 key，後端會回傳第一次的結果（同一個 task_id），不會重複產圖或重複發佈。
+
+const RETRY_ATTEMPTS = 2;
+const RETRY_DELAY_MS = 800;
+// 與後端 app/idempotency.py 的 IN_FLIGHT_CODE 一致
+const IN_FLIGHT_CODE = 'idempotency_in_flight';
+
+export function newIdempotencyKey(): string {
+  if (typeof crypto !== 'undefined' && 'randomUUID' in crypto) {
+    return crypto.randomUUID();
+  }
+  return `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}`;
+}
+
+/**
+ * 網路錯誤（連線中斷、逾時）時以相同的 key 重送；409 只有在 code 為 idempotency_in_flight
+ *（第一次請求仍在處理中）時才稍後重送，其他 409（例如平台尚未連結）直接回傳給呼叫端。
+ * key 由呼叫端保存（見 useIdempotencyKey），使用者手動重試同一個操作時才能沿用。
+ */
+async function isInFlight(response: Response): Promise<boolean> {
+  if (response.status !== 409) return false;
+  try {
+    // clone：不是 in-flight 時回應要原封不動交給呼叫端讀取
+    const data = await response.clone().json();
+    return data?.code === IN_FLIGHT_CODE;
+  } catch {
+    return false;
+  }
+}
+
+export async function idempotentPost(
+  url: string,
+  init: RequestInit,
+  key: string
+): Promise<Response> {
+  const headers = new Headers(init.headers);
+  headers.set('Idempotency-Key', key);
+
+  let lastError: unknown;
+  for (let attempt = 0; attempt <= RETRY_ATTEMPTS; attempt++) {
+    if (attempt > 0) {
+      await new Promise(resolve => setTimeout(resolve, RETRY_DELAY_MS * attempt));
+    }
+    try {
+      const response = await fetch(url, { ...init, method: 'POST', headers });
+      if (attempt === RETRY_ATTEMPTS || !(await isInFlight(response))) {
+        return response;
+      }
+    } catch (error) {
+      lastError = error;
+    }
+  }
+  throw lastError ?? new Error('請求失敗');
+}
@@ -0,0 +1,61 @@
+"""
+互動數同步壓測：在本機啟動假 Graph API，預先建立 N 則貼文，
+量測以 Graph batch 取回全部互動數所需的時間與 HTTP 請求數（不需要資料庫）。
+
+    python scripts/bench_engagement_sync.py --posts 5000
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+# Allow running from the scripts/ directory or the project root
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_graph_api import FakeGraphState, make_handler, seed_post_ids
+from app.engagement_sync import build_requests, fetch_engagement
+from app.graph_client import GraphClient
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    state = FakeGraphState(fail_rate=args.fail_rate)
+    state.seed_posts(args.posts)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(state))
+    server.RequestHandlerClass.log_message = lambda *a: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # 一半貼文同步到 FB + IG，模擬 sync 發佈
+    ids = seed_post_ids(args.posts)
+    posts = [{
+        "id": i,
+        "tenant_id": 1,
+        "external_post_ids": {"fb": f"1000_{post_id}", **({"ig": post_id} if i % 2 else {})},
+    } for i, post_id in enumerate(ids)]
+    credentials = {"fb_access_token": "fake-page-token", "ig_access_token": "fake-page-token"}
+
+    graph = GraphClient(base_url=f"http://127.0.0.1:{args.port}")
+    groups = build_requests(posts, lambda tenant_id: credentials)
+    n_sub = sum(len(items) for items in groups.values())
+
+    started = time.perf_counter()
+    totals = fetch_engagement(groups, graph)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    print(f"📊 {len(posts)} 則貼文 / {n_sub} 個子請求")
+    print(f"   HTTP 請求數: {state.http_requests}（逐篇輪詢需 {n_sub} 次）")
+    print(f"   取得互動數: {len(totals)} 則，耗時 {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
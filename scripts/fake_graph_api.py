@@ -0,0 +1,226 @@
+"""
+本地假 Graph API，用來在沒有 Meta 帳號的情況下驗證發佈流程與量測延遲。
+
+    python scripts/fake_graph_api.py --port 8765 --container-delay 3
+    IG_GRAPH_URL=http://localhost:8765 docker compose up backend
+
+支援的端點：
+    POST /{page_id}/photos          -> {"id", "post_id"}
+    POST /{ig_id}/media             -> {"id"}（容器在 container-delay 秒後變成 FINISHED）
+    GET  /{container_id}?fields=status_code
+    POST /{ig_id}/media_publish     -> {"id"}
+    GET  /oauth/access_token        -> 長期使用者 token
+    GET  /me/accounts               -> 一個假粉專
+    GET  /{page_id}?fields=instagram_business_account
+    GET  /{post_id}?fields=reactions.summary(total_count).limit(0)   (FB 貼文心情數)
+    GET  /{media_id}?fields=like_count                               (IG 按讚數)
+    POST /?batch=[...]              -> Graph batch（最多 50 個子請求）
+
+--fail-rate 可隨機回傳 500 / 613（速率限制），用來驗證重試行為；
+測試中可用 FakeGraphState.fail_next() / delay_next() 指定接下來幾個請求的錯誤或延遲。
+--seed-posts 預先建立 N 則貼文（ID 為 seed_post_ids() 的結果），用來壓測互動數同步；
+每次讀取互動數時按讚數會隨機增加。
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeGraphState:
+    def __init__(self, container_delay=3.0, fail_rate=0.0):
+        self.container_delay = container_delay
+        self.fail_rate = fail_rate
+        self.containers = {}
+        self.posts = {}
+        self.http_requests = 0
+        self.batch_sizes = []
+        self._failures = []
+        self._delays = []
+        self._ids = itertools.count(10_000_000)
+        self._lock = threading.Lock()
+
+    def fail_next(self, status, code=None, times=1, retry_after=None):
+        """接下來 times 個請求回傳指定的 HTTP 狀態 / Graph 錯誤代碼"""
+        with self._lock:
+            self._failures.extend([(status, code, retry_after)] * times)
+
+    def delay_next(self, seconds, times=1):
+        """接下來 times 個請求延遲 seconds 秒才回應（模擬讀取逾時）"""
+        with self._lock:
+            self._delays.extend([seconds] * times)
+
+    def take_scripted(self):
+        with self._lock:
+            self.http_requests += 1
+            failure = self._failures.pop(0) if self._failures else None
+            delay = self._delays.pop(0) if self._delays else 0
+        return failure, delay
+
+    def next_id(self):
+        with self._lock:
+            return str(next(self._ids))
+
+    def seed_posts(self, n):
+        for post_id in seed_post_ids(n):
+            self.posts[post_id] = {"caption": None, "likes": random.randint(0, 500)}
+
+    def read_likes(self, post_id):
+        with self._lock:
+            post = self.posts[post_id]
+            post["likes"] += random.randint(0, 3)
+            return post["likes"]
+
+
+def seed_post_ids(n):
+    """--seed-posts 建立的貼文 ID（與壓測腳本共用）"""
+    return [str(1_000_000 + i) for i in range(n)]
+
+
+def handle(state: FakeGraphState, method: str, path: str, form: dict):
+    """依 method + path 模擬 Graph API，回傳 (HTTP status, payload)"""
+    parts = [p for p in path.strip("/").split("/") if p]
+
+    if method == "GET":
+        if parts == ["oauth", "access_token"]:
+            return 200, {"access_token": "fake-long-lived-user-token", "token_type": "bearer"}
+        if parts == ["me", "accounts"]:
+            return 200, {"data": [{"id": "1000", "name": "Fake Tea Page", "access_token": "fake-page-token"}]}
+
+        object_id = parts[-1] if parts else ""
+        # FB 貼文 ID 為 {page_id}_{post_id}
+        post_id = object_id.split("_")[-1]
+        if post_id in state.posts:
+            fields = form.get("fields", "")
+            if fields.startswith("reactions"):
+                return 200, {"id": object_id, "reactions": {"data": [], "summary": {"total_count": state.read_likes(post_id)}}}
+            if fields == "like_count":
+                return 200, {"id": object_id, "like_count": state.read_likes(post_id)}
+            return 200, {"id": object_id}
+        if form.get("fields") == "instagram_business_account":
+            return 200, {"id": object_id, "instagram_business_account": {"id": f"17841{object_id}"}}
+        container = state.containers.get(object_id)
+        if container is not None:
+            ready = time.monotonic() - container["created"] >= state.container_delay
+            return 200, {"id": object_id, "status_code": "FINISHED" if ready else "IN_PROGRESS"}
+        return 400, {"error": {"message": "Unknown object", "code": 100}}
+
+    edge = parts[-1] if len(parts) > 1 else ""
+
+    if edge == "photos":
+        post_id = state.next_id()
+        state.posts[post_id] = {"caption": form.get("caption"), "likes": 0}
+        return 200, {"id": state.next_id(), "post_id": f"{parts[-2]}_{post_id}"}
+
+    if edge == "media":
+        container_id = state.next_id()
+        state.containers[container_id] = {"created": time.monotonic(), "image_url": form.get("image_url")}
+        return 200, {"id": container_id}
+
+    if edge == "media_publish":
+        container = state.containers.get(form.get("creation_id"))
+        if container is None:
+            return 400, {"error": {"message": "Invalid creation_id", "code": 100}}
+        if time.monotonic() - container["created"] < state.container_delay:
+            return 400, {"error": {"message": "Media ID is not available", "code": 9007}}
+        media_id = state.next_id()
+        state.posts[media_id] = {"caption": None, "likes": 0}
+        return 200, {"id": media_id}
+
+    return 404, {"error": {"message": "Unsupported endpoint", "code": 100}}
+
+
+def handle_batch(state: FakeGraphState, batch: list):
+    state.batch_sizes.append(len(batch))
+    if len(batch) > 50:
+        return 400, {"error": {"message": "Too many requests in batch", "code": 1}}
+    responses = []
+    for sub in batch:
+        url = urlparse("/" + sub.get("relative_url", "").lstrip("/"))
+        form = {k: v[0] for k, v in parse_qs(url.query).items()}
+        form.update({k: v[0] for k, v in parse_qs(sub.get("body", "")).items()})
+        status, payload = handle(state, sub.get("method", "GET").upper(), url.path, form)
+        responses.append({"code": status, "body": json.dumps(payload)})
+    return 200, responses
+
+
+def make_handler(state: FakeGraphState):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, payload, status=200, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _form(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length).decode("utf-8") if length else ""
+            return {k: v[0] for k, v in parse_qs(raw).items()}
+
+        def _maybe_fail(self):
+            failure, delay = state.take_scripted()
+            if delay:
+                time.sleep(delay)
+            if failure is not None:
+                status, code, retry_after = failure
+                headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+                self._send({"error": {"message": f"Scripted failure {status}", "code": code}}, status, headers)
+                return True
+            if state.fail_rate and random.random() < state.fail_rate:
+                if random.random() < 0.5:
+                    self._send({"error": {"message": "Fake internal error", "code": 2}}, 500)
+                else:
+                    self._send({"error": {"message": "Calls to this api have exceeded the rate limit.", "code": 613}}, 400)
+                return True
+            return False
+
+        def do_GET(self):
+            if self._maybe_fail():
+                return
+            url = urlparse(self.path)
+            form = {k: v[0] for k, v in parse_qs(url.query).items()}
+            status, payload = handle(state, "GET", url.path, form)
+            self._send(payload, status)
+
+        def do_POST(self):
+            if self._maybe_fail():
+                return
+            url = urlparse(self.path)
+            form = self._form()
+            if "batch" in form:
+                status, payload = handle_batch(state, json.loads(form["batch"]))
+            else:
+                status, payload = handle(state, "POST", url.path, form)
+            self._send(payload, status)
+
+        def log_message(self, fmt, *args):
+            print(f"[fake-graph] {self.command} {self.path}")
+
+    return Handler
+
+
+def serve(port=8765, container_delay=3.0, fail_rate=0.0, seed_posts=0):
+    state = FakeGraphState(container_delay=container_delay, fail_rate=fail_rate)
+    state.seed_posts(seed_posts)
+    server = ThreadingHTTPServer(("0.0.0.0", port), make_handler(state))
+    print(f"🧪 Fake Graph API listening on http://localhost:{port} (container delay {container_delay}s)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--container-delay", type=float, default=3.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--seed-posts", type=int, default=0)
+    args = parser.parse_args()
+    serve(args.port, args.container_delay, args.fail_rate, args.seed_posts)
@@ -0,0 +1,20 @@
+import os
+import sys
+
+# backend（app.*）與 crawler（core.* / spiders.*）皆以各自目錄為匯入根目錄，與容器內一致
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+CRAWLER = os.path.join(ROOT, "crawler")
+# scripts/ 提供本地假服務（例如 fake_graph_api）
+SCRIPTS = os.path.join(ROOT, "scripts")
+for path in (BACKEND, CRAWLER, SCRIPTS):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault("BACKEND_PATH", BACKEND)
+# 匯入時只建立 engine（不連線）；需要資料庫的測試會自行檢查連線並 skip
+os.environ.setdefault("DB_USER", "postgres")
+os.environ.setdefault("DB_PASSWORD", "")
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_PORT", "5432")
+os.environ.setdefault("DB_NAME", "postgres")
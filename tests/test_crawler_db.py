@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+CRAWLER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "crawler")
+
+
+def test_importing_core_db_does_not_load_the_api_service():
+    # 新的行程：本測試行程內其他測試已匯入過 app.storage
+    code = (
+        "import sys, core.db, app.models\n"
+        "print(sorted(m for m in ('app.storage', 'app.routes', 'minio', 'flask_cors', 'flask_migrate')"
+        " if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=CRAWLER, env=dict(os.environ),
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
@@ -0,0 +1,210 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from core.http import CrawlerHTTP, RateLimiter
+
+URL = "https://example.test/api/prices"
+
+
+def make_response(status=200, body=b'{"ok": true}', headers=None, url=URL):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body
+    resp.headers.update(headers or {})
+    resp.url = url
+    resp.encoding = "utf-8"
+    return resp
+
+
+class StubSession:
+    """依序回傳預先排好的回應（或拋出例外），並記錄每次請求帶的標頭"""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = []
+        self.cookies = requests.cookies.RequestsCookieJar()
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=None):
+        self.calls.append({"method": method, "url": url, "headers": dict(headers or {}), "timeout": timeout})
+        item = self.script.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+@pytest.fixture
+def make_client(tmp_path):
+    def factory(*script, **kwargs):
+        session = StubSession(*script)
+        sleeps = []
+        kwargs.setdefault("cache_dir", str(tmp_path / "cache"))
+        return CrawlerHTTP(session=session, sleep=sleeps.append, **kwargs), session, sleeps
+    return factory
+
+
+# ============================================================
+# 條件式快取
+# ============================================================
+
+def test_cached_entry_revalidates_and_304_returns_the_stored_body(make_client):
+    client, session, _ = make_client(
+        make_response(headers={"ETag": '"v1"', "Last-Modified": "Mon, 19 Oct 2026 00:00:00 GMT"}),
+        make_response(304, body=b""),
+    )
+    first = client.get(URL, cache=True)
+    second = client.get(URL, cache=True)
+
+    assert "If-None-Match" not in session.calls[0]["headers"]
+    assert session.calls[1]["headers"]["If-None-Match"] == '"v1"'
+    assert session.calls[1]["headers"]["If-Modified-Since"] == "Mon, 19 Oct 2026 00:00:00 GMT"
+    assert second.status_code == 200 and second.from_cache
+    assert second.json() == first.json() == {"ok": True}
+    assert client.stats["not_modified"] == 1
+
+
+def test_changed_content_replaces_the_cache(make_client):
+    client, session, _ = make_client(
+        make_response(headers={"ETag": '"v1"'}),
+        make_response(body=b'{"ok": false}', headers={"ETag": '"v2"'}),
+        make_response(304, body=b""),
+    )
+    client.get(URL, cache=True)
+    assert client.get(URL, cache=True).json() == {"ok": False}
+    assert client.get(URL, cache=True).json() == {"ok": False}
+    assert session.calls[2]["headers"]["If-None-Match"] == '"v2"'
+
+
+def test_max_age_skips_the_request(make_client):
+    client, session, _ = make_client(make_response(headers={"ETag": '"v1"'}))
+    client.get(URL, cache=True)
+    resp = client.get(URL, cache=True, max_age=3600)
+
+    assert len(session.calls) == 1
+    assert resp.from_cache and resp.json() == {"ok": True}
+    assert client.stats["cache_hits"] == 1
+
+
+def test_error_responses_are_not_cached(make_client):
+    client, session, _ = make_client(make_response(404, body=b"missing"), make_response())
+    assert client.get(URL, cache=True).status_code == 404
+    client.get(URL, cache=True)
+    assert "If-None-Match" not in session.calls[1]["headers"]
+
+
+def test_cache_can_be_disabled(make_client):
+    client, session, _ = make_client(make_response(headers={"ETag": '"v1"'}), make_response(), cache_dir="")
+    client.get(URL, cache=True)
+    client.get(URL, cache=True, max_age=3600)
+    assert len(session.calls) == 2
+    assert "If-None-Match" not in session.calls[1]["headers"]
+
+
+# ============================================================
+# 重試
+# ============================================================
+
+@pytest.mark.parametrize("failure", [
+    make_response(503, body=b""),
+    make_response(429, body=b"", headers={"Retry-After": "2"}),
+    requests.exceptions.ReadTimeout("read timed out"),
+    requests.exceptions.ConnectionError("connection reset"),
+])
+def test_transient_failures_are_retried(make_client, failure):
+    client, session, sleeps = make_client(failure, make_response())
+    assert client.get(URL).json() == {"ok": True}
+    assert len(session.calls) == 2
+    assert len(sleeps) == 1
+
+
+def test_retry_after_is_honoured(make_client):
+    client, _, sleeps = make_client(make_response(429, body=b"", headers={"Retry-After": "2"}), make_response())
+    client.get(URL)
+    assert sleeps == [2.0]
+
+
+def test_gives_up_after_max_retries(make_client):
+    client, session, _ = make_client(*[make_response(502, body=b"")] * 3, max_retries=2)
+    assert client.get(URL).status_code == 502
+    assert len(session.calls) == 3
+
+    client, session, _ = make_client(*[requests.exceptions.ReadTimeout("slow")] * 3, max_retries=2)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.get(URL)
+    assert len(session.calls) == 3
+
+
+def test_post_is_not_retried_unless_asked(make_client):
+    client, session, _ = make_client(make_response(503, body=b""), make_response(503, body=b""), make_response())
+    assert client.post(URL, data={"q": 1}).status_code == 503
+    assert len(session.calls) == 1
+    assert client.post(URL, data={"q": 1}, retry=True).status_code == 200
+
+
+def test_client_errors_are_returned_without_retry(make_client):
+    client, session, sleeps = make_client(make_response(404, body=b""))
+    assert client.get(URL).status_code == 404
+    assert len(session.calls) == 1 and sleeps == []
+
+
+def test_default_timeout_is_a_connect_read_tuple(make_client):
+    client, session, _ = make_client(make_response())
+    client.get(URL)
+    assert isinstance(session.calls[0]["timeout"], tuple)
+
+
+# ============================================================
+# 每個 host 的併行上限
+# ============================================================
+
+class BlockingSession:
+    """每個請求停住直到 release；記錄每個 host 同時進行中的最大請求數"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.in_flight = {}
+        self.peak = {}
+        self._lock = threading.Lock()
+        self.cookies = requests.cookies.RequestsCookieJar()
+
+    def request(self, method, url, **kwargs):
+        host = url.split("/")[2]
+        with self._lock:
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.in_flight[host])
+        self.release.wait(5)
+        with self._lock:
+            self.in_flight[host] -= 1
+        return make_response(url=url)
+
+
+def test_concurrent_requests_are_limited_per_host():
+    session = BlockingSession()
+    client = CrawlerHTTP(cache_dir="", per_host=2, session=session)
+    urls = [f"https://a.test/{i}" for i in range(5)] + [f"https://b.test/{i}" for i in range(2)]
+    threads = [threading.Thread(target=client.get, args=(url,)) for url in urls]
+    for t in threads:
+        t.start()
+
+    # a.test 只有 2 個在進行，其餘排隊；b.test 不會被 a.test 排隊中的請求卡住
+    deadline = time.monotonic() + 5
+    while session.in_flight != {"a.test": 2, "b.test": 2} and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert session.in_flight == {"a.test": 2, "b.test": 2}
+
+    session.release.set()
+    for t in threads:
+        t.join()
+    assert session.peak == {"a.test": 2, "b.test": 2}
+    assert client.stats["requests"] == 7
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+    # 第一次立即放行，之後每次間隔 1/50 秒
+    assert time.monotonic() - start >= 4 / 50 * 0.9
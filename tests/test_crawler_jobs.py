@@ -0,0 +1,60 @@
+import asyncio
+import threading
+
+import pytest
+
+from core import jobs
+from core.jobs import JobFailed, JobRunner
+
+
+@pytest.fixture(autouse=True)
+def no_crawl_run(monkeypatch):
+    """crawl_run 紀錄改寫到記憶體"""
+    runs = []
+    monkeypatch.setattr(jobs, "start_run", lambda job, attempt, trigger: runs.append([job, attempt, "running"]) or len(runs))
+    monkeypatch.setattr(jobs, "finish_run", lambda run_id, status, *args: runs[run_id - 1].__setitem__(2, status))
+    return runs
+
+
+def test_retries_then_succeeds(no_crawl_run):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 2:
+            raise RuntimeError("boom")
+        return {"content": {"ok": True}, "rows": 3}
+
+    result = asyncio.run(JobRunner(backoff_seconds=0).run("weather", flaky, timeout=5, retries=2))
+    assert result["rows"] == 3
+    assert [r[2] for r in no_crawl_run] == ["failed", "success"]
+
+
+def test_timed_out_thread_is_awaited_before_the_lock_is_released(no_crawl_run):
+    release = threading.Event()
+    exited = threading.Event()
+
+    def stuck():
+        release.wait(5)
+        exited.set()
+        return {"content": {"late": True}}
+
+    async def scenario():
+        runner = JobRunner(backoff_seconds=0)
+        with pytest.raises(JobFailed):
+            await runner.run("fruit", stuck, timeout=0.05, retries=1)
+        # 第二次嘗試不會在舊 thread 仍執行時再開一個
+        assert [r[2] for r in no_crawl_run] == ["timeout", "failed"]
+
+        waiter = asyncio.ensure_future(runner.wait_idle("fruit"))
+        await asyncio.sleep(0.1)
+        assert not waiter.done()
+        release.set()
+        await asyncio.wait_for(waiter, 5)
+        assert exited.is_set()
+
+    asyncio.run(scenario())
+
+
+def test_wait_idle_returns_immediately_when_nothing_is_running():
+    asyncio.run(asyncio.wait_for(JobRunner().wait_idle("news"), 1))
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from core.db import engine
+from core.locks import AdvisoryLock, acquire_job_lock
+
+# ============================================================
+# 多 replica 的工作鎖：每個 AdvisoryLock 使用獨立連線（等同獨立的 Postgres session），
+# 行為與分散在不同節點的 replica 相同。需要可連線的 Postgres（DB_* 環境變數），否則 skip。
+# ============================================================
+
+
+def _postgres_available():
+    try:
+        with engine.connect():
+            return True
+    except OperationalError:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not _postgres_available(), reason="需要可連線的 Postgres（設定 DB_HOST / DB_PORT）")
+
+
+def test_only_one_holder_at_a_time():
+    first, second = AdvisoryLock("crawl:test-exclusive"), AdvisoryLock("crawl:test-exclusive")
+    try:
+        assert first.try_acquire()
+        assert not second.try_acquire()
+        first.release()
+        assert second.try_acquire()
+        assert not first.try_acquire()
+    finally:
+        first.release()
+        second.release()
+
+
+def test_different_jobs_do_not_block_each_other():
+    weather, fruit = AdvisoryLock("crawl:test-weather"), AdvisoryLock("crawl:test-fruit")
+    try:
+        assert weather.try_acquire()
+        assert fruit.try_acquire()
+    finally:
+        weather.release()
+        fruit.release()
+
+
+def test_concurrent_replicas_never_run_the_job_together():
+    state = {"active": 0, "max_active": 0, "runs": 0, "completed": False}
+
+    async def replica():
+        lock = await acquire_job_lock("test-replicas", wait_seconds=10,
+                                      done=lambda: state["completed"], poll_seconds=0.05)
+        if lock is None:
+            return
+        try:
+            # 與 run_source_locked 相同：取得鎖後再確認一次是否已由前一個持有者完成
+            if state["completed"]:
+                return
+            state["active"] += 1
+            state["runs"] += 1
+            state["max_active"] = max(state["max_active"], state["active"])
+            await asyncio.sleep(0.3)
+            state["completed"] = True
+            state["active"] -= 1
+        finally:
+            await asyncio.to_thread(lock.release)
+
+    async def main():
+        await asyncio.gather(*(replica() for _ in range(6)))
+
+    asyncio.run(main())
+    assert state["max_active"] == 1
+    # 持有者完成後，其餘 replica 看到已完成就跳過
+    assert state["runs"] == 1
+
+
+LEADER = textwrap.dedent("""
+    from core.locks import AdvisoryLock
+    lock = AdvisoryLock("crawl:test-leader-death")
+    assert lock.try_acquire()
+    print("locked", flush=True)
+    import time
+    time.sleep(60)
+""")
+
+
+def test_lock_is_taken_over_when_the_leader_dies():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.path.join(root, "crawler"))
+    leader = subprocess.Popen([sys.executable, "-c", LEADER], env=env, stdout=subprocess.PIPE, text=True)
+    follower = AdvisoryLock("crawl:test-leader-death")
+    try:
+        assert leader.stdout.readline().strip() == "locked"
+        assert not follower.try_acquire()
+
+        # 模擬節點掛掉：不呼叫 unlock，連線隨行程消失
+        leader.send_signal(signal.SIGKILL)
+        leader.wait(10)
+        started = time.monotonic()
+        lock = asyncio.run(acquire_job_lock("test-leader-death", wait_seconds=10, poll_seconds=0.05))
+        assert lock is not None
+        assert time.monotonic() - started < 10
+        lock.release()
+    finally:
+        if leader.poll() is None:
+            leader.kill()
+        follower.release()
@@ -0,0 +1,233 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from app.engagement_sync import build_requests, claim_due_posts, fetch_engagement, parse_count, write_back
+from app.graph_client import GRAPH_BATCH_LIMIT, GraphAPIError, GraphClient
+from fake_graph_api import FakeGraphState, make_handler, seed_post_ids
+
+TOKENS = {1: {"fb_access_token": "page-a", "ig_access_token": "page-a"},
+          2: {"fb_access_token": "page-b"}}
+
+
+def test_parse_count():
+    assert parse_count("fb", {"reactions": {"data": [], "summary": {"total_count": 12}}}) == 12
+    assert parse_count("fb", {"reactions": {"data": []}}) is None
+    assert parse_count("fb", {}) is None
+    assert parse_count("ig", {"like_count": 0}) == 0
+    assert parse_count("ig", {"id": "1"}) is None
+
+
+def test_requests_are_grouped_by_token_and_skip_missing_ids_or_credentials():
+    groups = build_requests([
+        {"id": 1, "tenant_id": 1, "external_post_ids": {"fb": "1000_1", "ig": "17"}},
+        {"id": 2, "tenant_id": 2, "external_post_ids": {"fb": "2000_2", "ig": "18"}},  # 沒有 IG token
+        {"id": 3, "tenant_id": 1, "external_post_ids": None},
+    ], TOKENS.get)
+    assert {token: [(cid, platform) for cid, platform, _ in items] for token, items in groups.items()} == {
+        "page-a": [(1, "fb"), (1, "ig")],
+        "page-b": [(2, "fb")],
+    }
+    assert groups["page-a"][1][2] == {"method": "GET", "relative_url": "17?fields=like_count"}
+
+
+class ScriptedBatch:
+    def __init__(self, responses):
+        self.responses = responses
+
+    def batch(self, subs, token):
+        result = self.responses[token]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_failed_sub_results_keep_the_old_likes():
+    groups = {
+        "page-a": [(1, "fb", {}), (1, "ig", {}), (2, "fb", {}), (3, "ig", {}), (4, "ig", {})],
+        "page-b": [(5, "fb", {})],
+    }
+    graph = ScriptedBatch({
+        "page-a": [
+            {"reactions": {"summary": {"total_count": 10}}},
+            {"like_count": 5},
+            GraphAPIError("batch 子請求未完成", status=None),  # Graph 回傳 null 的子請求
+            {"id": "3"},                                       # 缺少欄位
+            {"like_count": 7},
+        ],
+        "page-b": GraphAPIError("token expired", code=190),
+    })
+    # FB + IG 加總；任一平台失敗的貼文不列入，整個 batch 失敗則該 token 的貼文全部略過
+    assert fetch_engagement(groups, graph) == {1: 15, 4: 7}
+
+
+def test_a_single_failing_platform_drops_the_whole_post():
+    graph = ScriptedBatch({"t": [{"like_count": 3}, GraphAPIError("unsupported", code=100)]})
+    assert fetch_engagement({"t": [(1, "ig", {}), (1, "fb", {})]}, graph) == {}
+
+
+# ---------------- 對本地假 Graph API：數千則貼文 ----------------
+
+@pytest.fixture
+def fake_graph():
+    state = FakeGraphState()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield state, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_thousands_of_posts_are_fetched_in_batches_of_50(fake_graph):
+    state, url = fake_graph
+    n = 3000
+    state.seed_posts(n)
+    posts = [{"id": i, "tenant_id": 1, "external_post_ids": {"fb": f"1000_{post_id}", **({"ig": post_id} if i % 2 else {})}}
+             for i, post_id in enumerate(seed_post_ids(n))]
+    groups = build_requests(posts, TOKENS.get)
+    n_sub = sum(len(items) for items in groups.values())
+
+    totals = fetch_engagement(groups, GraphClient(base_url=url, timeout=(1, 5)))
+
+    assert n_sub == 4500
+    assert max(state.batch_sizes) == GRAPH_BATCH_LIMIT == 50
+    assert len(state.batch_sizes) == -(-n_sub // GRAPH_BATCH_LIMIT)
+    assert sum(state.batch_sizes) == n_sub
+    assert set(totals) == set(range(n))
+    assert all(likes >= 0 for likes in totals.values())
+
+
+def test_batch_null_and_error_entries_become_errors(monkeypatch):
+    client = GraphClient(base_url="http://unused")
+    monkeypatch.setattr(client, "post", lambda path, data=None: [
+        {"code": 200, "body": '{"like_count": 4}'},
+        None,
+        {"code": 400, "body": '{"error": {"message": "Unknown object", "code": 100}}'},
+    ])
+    ok, missing, error = client.batch([{}, {}, {}], "t")
+    assert ok == {"like_count": 4}
+    assert isinstance(missing, GraphAPIError) and isinstance(error, GraphAPIError)
+
+
+# ---------------- 資料庫：刷新分級與一次寫回 ----------------
+
+def _pg_app():
+    from app.config import Config
+    from app.extensions import db
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = Config.SQLALCHEMY_DATABASE_URI
+    db.init_app(app)
+    try:
+        with app.app_context():
+            db.session.execute(text("SELECT 1"))
+    except OperationalError:
+        return None
+    return app
+
+
+PG_APP = _pg_app()
+
+# (名稱, 貼文年齡, 距上次同步, 是否到期)
+POSTS = [
+    ("new-stale", "2 hours", "20 minutes", True),
+    ("new-fresh", "2 hours", "5 minutes", False),
+    ("week-stale", "3 days", "2 hours", True),
+    ("week-fresh", "3 days", "30 minutes", False),
+    ("month-stale", "20 days", "7 hours", True),
+    ("month-fresh", "20 days", "1 hour", False),
+    ("quarter-stale", "60 days", "2 days", True),
+    ("quarter-fresh", "60 days", "2 hours", False),
+    ("too-old", "100 days", None, False),
+    ("never-synced", "2 hours", None, True),
+]
+
+
+@pytest.fixture
+def seeded():
+    from app.extensions import db
+    from app.models import MarketingContent, Store, Tenant
+    with PG_APP.app_context():
+        db.metadata.create_all(db.engine, tables=[Tenant.__table__, Store.__table__, MarketingContent.__table__])
+        tenant_id = db.session.execute(text(
+            "INSERT INTO tenant (name) VALUES ('TEST-039') RETURNING id")).scalar()
+        store_id = db.session.execute(text(
+            "INSERT INTO store (tenant_id, name) VALUES (:t, 'TEST-039') RETURNING id"), {"t": tenant_id}).scalar()
+        ids = {}
+        for name, age, synced, _ in POSTS + [("no-post-id", "2 hours", None, False)]:
+            ids[name] = db.session.execute(text("""
+                INSERT INTO marketing_content (store_id, platform, product_name, final_text, "like",
+                                               created_at, engagement_synced_at, external_post_ids)
+                VALUES (:s, 'fb', :name, 'x', 5, now() - CAST(:age AS interval),
+                        now() - CAST(:synced AS interval), CAST(:ids AS JSON))
+                RETURNING id
+            """), {"s": store_id, "name": name, "age": age, "synced": synced,
+                   "ids": None if name == "no-post-id" else '{"fb": "1_1"}'}).scalar()
+        db.session.commit()
+        yield tenant_id, ids
+        db.session.rollback()
+        db.session.execute(text("DELETE FROM marketing_content WHERE store_id = :s"), {"s": store_id})
+        db.session.execute(text("DELETE FROM store WHERE id = :s"), {"s": store_id})
+        db.session.execute(text("DELETE FROM tenant WHERE id = :t"), {"t": tenant_id})
+        db.session.commit()
+
+
+@pytest.mark.skipif(PG_APP is None, reason="需要可連線的 Postgres（設定 DB_HOST / DB_PORT）")
+def test_claim_picks_due_posts_by_age_tier(seeded):
+    tenant_id, ids = seeded
+    with PG_APP.app_context():
+        # 超過上限時最久沒同步的優先：從未同步 → 兩天前同步
+        first, second = claim_due_posts(limit=1), claim_due_posts(limit=1)
+        assert [p["id"] for p in first + second] == [ids["never-synced"], ids["quarter-stale"]]
+        claimed = first + second + claim_due_posts()
+        assert {p["id"] for p in claimed} == {ids[name] for name, _, _, due in POSTS if due}
+        assert all(p["tenant_id"] == tenant_id for p in claimed)
+        # 認領時已寫入同步時間，其他 worker 不會再次取到
+        assert claim_due_posts() == []
+
+
+@pytest.mark.skipif(PG_APP is None, reason="需要可連線的 Postgres（設定 DB_HOST / DB_PORT）")
+def test_claim_respects_the_limit_with_empty_table_statistics(seeded):
+    from app.extensions import db
+    _, ids = seeded
+    with PG_APP.app_context():
+        # 到期的貼文依寫入順序排隊（認領順序 = 資料表掃描順序，最容易讓 nested loop 重跑子查詢時多認領）
+        due = sorted(ids[name] for name, _, _, is_due in POSTS if is_due)
+        db.session.execute(text("""
+            UPDATE marketing_content SET engagement_synced_at = now() - interval '30 days' + id * interval '1 second'
+            WHERE id = ANY(:ids)
+        """), {"ids": due})
+        # 讓 planner 以為資料表是空的（autovacuum 可能留下這種統計），需要 superuser
+        try:
+            db.session.execute(text(
+                "UPDATE pg_class SET reltuples = 0, relpages = 1 WHERE relname IN ('marketing_content', 'store')"))
+            db.session.commit()
+        except ProgrammingError:
+            db.session.rollback()
+            pytest.skip("需要 superuser 才能修改 pg_class 統計")
+        assert {p["id"] for p in claim_due_posts(limit=2)} == set(due[:2])
+
+
+@pytest.mark.skipif(PG_APP is None, reason="需要可連線的 Postgres（設定 DB_HOST / DB_PORT）")
+def test_write_back_updates_only_changed_likes_in_one_statement(seeded):
+    from app.extensions import db
+    _, ids = seeded
+    with PG_APP.app_context():
+        statements = []
+        original = db.session.execute
+        db.session.execute = lambda *a, **kw: statements.append(a[0]) or original(*a, **kw)
+        try:
+            updated = write_back({ids["new-stale"]: 42, ids["week-stale"]: 5, ids["month-stale"]: 0})
+        finally:
+            db.session.execute = original
+        assert updated == 2  # week-stale 原本就是 5
+        assert len(statements) == 1 and "FROM (VALUES" in str(statements[0])
+        likes = dict(db.session.execute(text(
+            'SELECT id, "like" FROM marketing_content WHERE id = ANY(:ids)'),
+            {"ids": [ids["new-stale"], ids["week-stale"], ids["month-stale"]]}).all())
+        assert likes == {ids["new-stale"]: 42, ids["week-stale"]: 5, ids["month-stale"]: 0}
+        assert write_back({}) == 0
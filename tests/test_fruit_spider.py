@@ -0,0 +1,249 @@
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from spiders import fruit_spider
+from spiders.fruit_spider import build_price_rows, to_minguo
+
+TODAY = date(2026, 10, 19)
+IDS = {"草莓": 1, "芒果-其他": 2}
+
+
+def quote(d, crop, price):
+    return {"TransDate": to_minguo(d), "CropName": crop, "Avg_Price": price}
+
+
+def grouped(*quotes):
+    out = {}
+    for q in quotes:
+        out.setdefault(q["TransDate"], []).append(q)
+    return out
+
+
+def days(start, n):
+    return [start + timedelta(days=i) for i in range(n)]
+
+
+def test_closed_days_carry_the_last_price_forward():
+    d0 = date(2026, 10, 10)
+    rows = build_price_rows(days(d0, 3), grouped(quote(d0, "草莓", 100), quote(d0 + timedelta(2), "草莓", 110)),
+                            {"草莓": 1}, {}, {}, TODAY)
+    assert [(r["recorded_at"].day, r["market_price"], r["change_rate"]) for r in rows] == [
+        (10, 100, 0.0), (11, 100, 0.0), (12, 110, 10.0),
+    ]
+
+
+def test_no_carry_forward_into_today_or_later():
+    start = TODAY - timedelta(days=2)
+    rows = build_price_rows(days(start, 4), grouped(quote(start, "草莓", 100)), {"草莓": 1}, {}, {}, TODAY)
+    # 今天與之後尚未收盤：沒有報價的日子不寫入，收盤後的實際報價才能寫進去
+    assert [r["recorded_at"].date() for r in rows] == [start, start + timedelta(days=1)]
+
+
+def test_quotes_for_today_are_still_written():
+    rows = build_price_rows([TODAY], grouped(quote(TODAY, "芒果-其他", 80)), IDS, {1: 120.0}, {}, TODAY)
+    assert [(r["ingredient_id"], r["market_price"]) for r in rows] == [(2, 80.0)]
+
+
+def test_existing_rows_are_kept_but_used_as_the_baseline():
+    d0 = date(2026, 10, 10)
+    existing = {(1, datetime(2026, 10, 10)): 200.0}
+    rows = build_price_rows(days(d0, 2), grouped(quote(d0 + timedelta(1), "草莓", 220)),
+                            {"草莓": 1}, {}, existing, TODAY)
+    assert [(r["recorded_at"].day, r["change_rate"]) for r in rows] == [(11, 10.0)]
+
+
+@pytest.fixture
+def crawler(monkeypatch):
+    """run_crawler 的資料庫與網路改為記錄呼叫"""
+    calls = {"ingested": [], "refreshed": 0, "sessions": 0}
+
+    @contextmanager
+    def fake_session_scope():
+        calls["sessions"] += 1
+        yield object()
+
+    monkeypatch.setattr(fruit_spider, "session_scope", fake_session_scope)
+    monkeypatch.setattr(fruit_spider, "load_watchlist", lambda session: dict(IDS))
+    monkeypatch.setattr(fruit_spider, "refresh_rollups",
+                        lambda session, ids: calls.__setitem__("refreshed", calls["refreshed"] + 1))
+
+    def fake_ingest(session, ingredient_ids, start, end, records, today):
+        calls["ingested"].append((start, records))
+        return len(records)
+
+    monkeypatch.setattr(fruit_spider, "ingest_window", fake_ingest)
+    return calls
+
+
+def test_failed_window_is_not_ingested_and_the_job_fails(crawler, monkeypatch):
+    start = date(2026, 10, 1)
+    failing = start + timedelta(days=fruit_spider.WINDOW_DAYS)
+
+    def fetch(s, e, today, limiter=None, markets=None):
+        if s == failing:
+            raise ConnectionError("market API down")
+        return [{"TransDate": to_minguo(s)}]
+
+    monkeypatch.setattr(fruit_spider, "fetch_window", fetch)
+    with pytest.raises(RuntimeError, match="1 個區間抓取失敗"):
+        fruit_spider.run_crawler(start, start + timedelta(days=fruit_spider.WINDOW_DAYS * 3 - 1))
+    assert crawler["refreshed"] == 1
+    # 失敗的區間沒有寫入任何延用價格，其他區間照常寫入
+    assert [s for s, _ in crawler["ingested"]] == [start, start + timedelta(days=fruit_spider.WINDOW_DAYS * 2)]
+
+
+def test_all_windows_succeed(crawler, monkeypatch):
+    monkeypatch.setattr(fruit_spider, "fetch_window", lambda s, e, today, **kw: [{"TransDate": to_minguo(s)}])
+    result = fruit_spider.run_crawler(date(2026, 10, 1), date(2026, 10, 14))
+    assert result["rows"] == 2
+    assert len(result["content"]) == 2
+    assert crawler["refreshed"] == 1
+    # 彙總在價格寫入的 transaction 之後另開 session
+    assert crawler["sessions"] == 2
+
+
+def test_rollup_failure_does_not_fail_the_ingest(crawler, monkeypatch):
+    def broken(session, ids):
+        raise RuntimeError("statement timeout")
+
+    monkeypatch.setattr(fruit_spider, "fetch_window", lambda s, e, today, **kw: [{"TransDate": to_minguo(s)}])
+    monkeypatch.setattr(fruit_spider, "refresh_rollups", broken)
+    assert fruit_spider.run_crawler(date(2026, 10, 1), date(2026, 10, 7))["rows"] == 1
+
+
+# ============================================================
+# 多市場：全國均價、price_series 陣列更新、各市場併行查詢
+# ============================================================
+
+def market_quote(market, price, volume, crop_code="T1", trans_date="113.03.07", crop_name="草莓"):
+    return {"TransDate": trans_date, "CropCode": crop_code, "CropName": crop_name,
+            "MarketName": market, "Avg_Price": price, "Trans_Quantity": volume}
+
+
+def test_national_price_is_volume_weighted():
+    national = fruit_spider.national_prices([
+        market_quote("台北一", 100, 300),
+        market_quote("台中市", 200, 100),
+        market_quote("高雄市", 0, 500),  # 無成交價不列入
+    ])
+    assert national == [{"TransDate": "113.03.07", "CropCode": "T1", "CropName": "草莓",
+                         "MarketName": fruit_spider.NATIONAL_MARKET, "Avg_Price": 125.0, "Trans_Quantity": 400.0}]
+
+
+def test_national_price_falls_back_to_a_simple_mean_without_volume():
+    national = fruit_spider.national_prices([market_quote("台北一", 100, 0), market_quote("台中市", 151, None)])
+    assert national[0]["Avg_Price"] == 125.5
+
+
+def test_national_prices_are_grouped_by_day_and_crop():
+    national = fruit_spider.national_prices([
+        market_quote("台北一", 100, 1),
+        market_quote("台北一", 50, 1, crop_code="M1", crop_name="芒果-其他"),
+        market_quote("台北一", 120, 1, trans_date="113.03.08"),
+    ])
+    assert sorted((r["TransDate"], r["CropCode"], r["Avg_Price"]) for r in national) == [
+        ("113.03.07", "M1", 50.0), ("113.03.07", "T1", 100.0), ("113.03.08", "T1", 120.0),
+    ]
+
+
+def test_series_updates_index_by_day_of_year_after_the_year_shift():
+    updates = fruit_spider.series_updates([
+        market_quote("台北一", 100, 300, trans_date="113.01.01"),
+        market_quote("台北一", 110, 200, trans_date="113.12.31"),
+        market_quote("台中市", 90, 50, trans_date="113.03.01"),
+        market_quote("台中市", 0, 50, trans_date="113.03.02"),  # 無成交價略過
+    ])
+    # API 的民國 113 年 → 加回 API_YEAR_SHIFT 後為 2026 年（非閏年，12/31 為索引 364）
+    assert updates == {
+        ("T1", "台北一", 2026): ("草莓", {0: (100.0, 300.0), 364: (110.0, 200.0)}),
+        ("T1", "台中市", 2026): ("草莓", {59: (90.0, 50.0)}),
+    }
+
+
+def test_fetch_markets_merges_every_market(monkeypatch):
+    seen = []
+
+    def fetch(start, end, max_age, limiter, market):
+        seen.append(market)
+        return [market_quote(market, 100, 1)]
+
+    monkeypatch.setattr(fruit_spider, "fetch_fruit_data", fetch)
+    records = fruit_spider.fetch_markets("113.03.01", "113.03.07", ["台北一", "台中市", "高雄市"])
+    assert sorted(seen) == ["台中市", "台北一", "高雄市"]
+    # 依市場順序合併，與完成順序無關
+    assert [r["MarketName"] for r in records] == ["台北一", "台中市", "高雄市"]
+
+
+def test_fetch_markets_fails_when_any_market_fails(monkeypatch):
+    def fetch(start, end, max_age, limiter, market):
+        if market == "台中市":
+            raise ConnectionError("timeout")
+        return [market_quote(market, 100, 1)]
+
+    monkeypatch.setattr(fruit_spider, "fetch_fruit_data", fetch)
+    with pytest.raises(ConnectionError):
+        fruit_spider.fetch_markets("113.03.01", "113.03.07", ["台北一", "台中市"])
+
+
+def test_fetch_fruit_data_keeps_the_clients_connect_read_timeout(monkeypatch):
+    import requests
+    from core.http import CrawlerHTTP
+
+    class Session:
+        cookies = requests.cookies.RequestsCookieJar()
+
+        def request(self, method, url, timeout=None, **kwargs):
+            self.timeout = timeout
+            resp = requests.Response()
+            resp.status_code = 200
+            resp._content = '{"Data": [{"CropName": "草莓"}]}'.encode()
+            return resp
+
+    session = Session()
+    monkeypatch.setattr(fruit_spider, "http_client", CrawlerHTTP(cache_dir="", session=session))
+    assert fruit_spider.fetch_fruit_data("113.03.01", "113.03.07") == [{"CropName": "草莓"}]
+    # (connect, read)：連線建立卡住時在幾秒內失敗，而不是等滿讀取逾時
+    assert isinstance(session.timeout, tuple)
+
+
+def _postgres_available():
+    from sqlalchemy.exc import OperationalError
+    from core.db import engine
+    try:
+        with engine.connect():
+            return True
+    except OperationalError:
+        return False
+
+
+@pytest.mark.skipif(not _postgres_available(), reason="需要可連線的 Postgres（設定 DB_HOST / DB_PORT）")
+def test_upsert_price_series_merges_windows_into_one_row():
+    from sqlalchemy import text
+    from app.models import PriceSeries
+    from core.db import engine, session_scope
+
+    PriceSeries.__table__.create(engine, checkfirst=True)
+    key = {"code": "TEST-049", "market": "台北一", "year": 2026}
+    delete = text("DELETE FROM price_series WHERE crop_code = :code")
+    try:
+        with session_scope() as session:
+            assert fruit_spider.upsert_price_series(session, [
+                market_quote("台北一", 100, 10, crop_code="TEST-049", trans_date="113.01.01"),
+            ]) == 1
+        with session_scope() as session:
+            fruit_spider.upsert_price_series(session, [
+                market_quote("台北一", 120, 20, crop_code="TEST-049", trans_date="113.01.03"),
+            ])
+        with session_scope() as session:
+            row = session.execute(text("""
+                SELECT prices, volumes, array_length(prices, 1) AS n FROM price_series
+                WHERE crop_code = :code AND market = :market AND year = :year
+            """), key).one()
+        assert row.n == fruit_spider.SERIES_DAYS
+        assert row.prices[:3] == [100.0, None, 120.0]
+        assert row.volumes[:3] == [10.0, None, 20.0]
+    finally:
+        with session_scope() as session:
+            session.execute(delete, key)
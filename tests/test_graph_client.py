@@ -0,0 +1,143 @@
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from app.graph_client import GRAPH_BACKOFF_BASE, GRAPH_BATCH_LIMIT, GraphAPIError, GraphClient, retry_after_seconds
+from fake_graph_api import FakeGraphState, make_handler, seed_post_ids
+
+
+@pytest.fixture
+def fake_graph():
+    state = FakeGraphState(container_delay=0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield state, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(base_url, sleeps, timeout=(1, 2), max_retries=3):
+    return GraphClient(base_url=base_url, timeout=timeout, max_retries=max_retries, sleep=sleeps.append)
+
+
+@pytest.mark.parametrize("status, code", [
+    (500, 2),      # 伺服器錯誤
+    (429, None),   # HTTP 速率限制
+    (400, 4),      # App 呼叫上限
+    (400, 17),     # 使用者呼叫上限
+    (400, 32),     # 粉專呼叫上限
+])
+def test_retries_transient_errors_then_succeeds(fake_graph, status, code):
+    state, url = fake_graph
+    state.fail_next(status, code, times=2)
+    sleeps = []
+
+    res = make_client(url, sleeps).post("1000/photos", data={"url": "https://x/img.png", "access_token": "t"})
+
+    assert "post_id" in res
+    assert state.http_requests == 3
+    assert len(sleeps) == 2
+
+
+def test_honours_retry_after(fake_graph):
+    state, url = fake_graph
+    state.fail_next(429, times=1, retry_after=3)
+    sleeps = []
+    make_client(url, sleeps).get("me/accounts")
+    assert sleeps == [3.0]
+
+
+def test_honours_retry_after_http_date(fake_graph):
+    state, url = fake_graph
+    when = datetime.now(timezone.utc) + timedelta(seconds=5)
+    state.fail_next(429, times=1, retry_after=format_datetime(when, usegmt=True))
+    sleeps = []
+    make_client(url, sleeps).get("me/accounts")
+    assert len(sleeps) == 1 and 3 <= sleeps[0] <= 5
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2", 2.0),
+    ("-1", 0.0),
+    ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),   # 已過去的日期：立即重試
+    ("soon", None),
+])
+def test_retry_after_seconds(value, expected):
+    assert retry_after_seconds(value) == expected
+
+
+def test_unparseable_retry_after_falls_back_to_jitter(fake_graph):
+    state, url = fake_graph
+    state.fail_next(503, 2, times=1, retry_after="soon")
+    sleeps = []
+    make_client(url, sleeps).get("me/accounts")
+    assert len(sleeps) == 1 and 0 <= sleeps[0] <= GRAPH_BACKOFF_BASE
+
+
+def test_gives_up_after_max_retries(fake_graph):
+    state, url = fake_graph
+    state.fail_next(500, 2, times=10)
+    with pytest.raises(GraphAPIError) as exc:
+        make_client(url, [], max_retries=2).get("me/accounts")
+    assert exc.value.retryable
+    assert state.http_requests == 3
+
+
+def test_does_not_retry_permanent_errors(fake_graph):
+    state, url = fake_graph
+    state.fail_next(400, 190)  # token 失效
+    with pytest.raises(GraphAPIError) as exc:
+        make_client(url, []).get("me/accounts")
+    assert not exc.value.retryable
+    assert state.http_requests == 1
+
+
+def test_post_read_timeout_is_not_retried(fake_graph):
+    state, url = fake_graph
+    state.delay_next(1.0)
+    with pytest.raises(GraphAPIError) as exc:
+        make_client(url, [], timeout=(1, 0.2)).post("1000/photos", data={"url": "u", "access_token": "t"})
+    assert exc.value.unknown
+    assert not exc.value.retryable
+    assert state.http_requests == 1
+
+
+def test_get_read_timeout_is_retried(fake_graph):
+    state, url = fake_graph
+    state.delay_next(1.0)
+    sleeps = []
+    res = make_client(url, sleeps, timeout=(1, 0.2)).get("me/accounts")
+    assert res["data"]
+    assert state.http_requests == 2
+
+
+def test_connection_failure_is_transient():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    # 埠已關閉：連線被拒，請求從未送達
+    sleeps = []
+    with pytest.raises(GraphAPIError) as exc:
+        make_client(f"http://127.0.0.1:{port}", sleeps, max_retries=1).post("1000/photos", data={})
+    assert exc.value.transient
+    assert exc.value.retryable
+    assert len(sleeps) == 1
+
+
+def test_batch_splits_into_chunks_of_50_and_keeps_order(fake_graph):
+    state, url = fake_graph
+    post_ids = seed_post_ids(120)
+    state.seed_posts(120)
+    sub_requests = [{"method": "GET", "relative_url": f"{pid}?fields=like_count"} for pid in post_ids]
+    sub_requests.append({"method": "GET", "relative_url": "999999?fields=like_count"})
+
+    results = make_client(url, []).batch(sub_requests, access_token="t")
+
+    assert state.batch_sizes == [GRAPH_BATCH_LIMIT, GRAPH_BATCH_LIMIT, 21]
+    assert [r["id"] for r in results[:-1]] == post_ids
+    assert isinstance(results[-1], GraphAPIError) and results[-1].code == 100
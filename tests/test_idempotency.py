@@ -0,0 +1,118 @@
+import io
+import itertools
+import threading
+
+import pytest
+from flask import Flask, jsonify, request
+
+from app import idempotency
+from app.idempotency import IN_FLIGHT_CODE, REPLAYED_HEADER, IdempotencyStore, idempotent
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(idempotency, "idempotency_store", IdempotencyStore())
+    app = Flask(__name__)
+    app.calls = 0
+    app.release = threading.Event()
+    app.release.set()
+    counter = itertools.count(1)
+
+    @app.route("/jobs", methods=["POST"])
+    @idempotent
+    def create_job():
+        app.calls += 1
+        app.release.wait(5)
+        if request.args.get("fail"):
+            return jsonify({"status": "error"}), 500
+        return jsonify({"task_id": next(counter)})
+
+    @app.route("/upload", methods=["POST"])
+    @idempotent
+    def upload():
+        app.calls += 1
+        return jsonify({"size": len(request.files["file"].read())})
+
+    return app.test_client()
+
+
+def post(client, key, body=None, **kwargs):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post("/jobs", json=body or {"drink": "tea"}, headers=headers, **kwargs)
+
+
+def test_retry_with_the_same_key_replays_the_first_response(client):
+    first = post(client, "k1")
+    second = post(client, "k1")
+    assert first.get_json() == second.get_json() == {"task_id": 1}
+    assert second.headers[REPLAYED_HEADER] == "true"
+    assert client.application.calls == 1
+
+
+def test_new_key_or_no_key_runs_again(client):
+    post(client, "k1")
+    assert post(client, "k2").get_json() == {"task_id": 2}
+    assert post(client, None).get_json() == {"task_id": 3}
+    assert client.application.calls == 3
+
+
+def test_reusing_a_key_for_different_content_is_rejected(client):
+    post(client, "k1", {"drink": "tea"})
+    assert post(client, "k1", {"drink": "coffee"}).status_code == 422
+
+
+def test_keys_are_scoped_per_user(client):
+    post(client, "k1")
+    client.set_cookie("access_token", "someone-else")
+    assert post(client, "k1").get_json() == {"task_id": 2}
+
+
+def test_server_error_releases_the_key(client):
+    assert client.post("/jobs?fail=1", json={}, headers={"Idempotency-Key": "k1"}).status_code == 500
+    assert client.post("/jobs?fail=1", json={}, headers={"Idempotency-Key": "k1"}).status_code == 500
+    assert client.application.calls == 2
+
+
+def test_concurrent_duplicate_waits_for_the_first_result(client):
+    app = client.application
+    app.release.clear()
+    results = []
+    first = threading.Thread(target=lambda: results.append(post(app.test_client(), "k1").get_json()))
+    first.start()
+    while app.calls == 0:
+        pass
+    second = threading.Thread(target=lambda: results.append(post(app.test_client(), "k1").get_json()))
+    second.start()
+    app.release.set()
+    first.join()
+    second.join()
+    assert results == [{"task_id": 1}] * 2
+    assert app.calls == 1
+
+
+def test_duplicate_still_in_flight_gets_a_retryable_409(client, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.05)
+    app = client.application
+    app.release.clear()
+    first = threading.Thread(target=lambda: post(app.test_client(), "k1"))
+    first.start()
+    while app.calls == 0:
+        pass
+    second = post(app.test_client(), "k1")
+    app.release.set()
+    first.join()
+    # 前端只對帶 IN_FLIGHT_CODE 的 409 自動重送
+    assert second.status_code == 409
+    assert second.get_json()["code"] == IN_FLIGHT_CODE
+    assert post(client, "k1").get_json() == {"task_id": 1}
+
+
+def test_upload_fingerprint_streams_the_file_and_rewinds(client):
+    def upload(payload):
+        return client.post("/upload", headers={"Idempotency-Key": "u1"},
+                           data={"file": (io.BytesIO(payload), "a.jpg")})
+
+    assert upload(b"x" * 200_000).get_json() == {"size": 200_000}
+    assert upload(b"x" * 200_000).headers[REPLAYED_HEADER] == "true"
+    assert upload(b"y" * 200_000).status_code == 422
+    assert client.application.calls == 1
@@ -0,0 +1,68 @@
+import io
+import random
+
+from PIL import Image as PILImage, ImageDraw
+
+from app.image_dedup import HammingIndex, dhash, hamming, to_signed64, to_unsigned64
+
+
+def product_photo(color=(230, 120, 40), shift=0):
+    img = PILImage.new("RGB", (320, 320), (245, 245, 240))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((110 + shift, 60, 210 + shift, 280), fill=color)
+    draw.ellipse((120 + shift, 40, 200 + shift, 90), fill=(90, 60, 30))
+    return img
+
+
+def recompress(img, size, quality):
+    buf = io.BytesIO()
+    img.resize(size).save(buf, format="JPEG", quality=quality)
+    return PILImage.open(io.BytesIO(buf.getvalue()))
+
+
+def test_dhash_is_stable_under_resize_and_recompression():
+    original = product_photo()
+    assert hamming(dhash(original), dhash(recompress(original, (800, 800), 60))) <= 4
+
+
+def test_dhash_separates_different_photos():
+    assert hamming(dhash(product_photo()), dhash(product_photo(shift=-90))) > 4
+
+
+def test_signed_roundtrip_covers_the_sign_bit():
+    for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        signed = to_signed64(value)
+        assert -(1 << 63) <= signed < (1 << 63)
+        assert to_unsigned64(signed) == value
+
+
+def flip_bits(value, n, rng):
+    for bit in rng.sample(range(64), n):
+        value ^= 1 << bit
+    return value
+
+
+def test_hamming_index_matches_brute_force():
+    rng = random.Random(7)
+    index = HammingIndex(max_distance=4)
+    stored = {}
+    base = [rng.getrandbits(64) for _ in range(50)]
+    for i in range(2000):
+        # 一半是既有雜湊的近似變體，其餘為隨機值
+        value = flip_bits(rng.choice(base), rng.randint(0, 6), rng) if i % 2 else rng.getrandbits(64)
+        stored[i] = value
+        index.add(i, value, payload={"i": i})
+
+    for query in base[:20]:
+        expected = sorted((hamming(v, query), i) for i, v in stored.items() if hamming(v, query) <= 4)
+        found = [(d, i) for d, i, _ in index.search(query)]
+        assert sorted(found) == expected
+        assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+
+def test_hamming_index_respects_a_tighter_query_distance():
+    index = HammingIndex(max_distance=4)
+    index.add("a", 0)
+    index.add("b", 0b111)
+    assert [e for _, e, _ in index.search(0, max_distance=2)] == ["a"]
+    assert len(index) == 2
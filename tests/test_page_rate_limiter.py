@@ -0,0 +1,77 @@
+import threading
+
+from app.publish_dispatcher import PageRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_limiter(per_minute=6, burst=2):
+    clock = FakeClock()
+    return PageRateLimiter(per_minute=per_minute, burst=burst, sleep=clock.sleep, clock=clock), clock
+
+
+def test_burst_passes_without_waiting():
+    limiter, clock = make_limiter(burst=2)
+    assert limiter.acquire("fb:1") == 0
+    assert limiter.acquire("fb:1") == 0
+    assert clock.sleeps == []
+
+
+def test_waits_for_the_refill_after_the_burst():
+    limiter, clock = make_limiter(per_minute=6, burst=2)
+    limiter.acquire("fb:1")
+    limiter.acquire("fb:1")
+    # 每分鐘 6 個 → 每 10 秒補 1 個
+    assert limiter.acquire("fb:1") == 10
+    assert clock.sleeps == [10]
+
+
+def test_reservations_queue_up_instead_of_sharing_a_token():
+    limiter, _ = make_limiter(per_minute=6, burst=1)
+    waits = [limiter._reserve("ig:1") for _ in range(4)]
+    assert waits == [0, 10, 20, 30]
+
+
+def test_tokens_refill_over_time_up_to_the_burst():
+    limiter, clock = make_limiter(per_minute=6, burst=2)
+    limiter.acquire("fb:1")
+    limiter.acquire("fb:1")
+    clock.now += 600  # 閒置很久也只累積到 burst
+    assert [limiter._reserve("fb:1") for _ in range(3)] == [0, 0, 10]
+
+
+def test_pages_are_limited_independently():
+    limiter, clock = make_limiter(burst=1)
+    limiter.acquire("fb:1")
+    assert limiter.acquire("fb:2") == 0
+    assert limiter.acquire("ig:1") == 0
+    assert clock.sleeps == []
+
+
+def test_concurrent_callers_never_overdraw():
+    limiter, _ = make_limiter(per_minute=6, burst=1)
+    waits = []
+    lock = threading.Lock()
+
+    def worker():
+        wait = limiter._reserve("fb:1")
+        with lock:
+            waits.append(wait)
+
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(waits) == [10 * i for i in range(20)]
@@ -0,0 +1,47 @@
+import pytest
+
+from app import platform_credentials
+from app.platform_credentials import PlatformNotConnected, require_connected, resolve_credentials
+
+
+@pytest.fixture
+def tenants(monkeypatch):
+    """以記憶體資料取代 PlatformToken 查詢"""
+    bound = {
+        1: {"fb_page_id": "111", "fb_access_token": "fb-token-1"},
+        2: {},
+    }
+    monkeypatch.setattr(platform_credentials, "_load_tenant_credentials", lambda tenant_id: dict(bound[tenant_id]))
+    monkeypatch.setenv("FB_PAGE_ID", "global-page")
+    monkeypatch.setenv("FB_ACCESS_TOKEN", "global-token")
+    for tenant_id in bound:
+        platform_credentials.invalidate_credentials(tenant_id)
+    yield bound
+    for tenant_id in bound:
+        platform_credentials.invalidate_credentials(tenant_id)
+
+
+def test_env_fallback_is_off_by_default(tenants):
+    assert platform_credentials.ALLOW_ENV_CREDENTIALS is False
+    assert resolve_credentials(2) == {}
+
+
+def test_unbound_tenant_gets_a_not_connected_error(tenants):
+    with pytest.raises(PlatformNotConnected) as exc:
+        require_connected(2, ["fb", "ig"])
+    assert exc.value.platforms == ["fb", "ig"]
+    assert "Facebook" in str(exc.value)
+
+
+def test_only_missing_platforms_are_reported(tenants):
+    assert require_connected(1, ["fb"])["fb_page_id"] == "111"
+    with pytest.raises(PlatformNotConnected) as exc:
+        require_connected(1, ["fb", "ig"])
+    assert exc.value.platforms == ["ig"]
+
+
+def test_env_fallback_is_an_explicit_opt_in(tenants, monkeypatch):
+    monkeypatch.setattr(platform_credentials, "ALLOW_ENV_CREDENTIALS", True)
+    assert resolve_credentials(2)["fb_page_id"] == "global-page"
+    # 已綁定的品牌永遠使用自己的憑證
+    assert resolve_credentials(1)["fb_page_id"] == "111"
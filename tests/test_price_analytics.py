@@ -0,0 +1,161 @@
+import numpy as np
+import pytest
+
+from app.price_analytics import (
+    densify, moving_average, percentile_bands, rolling_volatility, seasonal_index, seasonal_sample, status_matrix,
+)
+
+RNG = np.random.default_rng(7)
+
+
+def random_walk(n):
+    return 100 * np.exp(np.cumsum(RNG.normal(0, 0.03, n)))
+
+
+def test_densify_carries_prices_over_missing_days():
+    days = np.array(["2026-01-01", "2026-01-04", "2026-01-05"], dtype="datetime64[D]")
+    full_days, prices = densify(days, np.array([10.0, 13.0, 12.0]))
+    assert full_days.tolist() == np.arange("2026-01-01", "2026-01-06", dtype="datetime64[D]").tolist()
+    assert prices.tolist() == [10.0, 10.0, 10.0, 13.0, 12.0]
+
+
+def test_moving_average_matches_naive_windows():
+    prices = random_walk(200)
+    ma = moving_average(prices, 30)
+    assert np.isnan(ma[:29]).all()
+    expected = [prices[i - 29:i + 1].mean() for i in range(29, 200)]
+    np.testing.assert_allclose(ma[29:], expected)
+
+
+def test_moving_average_with_short_history_is_all_nan():
+    assert np.isnan(moving_average(np.array([1.0, 2.0]), 7)).all()
+
+
+def test_volatility_matches_naive_annualized_std():
+    prices = random_walk(120)
+    vol = rolling_volatility(prices, 30)
+    returns = np.diff(np.log(prices))
+    assert np.isnan(vol[:30]).all()
+    expected = [returns[i - 30:i].std() * np.sqrt(365) * 100 for i in range(30, 120)]
+    np.testing.assert_allclose(vol[30:], expected, rtol=1e-6)
+
+
+def test_percentile_bands_match_naive_windows():
+    prices = random_walk(100)
+    lower, upper = percentile_bands(prices, window=20)
+    assert np.isnan(lower[:19]).all()
+    for i in range(19, 100):
+        assert lower[i] == pytest.approx(np.percentile(prices[i - 19:i + 1], 20))
+        assert upper[i] == pytest.approx(np.percentile(prices[i - 19:i + 1], 80))
+
+
+def test_percentile_bands_use_all_history_when_shorter_than_the_window():
+    lower, upper = percentile_bands(np.arange(1.0, 11.0), window=365)
+    assert np.isnan(lower[:9]).all()
+    assert (lower[9], upper[9]) == pytest.approx((np.percentile(np.arange(1, 11), 20), np.percentile(np.arange(1, 11), 80)))
+
+
+# ============================================================
+# 季節指數：產季 3 ~ 8 月有成交，其他月份是爬蟲寫入的休市延用價格
+# ============================================================
+IN_SEASON = range(3, 9)
+MONTH_LEVEL = {3: 0.8, 4: 0.95, 5: 1.02, 6: 1.02, 7: 1.1, 8: 1.11}
+
+
+def crawler_series(start, end, scale_by_year=None):
+    """模擬 price_history：產季每天成交（價格每天略有不同），非產季每天延用最後成交價"""
+    days = np.arange(start, end, dtype="datetime64[D]")
+    prices = np.empty(days.size)
+    last = np.nan
+    for i, d in enumerate(days):
+        year = d.astype("datetime64[Y]").astype(int) + 1970
+        month = d.astype("datetime64[M]").astype(int) % 12 + 1
+        if month in IN_SEASON:
+            last = 100 * MONTH_LEVEL[month] * (scale_by_year or {}).get(year, 1.0) * (1 + 0.001 * (i % 5))
+        prices[i] = last
+    keep = ~np.isnan(prices)
+    return days[keep], prices[keep]
+
+
+def test_off_season_months_are_nan_and_rated_zero():
+    days, prices = crawler_series("2024-01-01", "2026-01-01")
+    index = seasonal_index(*seasonal_sample(days, prices))
+    assert np.isnan(index[[0, 1, 8, 9, 10, 11]]).all()
+    assert not np.isnan(index[2:8]).any()
+    assert index[2] < index[4] < index[7]
+    assert status_matrix(index) == [0, 0, 1, 2, 3, 3, 4, 4, 0, 0, 0, 0]
+
+
+def test_carried_prices_do_not_dilute_the_index():
+    days, prices = crawler_series("2024-01-01", "2026-01-01")
+    sample_days, sample_prices = seasonal_sample(days, prices)
+    months = sample_days.astype("datetime64[M]").astype(int) % 12 + 1
+    assert set(months) == set(IN_SEASON)
+    # 產季平均 1.0：延用價格若被計入，8 月的高價會拉高年平均、壓低各月指數
+    assert seasonal_index(sample_days, sample_prices)[7] == pytest.approx(1.11, rel=0.01)
+
+
+def test_incomplete_years_are_excluded():
+    # 2023 年只有下半年、2026 年只到 5 月，且 2026 年價格翻倍
+    complete = seasonal_index(*seasonal_sample(*crawler_series("2024-01-01", "2026-01-01")))
+    days, prices = crawler_series("2023-07-15", "2026-05-20", scale_by_year={2026: 2.0, 2023: 0.5})
+    sample_days, _ = seasonal_sample(days, prices)
+    years = set(sample_days.astype("datetime64[Y]").astype(int) + 1970)
+    assert years == {2024, 2025}
+    np.testing.assert_allclose(seasonal_index(*seasonal_sample(days, prices)), complete, equal_nan=True)
+
+
+def test_no_complete_year_gives_an_empty_sample():
+    days, prices = crawler_series("2025-02-01", "2026-01-31")
+    assert seasonal_sample(days, prices)[0].size == 0
+
+
+def _postgres_engine():
+    from sqlalchemy.exc import OperationalError
+    from core.db import engine
+    try:
+        with engine.connect():
+            return engine
+    except OperationalError:
+        return None
+
+
+@pytest.mark.skipif(_postgres_engine() is None, reason="需要可連線的 Postgres（設定 DB_HOST / DB_PORT）")
+def test_refresh_rollups_writes_each_day_once_and_the_status_matrix():
+    from datetime import datetime
+    from sqlalchemy import text
+    from app.models import Ingredient, PriceHistory, PriceRollup
+    from app.price_analytics import latest_rollups, refresh_rollups, rollup_series
+    from core.db import session_scope
+
+    engine = _postgres_engine()
+    for model in (Ingredient, PriceHistory, PriceRollup):
+        model.__table__.create(engine, checkfirst=True)
+    days, prices = crawler_series("2024-01-01", "2026-03-01")
+    try:
+        with session_scope() as session:
+            ingredient_id = session.execute(
+                text("INSERT INTO ingredient (name) VALUES ('TEST-050') RETURNING id")).scalar()
+            session.execute(text("""
+                INSERT INTO price_history (ingredient_id, market_price, change_rate, recorded_at)
+                SELECT :id, p, 0, d FROM unnest(CAST(:days AS timestamp[]), CAST(:prices AS numeric[])) AS t(d, p)
+            """), {"id": ingredient_id, "days": [datetime.fromisoformat(str(d)) for d in days],
+                   "prices": [round(float(p), 2) for p in prices]})
+        with session_scope() as session:
+            assert refresh_rollups(session, [ingredient_id]) == {ingredient_id: days.size}
+        with session_scope() as session:
+            # 重算時數值未變的列不改寫
+            assert refresh_rollups(session, [ingredient_id]) == {ingredient_id: 0}
+            matrix = session.execute(text("SELECT monthly_status_matrix FROM ingredient WHERE id = :id"),
+                                     {"id": ingredient_id}).scalar()
+            assert matrix == [0, 0, 1, 2, 3, 3, 4, 4, 0, 0, 0, 0]
+            latest = next(r for r in latest_rollups(session) if r["ingredient_id"] == ingredient_id)
+            assert latest["day"] == "2026-02-28"
+            assert len(rollup_series(session, ingredient_id, 30)) == 30
+    finally:
+        with session_scope() as session:
+            session.execute(text("""
+                DELETE FROM price_rollup WHERE ingredient_id IN (SELECT id FROM ingredient WHERE name = 'TEST-050');
+                DELETE FROM price_history WHERE ingredient_id IN (SELECT id FROM ingredient WHERE name = 'TEST-050');
+                DELETE FROM ingredient WHERE name = 'TEST-050';
+            """))
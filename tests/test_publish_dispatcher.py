@@ -0,0 +1,163 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from app import publish_dispatcher as dispatcher_module
+from app.graph_client import GraphAPIError, GraphClient
+from app.publish_dispatcher import ContainerNotReady, PageRateLimiter, PublishDispatcher
+from fake_graph_api import FakeGraphState, make_handler
+
+CREDENTIALS = {"fb_page_id": "p1", "fb_access_token": "t", "ig_id": "ig1", "ig_access_token": "t"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class ScriptedGraph:
+    """GET 依序回傳腳本中的容器狀態（最後一個重複使用）；POST 交給 post(path) 決定結果"""
+
+    def __init__(self, statuses=("FINISHED",), post=None):
+        self.statuses = list(statuses)
+        self._post = post or (lambda path: {"id": "x"})
+
+    def get(self, path, params=None):
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        return {"id": path, "status_code": status}
+
+    def post(self, path, data=None):
+        return self._post(path)
+
+
+def make_dispatcher(graph):
+    clock = FakeClock()
+    limiter = PageRateLimiter(per_minute=6000, burst=100, sleep=clock.sleep, clock=clock)
+    return PublishDispatcher(graph=graph, sleep=clock.sleep, clock=clock, limiter=limiter), clock
+
+
+# ---------------- 容器輪詢 ----------------
+
+def test_returns_as_soon_as_the_container_is_finished():
+    dispatcher, clock = make_dispatcher(ScriptedGraph(["IN_PROGRESS", "IN_PROGRESS", "FINISHED"]))
+    assert dispatcher.wait_for_container("c1", "token") == "FINISHED"
+    assert len(clock.sleeps) == 2
+
+
+@pytest.mark.parametrize("status", ["ERROR", "EXPIRED"])
+def test_failed_container_is_not_retryable(status):
+    dispatcher, _ = make_dispatcher(ScriptedGraph(["IN_PROGRESS", status]))
+    with pytest.raises(ContainerNotReady) as exc:
+        dispatcher.wait_for_container("c1", "token")
+    assert not exc.value.retryable
+    assert status in str(exc.value)
+
+
+def test_polling_times_out_with_a_retryable_error(monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "IG_CONTAINER_TIMEOUT", 30)
+    dispatcher, clock = make_dispatcher(ScriptedGraph(["IN_PROGRESS"]))
+    with pytest.raises(ContainerNotReady) as exc:
+        dispatcher.wait_for_container("c1", "token")
+    assert exc.value.retryable
+    # 最後一次等待會截在期限上，不會超過
+    assert clock.now == pytest.approx(30)
+
+
+def test_backoff_grows_with_bounded_jitter(monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "IG_CONTAINER_TIMEOUT", 1000)
+    dispatcher, clock = make_dispatcher(ScriptedGraph(["IN_PROGRESS"] * 12 + ["FINISHED"]))
+    dispatcher.wait_for_container("c1", "token")
+
+    assert len(clock.sleeps) == 12
+    delay = dispatcher_module.IG_POLL_INITIAL
+    for slept in clock.sleeps:
+        assert 0.8 * delay <= slept <= 1.2 * delay
+        delay = min(delay * dispatcher_module.IG_POLL_FACTOR, dispatcher_module.IG_POLL_MAX)
+    assert max(clock.sleeps) <= dispatcher_module.IG_POLL_MAX * 1.2
+
+
+def test_ig_failure_keeps_the_container_for_a_retry():
+    dispatcher, _ = make_dispatcher(ScriptedGraph(["ERROR"], post=lambda path: {"id": "container-1"}))
+    saved = []
+    result = dispatcher.post_to_ig("ig1", "token", "https://cdn/a.png", "hi", on_container=saved.append)
+    assert saved == ["container-1"]
+    assert result["creation_id"] == "container-1"
+    assert not result["ok"] and not result["retryable"]
+
+
+def test_ig_retry_reuses_the_saved_container():
+    posts = []
+
+    def post(path):
+        posts.append(path)
+        return {"id": "media-1"}
+
+    dispatcher, _ = make_dispatcher(ScriptedGraph(["FINISHED"], post=post))
+    result = dispatcher.post_to_ig("ig1", "token", "https://cdn/a.png", "hi", creation_id="container-1")
+    assert result == {"platform": "ig", "ok": True, "id": "media-1", "creation_id": "container-1"}
+    assert posts == ["ig1/media_publish"]
+
+
+# ---------------- 併行分派 ----------------
+
+def test_sync_runs_platforms_concurrently_and_one_failure_does_not_cancel_the_other():
+    # FB 發文與 IG 建立容器都必須同時抵達 barrier 才能繼續：依序執行時會逾時
+    barrier = threading.Barrier(2, timeout=5)
+
+    def post(path):
+        if path.endswith("media_publish"):
+            return {"id": "media-1"}
+        barrier.wait()
+        if path.endswith("/photos"):
+            raise GraphAPIError("page deleted", code=100)
+        return {"id": "container-1"}
+
+    dispatcher, _ = make_dispatcher(ScriptedGraph(["FINISHED"], post=post))
+    fb, ig = dispatcher.dispatch("sync", "https://cdn/a.png", "hi", CREDENTIALS)
+    assert (fb["platform"], fb["ok"]) == ("fb", False)
+    assert ig == {"platform": "ig", "ok": True, "id": "media-1", "creation_id": "container-1"}
+
+
+def test_unexpected_exception_in_one_leg_is_reported_not_raised():
+    def post(path):
+        if path.endswith("/photos"):
+            raise KeyError("id")
+        return {"id": "x"}
+
+    dispatcher, _ = make_dispatcher(ScriptedGraph(["FINISHED"], post=post))
+    fb, ig = dispatcher.dispatch("sync", "u", "c", CREDENTIALS)
+    assert fb["ok"] is False and fb["unknown"] is True
+    assert ig["ok"] is True
+
+
+# ---------------- 對本地假 Graph API 的完整流程 ----------------
+
+@pytest.fixture
+def fake_graph():
+    state = FakeGraphState(container_delay=0.2)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield state, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_sync_publish_against_the_fake_graph_api(fake_graph, monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "IG_POLL_INITIAL", 0.05)
+    state, url = fake_graph
+    dispatcher = PublishDispatcher(graph=GraphClient(base_url=url, timeout=(1, 2)))
+    fb, ig = dispatcher.dispatch("sync", "https://cdn/a.png", "hi", {
+        "fb_page_id": "1000", "fb_access_token": "t", "ig_id": "2000", "ig_access_token": "t",
+    })
+    assert fb["ok"] and ig["ok"]
+    assert len(state.containers) == 1
@@ -0,0 +1,167 @@
+import pytest
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from app import publish_outbox
+from app.extensions import db
+from app.graph_client import GraphAPIError
+from app.publish_dispatcher import PublishDispatcher
+from app.publish_outbox import OutboxDispatcher
+
+CREDENTIALS = {"fb_page_id": "111", "fb_access_token": "fb-token", "ig_id": "222", "ig_access_token": "ig-token"}
+
+
+class FakeGraph:
+    def __init__(self, error):
+        self.error = error
+
+    def post(self, path, data=None):
+        raise self.error
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    return app
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """記錄結算結果，不寫入資料庫"""
+    dispatcher = OutboxDispatcher()
+    dispatcher.settled = []
+    monkeypatch.setattr(dispatcher, "_mark_sent", lambda job, ext: dispatcher.settled.append(("sent", ext)))
+    monkeypatch.setattr(dispatcher, "_mark_unknown", lambda job, err: dispatcher.settled.append(("unknown", None)))
+    monkeypatch.setattr(dispatcher, "_mark_failed",
+                        lambda job, err, retryable: dispatcher.settled.append(("retry" if retryable else "dead", None)))
+    monkeypatch.setattr(publish_outbox, "resolve_credentials", lambda tenant_id: dict(CREDENTIALS))
+    yield dispatcher
+    dispatcher._pool.shutdown(wait=False)
+
+
+def job(platform):
+    return {"id": 1, "content_id": 7, "tenant_id": 3, "platform": platform,
+            "image_url": "https://cdn.example/a.jpg", "caption": "hi", "provider_ref": None, "attempts": 1}
+
+
+def use_graph(monkeypatch, error):
+    dispatcher = PublishDispatcher(graph=FakeGraph(error), sleep=lambda s: None)
+    monkeypatch.setattr(publish_outbox, "publish_dispatcher", dispatcher)
+
+
+def test_transient_graph_error_is_retried(app, outbox, monkeypatch):
+    use_graph(monkeypatch, GraphAPIError("connection reset", transient=True))
+    outbox._send(app, job("fb"))
+    assert outbox.settled == [("retry", None)]
+
+
+def test_fb_post_timeout_is_marked_unknown(app, outbox, monkeypatch):
+    use_graph(monkeypatch, GraphAPIError("timeout", unknown=True))
+    outbox._send(app, job("fb"))
+    assert outbox.settled == [("unknown", None)]
+
+
+def test_unexpected_fb_exception_is_not_resent(app, outbox, monkeypatch):
+    use_graph(monkeypatch, KeyError("id"))
+    outbox._send(app, job("fb"))
+    assert outbox.settled == [("unknown", None)]
+
+
+def test_unexpected_ig_exception_is_not_retried(app, outbox, monkeypatch):
+    use_graph(monkeypatch, KeyError("id"))
+    outbox._send(app, job("ig"))
+    assert outbox.settled == [("dead", None)]
+
+
+def test_credential_lookup_failure_is_retried(app, outbox, monkeypatch):
+    def broken(tenant_id):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(publish_outbox, "resolve_credentials", broken)
+    outbox._send(app, job("fb"))
+    assert outbox.settled == [("retry", None)]
+
+
+# ============================================================
+# 資料庫：認領
+# ============================================================
+
+def _pg_app():
+    from app.config import Config
+    pg = Flask(__name__)
+    pg.config["SQLALCHEMY_DATABASE_URI"] = Config.SQLALCHEMY_DATABASE_URI
+    db.init_app(pg)
+    try:
+        with pg.app_context():
+            db.session.execute(text("SELECT 1"))
+    except OperationalError:
+        return None
+    return pg
+
+
+PG_APP = _pg_app()
+requires_postgres = pytest.mark.skipif(PG_APP is None, reason="需要可連線的 Postgres（設定 DB_HOST / DB_PORT）")
+
+
+@pytest.fixture
+def queued():
+    """依 next_attempt_at 先後排入 5 筆到期工作與 1 筆未到期，回傳依到期先後的 id"""
+    from app.models import MarketingContent, PublishOutbox, Store, Tenant
+    with PG_APP.app_context():
+        db.metadata.create_all(db.engine, tables=[
+            Tenant.__table__, Store.__table__, MarketingContent.__table__, PublishOutbox.__table__,
+        ])
+        tenant_id = db.session.execute(text(
+            "INSERT INTO tenant (name) VALUES ('TEST-037') RETURNING id")).scalar()
+        store_id = db.session.execute(text(
+            "INSERT INTO store (tenant_id, name) VALUES (:t, 'TEST-037') RETURNING id"), {"t": tenant_id}).scalar()
+        content_id = db.session.execute(text("""
+            INSERT INTO marketing_content (store_id, platform, product_name, final_text)
+            VALUES (:s, 'fb', 'TEST-037', 'x') RETURNING id
+        """), {"s": store_id}).scalar()
+        ids = []
+        for i, offset in enumerate(["-5 minutes", "-4 minutes", "-3 minutes", "-2 minutes", "-1 minutes", "1 hour"]):
+            ids.append(db.session.execute(text("""
+                INSERT INTO publish_outbox (content_id, tenant_id, platform, idempotency_key, image_url, caption,
+                                            status, attempts, next_attempt_at)
+                VALUES (:c, :t, 'fb', :key, 'https://cdn.example/a.jpg', 'x', 'pending', 0,
+                        now() at time zone 'utc' + CAST(:offset AS interval))
+                RETURNING id
+            """), {"c": content_id, "t": tenant_id, "key": f"TEST-037-{content_id}-{i}", "offset": offset}).scalar())
+        db.session.commit()
+        yield ids
+        db.session.rollback()
+        db.session.execute(text("DELETE FROM publish_outbox WHERE tenant_id = :t"), {"t": tenant_id})
+        db.session.execute(text("DELETE FROM marketing_content WHERE id = :c"), {"c": content_id})
+        db.session.execute(text("DELETE FROM store WHERE id = :s"), {"s": store_id})
+        db.session.execute(text("DELETE FROM tenant WHERE id = :t"), {"t": tenant_id})
+        db.session.commit()
+
+
+def pretend_table_is_empty(table):
+    """讓 planner 以為資料表是空的（autovacuum 在佇列清空後會留下這種統計），需要 superuser"""
+    try:
+        db.session.execute(text("UPDATE pg_class SET reltuples = 0, relpages = 1 WHERE relname = :t"), {"t": table})
+        db.session.commit()
+    except ProgrammingError:
+        db.session.rollback()
+        pytest.skip("需要 superuser 才能修改 pg_class 統計")
+
+
+@requires_postgres
+def test_claim_takes_the_oldest_due_jobs_up_to_the_batch_size(queued):
+    dispatcher = OutboxDispatcher(batch_size=2)
+    try:
+        with PG_APP.app_context():
+            pretend_table_is_empty("publish_outbox")
+            first = dispatcher.claim()
+            assert {j["id"] for j in first} == set(queued[:2])
+            assert all(j["attempts"] == 1 for j in first)
+            assert {j["id"] for j in dispatcher.claim()} == set(queued[2:4])
+            assert [j["id"] for j in dispatcher.claim()] == [queued[4]]
+            assert dispatcher.claim() == []
+    finally:
+        dispatcher._pool.shutdown(wait=False)
@@ -0,0 +1,157 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from app import publish_scheduler as scheduler_module
+from app.publish_scheduler import PublishScheduler, slot_datetime, to_utc_naive
+
+
+def test_naive_times_are_taiwan_time():
+    assert to_utc_naive(datetime(2026, 10, 19, 12, 0)) == datetime(2026, 10, 19, 4, 0)
+
+
+def test_aware_times_are_converted_to_naive_utc():
+    assert to_utc_naive(datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)) == datetime(2026, 10, 19, 12, 0)
+    tokyo = datetime(2026, 10, 19, 9, 0, tzinfo=ZoneInfo("Asia/Tokyo"))
+    assert to_utc_naive(tokyo) == datetime(2026, 10, 19, 0, 0)
+
+
+@pytest.mark.parametrize("slot, expected", [
+    ("morning", datetime(2026, 2, 13, 23, 30)),  # 台灣 7:30 為 UTC 前一天
+    ("lunch", datetime(2026, 2, 14, 3, 30)),
+    ("after_school", datetime(2026, 2, 14, 8, 0)),
+    ("evening", datetime(2026, 2, 14, 11, 30)),
+])
+def test_slot_datetime(slot, expected):
+    assert slot_datetime(date(2026, 2, 14), slot) == expected
+
+
+def test_default_slot_is_lunch():
+    assert slot_datetime(date(2026, 2, 14)) == datetime(2026, 2, 14, 3, 30)
+
+
+def test_unknown_slot_is_rejected():
+    with pytest.raises(ValueError, match="未知的時段"):
+        slot_datetime(date(2026, 2, 14), "midnight")
+
+
+# ============================================================
+# 資料庫：認領到期貼文與中斷回收
+# ============================================================
+
+def _pg_app():
+    from app.config import Config
+    from app.extensions import db
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = Config.SQLALCHEMY_DATABASE_URI
+    db.init_app(app)
+    try:
+        with app.app_context():
+            db.session.execute(text("SELECT 1"))
+    except OperationalError:
+        return None
+    return app
+
+
+PG_APP = _pg_app()
+requires_postgres = pytest.mark.skipif(PG_APP is None, reason="需要可連線的 Postgres（設定 DB_HOST / DB_PORT）")
+NOW = datetime(2026, 10, 19, 4, 0)
+
+
+@pytest.fixture
+def posts():
+    """在 NOW 前後建立排程貼文，回傳 {名稱: id}"""
+    from app.extensions import db
+    from app.models import HolidayCalendar, ScheduledPost, Store, Tenant
+    with PG_APP.app_context():
+        db.metadata.create_all(db.engine, tables=[
+            Tenant.__table__, Store.__table__, HolidayCalendar.__table__, ScheduledPost.__table__,
+        ])
+        tenant_id = db.session.execute(text(
+            "INSERT INTO tenant (name) VALUES ('TEST-036') RETURNING id")).scalar()
+        store_id = db.session.execute(text(
+            "INSERT INTO store (tenant_id, name) VALUES (:t, 'TEST-036') RETURNING id"), {"t": tenant_id}).scalar()
+        rows = {
+            "due-early": ("pending", NOW - timedelta(hours=2), None),
+            "due-late": ("pending", NOW - timedelta(minutes=1), None),
+            "due-now": ("pending", NOW, None),
+            "future": ("pending", NOW + timedelta(minutes=1), None),
+            "cancelled": ("cancelled", NOW - timedelta(hours=1), None),
+            "stuck": ("publishing", NOW - timedelta(hours=1), NOW - timedelta(seconds=scheduler_module.SCHEDULER_STALE_SECONDS + 1)),
+            "in-progress": ("publishing", NOW - timedelta(hours=1), NOW - timedelta(seconds=10)),
+        }
+        ids = {}
+        for name, (status, scheduled_at, claimed_at) in rows.items():
+            ids[name] = db.session.execute(text("""
+                INSERT INTO scheduled_post (tenant_id, store_id, product_name, caption, image_key, platform,
+                                            scheduled_at, status, claimed_at)
+                VALUES (:t, :s, :name, 'x', 'posts/a.png', 'fb', :at, :status, :claimed)
+                RETURNING id
+            """), {"t": tenant_id, "s": store_id, "name": name, "at": scheduled_at,
+                   "status": status, "claimed": claimed_at}).scalar()
+        db.session.commit()
+        yield ids
+        db.session.rollback()
+        db.session.execute(text("DELETE FROM scheduled_post WHERE tenant_id = :t"), {"t": tenant_id})
+        db.session.execute(text("DELETE FROM store WHERE id = :s"), {"s": store_id})
+        db.session.execute(text("DELETE FROM tenant WHERE id = :t"), {"t": tenant_id})
+        db.session.commit()
+
+
+def statuses(ids):
+    from app.extensions import db
+    rows = db.session.execute(text("SELECT id, status FROM scheduled_post WHERE id = ANY(:ids)"),
+                              {"ids": list(ids.values())}).all()
+    by_id = dict(rows)
+    return {name: by_id[i] for name, i in ids.items()}
+
+
+@requires_postgres
+def test_claim_due_takes_only_due_pending_posts_in_batches(posts):
+    with PG_APP.app_context():
+        scheduler = PublishScheduler(batch_size=2)
+        first = scheduler.claim_due(now=NOW)
+        # 最早到期的先處理（RETURNING 的順序不保證，只比對集合）
+        assert {p["product_name"] for p in first} == {"due-early", "due-late"}
+        second = scheduler.claim_due(now=NOW)
+        assert [p["product_name"] for p in second] == ["due-now"]
+        assert scheduler.claim_due(now=NOW) == []
+
+        current = statuses(posts)
+        assert [n for n, s in current.items() if s == "publishing"] == ["due-early", "due-late", "due-now", "stuck", "in-progress"]
+        assert (current["future"], current["cancelled"]) == ("pending", "cancelled")
+
+
+def pretend_table_is_empty(table):
+    """讓 planner 以為資料表是空的（autovacuum 在測試清空資料後會留下這種統計），需要 superuser"""
+    from app.extensions import db
+    try:
+        db.session.execute(text("UPDATE pg_class SET reltuples = 0, relpages = 1 WHERE relname = :t"), {"t": table})
+        db.session.commit()
+    except ProgrammingError:
+        db.session.rollback()
+        pytest.skip("需要 superuser 才能修改 pg_class 統計")
+
+
+@requires_postgres
+def test_claim_due_respects_the_batch_size_with_empty_table_statistics(posts):
+    with PG_APP.app_context():
+        pretend_table_is_empty("scheduled_post")
+        claimed = PublishScheduler(batch_size=2).claim_due(now=NOW)
+        assert {p["product_name"] for p in claimed} == {"due-early", "due-late"}
+
+
+@requires_postgres
+def test_expire_stale_puts_interrupted_posts_back(posts):
+    with PG_APP.app_context():
+        PublishScheduler().expire_stale(now=NOW)
+        current = statuses(posts)
+        assert current["stuck"] == "pending"
+        assert current["in-progress"] == "publishing"
+        # 放回後由下一輪認領
+        claimed = PublishScheduler().claim_due(now=NOW)
+        assert "stuck" in {p["product_name"] for p in claimed}
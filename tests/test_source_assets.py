@@ -0,0 +1,66 @@
+import pytest
+
+pytest.importorskip("google.genai")
+from PIL import Image as PILImage
+
+from app.source_assets import InlineSourceAsset, UploadedSourceAsset, prepare_source_asset, serialize_image
+
+
+class FakeFiles:
+    """Files API 的離線替身：記錄上傳 / 刪除次數"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.uploads = []
+        self.deleted = []
+
+    def upload(self, file, config):
+        if self.fail:
+            raise RuntimeError("quota exceeded")
+        self.uploads.append(file.read())
+
+        class File:
+            name = f"files/{len(self.uploads)}"
+            uri = f"https://generativelanguage.example/{name}"
+            mime_type = "image/png"
+        return File()
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+
+class FakeClient:
+    def __init__(self, fail=False):
+        self.files = FakeFiles(fail)
+
+
+@pytest.fixture
+def image():
+    return PILImage.new("RGB", (32, 32), (200, 40, 40))
+
+
+def test_inline_mode_makes_no_calls(image):
+    client = FakeClient()
+    asset = prepare_source_asset(client, image, mode="inline")
+    assert isinstance(asset, InlineSourceAsset)
+    assert client.files.uploads == []
+    assert asset.as_part().inline_data.data == serialize_image(image)
+
+
+def test_files_mode_uploads_once_and_shares_the_part(image):
+    client = FakeClient()
+    asset = prepare_source_asset(client, image, mode="files")
+    parts = [asset.as_part() for _ in range(3)]
+    assert isinstance(asset, UploadedSourceAsset)
+    assert client.files.uploads == [serialize_image(image)]
+    assert all(p is parts[0] for p in parts)
+    assert parts[0].file_data.file_uri.endswith("files/1")
+
+    asset.release()
+    assert client.files.deleted == ["files/1"]
+
+
+def test_upload_failure_falls_back_to_inline(image):
+    asset = prepare_source_asset(FakeClient(fail=True), image, mode="files")
+    assert isinstance(asset, InlineSourceAsset)
+    assert asset.as_part().inline_data.data == serialize_image(image)
@@ -0,0 +1,92 @@
+import hashlib
+import io
+
+import pytest
+from PIL import Image as PILImage
+
+from app.storage import ContentAddressedStore, InvalidUpload, LocalBackend, sniff_image_extension
+
+
+def png_bytes():
+    buf = io.BytesIO()
+    PILImage.new("RGB", (8, 8), (10, 200, 90)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def stores(tmp_path):
+    backend = LocalBackend(root=str(tmp_path), secret="test", public_url="http://testserver")
+    return (
+        ContentAddressedStore("upload-staging", backend=backend),
+        ContentAddressedStore("public-posts", public=True, backend=backend),
+    )
+
+
+def stage(upload_store, data, ext="png"):
+    key = upload_store.staging_key(ext)
+    upload_store.ensure_bucket()
+    upload_store.backend.put(upload_store.bucket, key, io.BytesIO(data), len(data), "text/html")
+    return key
+
+
+def test_sniffs_supported_formats_only():
+    assert sniff_image_extension(png_bytes()) == "png"
+    assert sniff_image_extension(b"\xff\xd8\xff\xe0\x00\x10JFIF") == "jpg"
+    assert sniff_image_extension(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "webp"
+    assert sniff_image_extension(b"GIF89a\x01\x00") == "gif"
+    assert sniff_image_extension(b"<html><script>") is None
+
+
+def test_adopt_moves_a_valid_image_to_the_public_store(stores):
+    upload_store, post_store = stores
+    data = png_bytes()
+    # 用戶端宣告 .jpg，實際內容為 PNG：副檔名依檔頭決定
+    staging_key = stage(upload_store, data, ext="jpg")
+
+    key, uploaded = post_store.adopt(upload_store, staging_key, prefix="posts")
+
+    assert key == f"posts/{hashlib.sha256(data).hexdigest()}.png"
+    assert uploaded
+    assert b"".join(post_store.open(key)) == data
+    assert not upload_store.exists(staging_key)
+
+
+def test_adopt_skips_the_copy_for_known_content(stores):
+    upload_store, post_store = stores
+    first, _ = post_store.adopt(upload_store, stage(upload_store, png_bytes()), prefix="posts")
+    second, uploaded = post_store.adopt(upload_store, stage(upload_store, png_bytes()), prefix="posts")
+    assert second == first
+    assert not uploaded
+
+
+@pytest.mark.parametrize("data, max_bytes", [
+    (b"<html><script>alert(1)</script></html>", 1024),
+    (b"", 1024),
+    (png_bytes(), 16),
+])
+def test_adopt_rejects_non_images_and_oversized_uploads(stores, tmp_path, data, max_bytes):
+    upload_store, post_store = stores
+    staging_key = stage(upload_store, data)
+
+    with pytest.raises(InvalidUpload):
+        post_store.adopt(upload_store, staging_key, prefix="posts", max_bytes=max_bytes)
+
+    assert not upload_store.exists(staging_key)
+    assert not [p for p in (tmp_path / "public-posts").rglob("*") if p.is_file()]
+
+
+def test_presigned_get_signs_the_requested_cache_control():
+    from urllib.parse import parse_qs, urlparse
+
+    from app.storage import IMMUTABLE_CACHE_CONTROL, PRIVATE_CACHE_CONTROL, MinioBackend
+
+    backend = MinioBackend(endpoint="minio:9000", access_key="k", secret_key="s",
+                           public_url="https://cdn.example.com")
+    store = ContentAddressedStore("generated-variants", backend=backend)
+
+    def signed(url):
+        return parse_qs(urlparse(url).query)["response-cache-control"]
+
+    # 生成方案圖需登入才能讀取：簽入的 Cache-Control 不可是 public
+    assert signed(store.presigned_get("variants/a.png", cache_control=PRIVATE_CACHE_CONTROL)) == [PRIVATE_CACHE_CONTROL]
+    assert signed(store.presigned_get("posts/a.png")) == [IMMUTABLE_CACHE_CONTROL]
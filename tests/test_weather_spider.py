@@ -0,0 +1,129 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from spiders import weather_spider
+from spiders.weather_spider import WeatherSpider
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "open_meteo_forecast.json")
+NOW = datetime(2026, 10, 19, 6, 0)
+
+
+class FakeResponse:
+    def __init__(self, payload, status=200):
+        self.payload = payload
+        self.status_code = status
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return self.payload
+
+
+class FakeClient:
+    """依請求的座標清單，從錄製的多城市回應中取出對應的項目"""
+
+    def __init__(self, spider, recorded, fail_batches=()):
+        self.by_coords = {
+            (str(c["lat"]), str(c["lon"])): item for c, item in zip(spider.cities.values(), recorded)
+        }
+        self.fail_batches = set(fail_batches)
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None, cache=False):
+        self.calls.append(params)
+        if len(self.calls) - 1 in self.fail_batches:
+            return FakeResponse({"error": True, "reason": "Internal error"}, status=500)
+        coords = zip(params["latitude"].split(","), params["longitude"].split(","))
+        items = [self.by_coords[c] for c in coords]
+        # Open-Meteo 只有一組座標時回傳單一物件
+        return FakeResponse(items[0] if len(items) == 1 else items)
+
+
+@pytest.fixture
+def recorded():
+    with open(FIXTURE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def spider():
+    return WeatherSpider()
+
+
+def test_all_cities_are_fetched_in_one_request(spider, recorded):
+    client = FakeClient(spider, recorded)
+    forecasts = spider.fetch_forecasts(client)
+    assert len(client.calls) == 1
+    assert list(forecasts) == list(spider.cities)
+    assert forecasts["台北市"] == recorded[1]["daily"]
+    assert client.calls[0]["daily"] == weather_spider.DAILY_FIELDS
+
+
+def test_failed_batch_is_skipped(spider, recorded, monkeypatch):
+    monkeypatch.setattr(weather_spider, "WEATHER_CITIES_PER_REQUEST", 10)
+    client = FakeClient(spider, recorded, fail_batches={1})
+    forecasts = spider.fetch_forecasts(client)
+    assert len(client.calls) == 3
+    names = list(spider.cities)
+    assert list(forecasts) == names[:10] + names[20:]
+
+
+def test_single_coordinate_response_is_an_object(spider, recorded, monkeypatch):
+    monkeypatch.setattr(weather_spider, "WEATHER_CITIES_PER_REQUEST", 21)
+    forecasts = spider.fetch_forecasts(FakeClient(spider, recorded))
+    assert forecasts["連江縣"] == recorded[-1]["daily"]
+
+
+def test_build_rows_skips_missing_values(spider, recorded):
+    forecasts = spider.fetch_forecasts(FakeClient(spider, recorded))
+    rows = spider.build_rows(forecasts, now=NOW)
+    # 錄製資料最後一天沒有降雨機率
+    assert len(rows) == len(spider.cities) * 6
+    assert all(r["forecast_date"] != "2026-10-25" for r in rows)
+
+    first = rows[0]
+    assert first == {
+        "city_name": "基隆市", "forecast_date": "2026-10-19",
+        "min_temp": 24, "max_temp": 28, "rain_prob": 45,
+        "condition": "Cloudy", "recommendation": "舒適",
+        "updated_at": NOW,
+    }
+    rainy = next(r for r in rows if r["city_name"] == "基隆市" and r["forecast_date"] == "2026-10-21")
+    assert (rainy["condition"], rainy["recommendation"]) == ("Rainy", "帶傘、舒適")
+
+
+class CapturingSession:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+
+
+def test_upsert_is_one_batched_statement(spider, recorded):
+    rows = spider.build_rows(spider.fetch_forecasts(FakeClient(spider, recorded)), now=NOW)
+    session = CapturingSession()
+    assert spider.upsert_rows(session, rows) == len(rows)
+    assert len(session.statements) == 1
+
+    compiled = session.statements[0].compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+    assert "ON CONFLICT (city_name, forecast_date) DO UPDATE SET" in sql
+    for column in weather_spider.UPSERT_COLUMNS:
+        assert f"{column} = excluded.{column}" in sql
+    params = compiled.params
+    written = [(params[f"city_name_m{i}"], params[f"forecast_date_m{i}"], params[f"max_temp_m{i}"])
+               for i in range(len(rows))]
+    assert written == [(r["city_name"], r["forecast_date"], r["max_temp"]) for r in rows]
+
+
+def test_nothing_to_write(spider):
+    session = CapturingSession()
+    assert spider.upsert_rows(session, []) == 0
+    assert session.statements == []